@@ -35,10 +35,14 @@ INSTALLED_APPS = [
 
 ASGI_APPLICATION = "projectsite.asgi.application"
 
-# Channels layer (Redis backend)
+# Channels layer: in-memory within a process, Postgres LISTEN/NOTIFY between
+# ASGI worker processes (see realsproj.channel_layers)
 CHANNEL_LAYERS = {
     "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer"
+        "BACKEND": "realsproj.channel_layers.PostgresChannelLayer",
+        "CONFIG": {
+            "database": "default",
+        },
     }
 }
 
@@ -181,6 +185,14 @@ CACHES = {
     }
 }
 
+# User activity heartbeats are written to user_activity when the stored
+# value is older than this many seconds
+ACTIVITY_FLUSH_INTERVAL = 60
+
+# Order numbers are reserved from the database sequence this many at a time
+# per process (unused ones are skipped when the process exits)
+ORDER_NUMBER_BLOCK_SIZE = 10
+
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
 EMAIL_HOST = "smtp.gmail.com"
 EMAIL_PORT = 587
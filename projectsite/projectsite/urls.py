@@ -38,6 +38,7 @@ urlpatterns = [
     path('products/<pk>/delete', a.ProductsDeleteView.as_view(), name='product-delete'),
     path("products/scan-phone/", a.product_scan_phone, name="product-scan-phone"),
     path("api/check-barcode/", a.check_barcode_availability, name="check-barcode"),
+    path("api/barcode-lookup/", a.barcode_lookup, name="barcode-lookup"),
     path('price-history/', a.PriceHistoryList.as_view(), name='price-history'),
 
     path('rawmaterials/', a.RawMaterialsList.as_view(), name='rawmaterials-list'),
@@ -96,6 +97,7 @@ urlpatterns = [
 
     path('product-inventory/', a.ProductInventoryList.as_view(), name='product-inventory'),
     path('best-seller-products/', a.BestSellerProductsView.as_view(), name='best-seller-products'),
+    path('production-capacity/', a.ProductionCapacityView.as_view(), name='production-capacity'),
 
     path('rawmatbatch/', a.RawMaterialBatchList.as_view(), name='rawmaterial-batch'),
     path('rawmatbatch/add', a.BulkRawMaterialBatchCreateView.as_view(), name='rawmaterial-batch-add'),
@@ -169,6 +171,8 @@ urlpatterns = [
     path('withdrawals/bulk-delete/', a.withdrawals_bulk_delete, name='withdrawals-bulk-delete'),
     path('withdrawals/bulk-archive/', a.withdrawals_bulk_archive, name='withdrawals-bulk-archive'),
     path("api/get-stock/", a.get_stock, name="get-stock"),
+    path("api/capacity/", a.capacity_api, name="capacity-api"),
+    path("api/products/search/", a.product_search_api, name="product-search-api"),
 
     path("login/", a.login_view, name="login"),
 
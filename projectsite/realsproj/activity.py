@@ -0,0 +1,84 @@
+"""
+Write-through user activity tracking with a staleness bound.
+
+Every authenticated request is a heartbeat. Instead of writing
+``user_activity.last_activity`` on each one, a heartbeat is written only
+when the stored value is more than ``ACTIVITY_FLUSH_INTERVAL`` seconds old:
+the UPDATE is conditional on the stored value, so when several worker
+processes see the same user only one of them writes per interval, and each
+process skips the query entirely while its own last write is that recent.
+
+The stored value is therefore never more than one interval behind the
+user's latest request, whichever worker served it, so "active in the last
+5 minutes" can be answered from the database alone. Readers in the same
+process also merge in the newest heartbeat they have seen
+(``merged_last_activity``).
+"""
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from realsproj.models import UserActivity
+
+
+_lock = threading.Lock()
+_seen = {}       # {user_id: newest heartbeat seen by this process}
+_written = {}    # {user_id: newest heartbeat this process stored}
+
+
+def flush_interval():
+    return getattr(settings, "ACTIVITY_FLUSH_INTERVAL", 60)
+
+
+def touch(user_id, now=None):
+    """Record a heartbeat; writes to the database only when the stored one is stale."""
+    now = now or timezone.now()
+    stale_before = now - timedelta(seconds=flush_interval())
+    with _lock:
+        if _seen.get(user_id) is None or now > _seen[user_id]:
+            _seen[user_id] = now
+        written = _written.get(user_id)
+        if written is not None and written >= stale_before:
+            return
+        _written[user_id] = now
+    try:
+        _write(user_id, now, stale_before)
+    except Exception as e:
+        # Try again on the next heartbeat.
+        with _lock:
+            if _written.get(user_id) == now:
+                del _written[user_id]
+        print(f"❌ Error recording user activity: {str(e)}")
+
+
+def _write(user_id, now, stale_before):
+    updated = (
+        UserActivity.objects.filter(user_id=user_id)
+        .filter(Q(last_activity__isnull=True) | Q(last_activity__lt=stale_before))
+        .update(last_activity=now)
+    )
+    if not updated:
+        # Either another worker stored a recent heartbeat, or the user has no row yet.
+        UserActivity.objects.bulk_create(
+            [UserActivity(user_id=user_id, last_activity=now)], ignore_conflicts=True
+        )
+
+
+def last_seen(user_id):
+    """Newest heartbeat of a user seen by this process, or None."""
+    with _lock:
+        return _seen.get(user_id)
+
+
+def merged_last_activity(activity):
+    """``activity.last_activity`` merged with any newer heartbeat seen here."""
+    stored = activity.last_activity
+    seen = last_seen(activity.user_id)
+    if seen is None:
+        return stored
+    if stored is None or seen > stored:
+        return seen
+    return stored
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Expenses, HistoryLog, HistoryLogTypes, ProductBatches, ProductInventory, ProductRecipes, ProductTypes, ProductVariants, Products, RawMaterialBatches, RawMaterialInventory, RawMaterials, Sales, SizeUnits, Sizes, SrpPrices, UnitPrices, StockChanges, Notifications, Withdrawals, SalesSummary, ExpensesSummary
+from .models import Expenses, HistoryLog, HistoryLogTypes, ProductBatches, ProductInventory, ProductRecipes, ProductTypes, ProductVariants, Products, RawMaterialBatches, RawMaterialInventory, RawMaterials, Sales, SizeUnits, Sizes, SrpPrices, UnitPrices, StockChanges, Notifications, Withdrawals, SalesSummary, ExpensesSummary, ScheduledJobRun
 # Register your models here.
 
 admin.site.register(Expenses)
@@ -30,4 +30,11 @@ class ProductRecipeInline(admin.TabularInline):
 
 @admin.register(Products)
 class ProductsAdmin(admin.ModelAdmin):
-    inlines = [ProductRecipeInline]
\ No newline at end of file
+    inlines = [ProductRecipeInline]
+
+
+@admin.register(ScheduledJobRun)
+class ScheduledJobRunAdmin(admin.ModelAdmin):
+    list_display = ("job_name", "scheduled_for", "status", "duration_seconds", "rows", "host")
+    list_filter = ("job_name", "status")
+    ordering = ("-started_at",)
@@ -0,0 +1,88 @@
+"""
+Time-bucketed sales/expenses aggregation used by the dashboard chart APIs.
+
+By default the per-day rows come from the daily ledger rollup (see
+realsproj.ledger); explicit Sales/Expenses querysets are grouped by day in
+SQL instead. The daily rows are then folded into every requested bucket
+size (day/week/month/year) in a single pass over dict-indexed slots, so no
+series ever needs a nested lookup.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Sum
+
+from realsproj import ledger
+
+
+BUCKET_CHOICES = ("day", "week", "month", "year")
+
+BUCKET_LABEL_FORMATS = {
+    "day": "%Y-%m-%d",
+    "week": "%Y-%m-%d",  # weeks are labelled by their Monday
+    "month": "%Y-%m",
+    "year": "%Y",
+}
+
+
+def bucket_start(day, bucket):
+    """Return the first date of the bucket that ``day`` falls in."""
+    if bucket == "day":
+        return day
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    if bucket == "year":
+        return day.replace(month=1, day=1)
+    raise ValueError(f"Unknown bucket size: {bucket}")
+
+
+def daily_totals(queryset, start=None, end=None):
+    """Return ``(date, total)`` rows of ``amount`` grouped by ``date``."""
+    if start:
+        queryset = queryset.filter(date__gte=start)
+    if end:
+        queryset = queryset.filter(date__lte=end)
+    return queryset.order_by().values_list("date").annotate(total=Sum("amount"))
+
+
+def sales_expenses_series(buckets=("month",), start=None, end=None, sales_qs=None, expenses_qs=None):
+    """
+    Build aligned sales/expenses series for each bucket size in ``buckets``.
+
+    Returns ``{bucket: {"labels": [...], "sales": [...], "expenses": [...]}}``
+    where all three lists share the same index. ``start``/``end`` are
+    inclusive date bounds.
+    """
+    for bucket in buckets:
+        if bucket not in BUCKET_CHOICES:
+            raise ValueError(f"Unknown bucket size: {bucket}")
+
+    sources = (
+        sales_qs if sales_qs is not None else ledger.rollup(ledger.SALES),
+        expenses_qs if expenses_qs is not None else ledger.rollup(ledger.EXPENSES),
+    )
+
+    slots = {bucket: {} for bucket in buckets}
+    for column, queryset in enumerate(sources):
+        for day, total in daily_totals(queryset, start, end):
+            if day is None:
+                continue
+            for bucket in buckets:
+                key = bucket_start(day, bucket)
+                slot = slots[bucket].get(key)
+                if slot is None:
+                    slot = slots[bucket][key] = [Decimal(0), Decimal(0)]
+                slot[column] += total or 0
+
+    series = {}
+    for bucket, bucket_slots in slots.items():
+        keys = sorted(bucket_slots)
+        label_format = BUCKET_LABEL_FORMATS[bucket]
+        series[bucket] = {
+            "labels": [key.strftime(label_format) for key in keys],
+            "sales": [float(bucket_slots[key][0]) for key in keys],
+            "expenses": [float(bucket_slots[key][1]) for key in keys],
+        }
+    return series
@@ -0,0 +1,341 @@
+"""
+Streaming database backups.
+
+A backup is a Django JSON fixture (``manage.py loaddata`` can read it)
+written one object per line. Each model is read in primary-key order, one
+chunk at a time, and serialized as it goes, so memory use does not grow
+with the database. The output can be gzip- or zstd-compressed; zstd needs
+the optional ``zstandard`` package.
+
+While a backup is written a manifest is filled in with each model's row
+count and a SHA-256 of its serialized lines. ``manage.py backup_database``
+writes it next to the backup; ``manage.py restore_backup`` checks a backup
+against it before (or instead of) loading it.
+"""
+import gzip
+import hashlib
+import io
+import json
+import zlib
+
+from django.apps import apps
+from django.core import serializers
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+
+from realsproj.models import ExpensesSummary, SalesSummary
+
+
+CHUNK_SIZE = 1000
+BLOCK_SIZE = 256 * 1024
+
+COMPRESSIONS = ("gzip", "zstd", "none")
+
+EXTENSIONS = {
+    "gzip": ".json.gz",
+    "zstd": ".json.zst",
+    "none": ".json",
+}
+
+# Database views computed from other tables; they are not backed up or restored.
+DERIVED_MODELS = (SalesSummary, ExpensesSummary)
+
+CONTENT_TYPES = {
+    "gzip": "application/gzip",
+    "zstd": "application/zstd",
+    "none": "application/json",
+}
+
+
+class BackupError(Exception):
+    pass
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise BackupError("zstd compression needs the 'zstandard' package (pip install zstandard)")
+    return zstandard
+
+
+def check_compression(compression):
+    """Raise BackupError if ``compression`` is unknown or unavailable here."""
+    if compression not in COMPRESSIONS:
+        raise BackupError(f"Unknown compression: {compression}")
+    if compression == "zstd":
+        _zstandard()
+
+
+# ----------------------------------------------------------------------
+# Models
+# ----------------------------------------------------------------------
+def backup_models():
+    """
+    Every realsproj model (managed or not) except the ``DERIVED_MODELS``
+    views, with foreign key targets before the models that reference them
+    so a restore can insert in file order.
+    """
+    models = [
+        model for model in apps.get_app_config("realsproj").get_models()
+        if model not in DERIVED_MODELS
+    ]
+    included = set(models)
+    ordered, seen = [], set()
+
+    def visit(model, path=()):
+        if model in seen or model in path:
+            return
+        for field in model._meta.concrete_fields:
+            target = field.related_model
+            if field.is_relation and target in included and target is not model:
+                visit(target, path + (model,))
+        seen.add(model)
+        ordered.append(model)
+
+    for model in models:
+        visit(model)
+    return ordered
+
+
+def iter_model_lines(model, chunk_size=CHUNK_SIZE):
+    """Yield one serialized JSON line per row of ``model``, in pk order."""
+    manager = model._default_manager
+    last_pk = None
+    while True:
+        qs = manager.order_by("pk")
+        if last_pk is not None:
+            qs = qs.filter(pk__gt=last_pk)
+        chunk = list(qs[:chunk_size])
+        if not chunk:
+            return
+        for obj in serializers.serialize("python", chunk):
+            yield json.dumps(obj, cls=DjangoJSONEncoder, ensure_ascii=False, sort_keys=True)
+        if len(chunk) < chunk_size:
+            return
+        last_pk = chunk[-1].pk
+
+
+def new_manifest(compression, chunk_size=CHUNK_SIZE):
+    return {
+        "created_at": timezone.now().isoformat(),
+        "compression": compression,
+        "chunk_size": chunk_size,
+        "models": [],
+        "skipped": [],
+        "total": 0,
+    }
+
+
+# ----------------------------------------------------------------------
+# Writing
+# ----------------------------------------------------------------------
+def iter_backup(manifest, chunk_size=CHUNK_SIZE):
+    """
+    Yield the backup as text pieces, filling ``manifest`` along the way.
+
+    A model whose table cannot be read is skipped (listed under
+    ``manifest["skipped"]`` with the error instead of ``manifest["models"]``),
+    as long as it fails before any of its rows were written.
+    """
+    yield "[\n"
+    first = True
+    for model in backup_models():
+        label = model._meta.label_lower
+        digest = hashlib.sha256()
+        count = 0
+        try:
+            for line in iter_model_lines(model, chunk_size):
+                digest.update(line.encode("utf-8"))
+                digest.update(b"\n")
+                count += 1
+                yield ("" if first else ",\n") + line
+                first = False
+        except Exception as e:
+            if count:
+                raise
+            manifest["skipped"].append({"model": label, "error": str(e)})
+            continue
+        manifest["models"].append({"model": label, "count": count, "sha256": digest.hexdigest()})
+        manifest["total"] += count
+    yield "\n]\n"
+
+
+def compress(pieces, compression):
+    """
+    Encode text pieces and compress them on the fly; yields bytes in blocks
+    of about ``BLOCK_SIZE`` input bytes.
+    """
+    if compression == "none":
+        compressor = None
+        flush = bytes
+    elif compression == "gzip":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        flush = compressor.flush
+    elif compression == "zstd":
+        compressor = _zstandard().ZstdCompressor().compressobj()
+        flush = compressor.flush
+    else:
+        raise BackupError(f"Unknown compression: {compression}")
+
+    encode = compressor.compress if compressor is not None else bytes
+    buffer = []
+    size = 0
+    for piece in pieces:
+        data = piece.encode("utf-8")
+        buffer.append(data)
+        size += len(data)
+        if size >= BLOCK_SIZE:
+            out = encode(b"".join(buffer))
+            buffer, size = [], 0
+            if out:
+                yield out
+    out = encode(b"".join(buffer)) + flush()
+    if out:
+        yield out
+
+
+def write_backup(path, compression="gzip", chunk_size=CHUNK_SIZE):
+    """Write a backup file to ``path`` and return its manifest."""
+    manifest = new_manifest(compression, chunk_size)
+    with open(path, "wb") as out:
+        for data in compress(iter_backup(manifest, chunk_size), compression):
+            out.write(data)
+    return manifest
+
+
+# ----------------------------------------------------------------------
+# Reading
+# ----------------------------------------------------------------------
+def compression_for(path):
+    path = str(path)
+    if path.endswith(".gz"):
+        return "gzip"
+    if path.endswith(".zst"):
+        return "zstd"
+    return "none"
+
+
+def open_backup(path):
+    """Open a backup file for reading as text, decompressing as needed."""
+    compression = compression_for(path)
+    if compression == "gzip":
+        return gzip.open(path, "rt", encoding="utf-8")
+    if compression == "zstd":
+        raw = open(path, "rb")
+        reader = _zstandard().ZstdDecompressor().stream_reader(raw, closefd=True)
+        return io.TextIOWrapper(reader, encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def iter_backup_lines(path):
+    """Yield each object line of a backup file (without separators)."""
+    with open_backup(path) as f:
+        for line in f:
+            line = line.strip().lstrip("\ufeff")
+            if line in ("[", "]", ""):
+                continue
+            yield line[:-1] if line.endswith(",") else line
+
+
+def scan(path):
+    """Return ``{model_label: {"count", "sha256"}}`` computed from a backup file."""
+    found = {}
+    for line in iter_backup_lines(path):
+        label = json.loads(line)["model"]
+        entry = found.get(label)
+        if entry is None:
+            entry = found[label] = {"count": 0, "digest": hashlib.sha256()}
+        entry["count"] += 1
+        entry["digest"].update(line.encode("utf-8"))
+        entry["digest"].update(b"\n")
+    return {
+        label: {"count": entry["count"], "sha256": entry["digest"].hexdigest()}
+        for label, entry in found.items()
+    }
+
+
+def verify(path, manifest):
+    """
+    Compare a backup file against its manifest.
+
+    Returns a list of ``(model, problem)`` tuples; empty means it matches.
+    """
+    found = scan(path)
+    problems = []
+    for entry in manifest.get("models", []):
+        label = entry["model"]
+        actual = found.pop(label, {"count": 0, "sha256": hashlib.sha256().hexdigest()})
+        if actual["count"] != entry["count"]:
+            problems.append((label, f"{actual['count']} rows in file, manifest says {entry['count']}"))
+        elif actual["sha256"] != entry["sha256"]:
+            problems.append((label, "checksum mismatch"))
+    for label, actual in found.items():
+        problems.append((label, f"{actual['count']} rows not listed in the manifest"))
+    return problems
+
+
+def _non_empty_tables(models):
+    return [model._meta.db_table for model in models if model._base_manager.exists()]
+
+
+def _truncate(models):
+    tables = [model._meta.db_table for model in models]
+    statements = connection.ops.sql_flush(no_style(), tables, allow_cascade=True)
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def restore(path, chunk_size=CHUNK_SIZE, truncate=False):
+    """
+    Load a backup file into the database in one transaction.
+
+    Rows are saved chunk by chunk (raw saves keyed by primary key, as
+    ``loaddata`` does), so the file is never held in memory. Returns
+    ``{model_label: count}``.
+
+    The backed-up tables must be empty, or are emptied first with
+    ``truncate``: a raw save over an existing row would be an UPDATE. On
+    PostgreSQL the load runs with ``session_replication_role = replica``,
+    so the database's own triggers (raw material deduction on
+    product_batches, stock and history logging) do not fire again for rows
+    that already carry their effects.
+    """
+    counts = {}
+    tables = set()
+    models = backup_models()
+
+    def flush(objects):
+        for deserialized in serializers.deserialize("python", objects):
+            deserialized.save()
+            label = deserialized.object._meta.label_lower
+            counts[label] = counts.get(label, 0) + 1
+            tables.add(deserialized.object._meta.db_table)
+
+    with transaction.atomic():
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL session_replication_role = replica")
+        if truncate:
+            _truncate(models)
+        else:
+            non_empty = _non_empty_tables(models)
+            if non_empty:
+                raise BackupError(
+                    f"Tables already have rows: {', '.join(non_empty)}. "
+                    "Restore into an empty database or truncate them first."
+                )
+        with connection.constraint_checks_disabled():
+            pending = []
+            for line in iter_backup_lines(path):
+                pending.append(json.loads(line))
+                if len(pending) >= chunk_size:
+                    flush(pending)
+                    pending = []
+            if pending:
+                flush(pending)
+        connection.check_constraints(table_names=sorted(tables))
+    return counts
@@ -0,0 +1,167 @@
+"""
+Process-local barcode index.
+
+Scanning at the counter and the barcode field of the product form look a
+barcode up on every scan or keystroke. Instead of querying ``products``
+(and then loading the type and variant for the message) each time, every
+process keeps a ``{barcode: summary}`` map with each product's name,
+prices, current stock and archived flag, so ``lookup()`` is a dict access.
+
+The map is built with one query on first use and rebuilt after
+``invalidate()``, which signals.py calls when a product (or its type,
+variant, size or unit) is saved or deleted, and views call after archiving
+products with a queryset ``update()``. Stock moves far more often than the
+catalog, so it is refreshed separately: ``stock_alerts.evaluate()`` reads
+the new levels after every committed stock change and hands them to
+``update_stock()``.
+
+Both kinds of change advance a version kept in a Postgres sequence
+(``barcode_catalog_version_seq`` / ``barcode_stock_version_seq``, migration
+0020), which every worker process sees. A process reads both versions with
+one small query at most every ``CHECK_INTERVAL`` seconds, and reloads its
+map (for a stock change, only the stock column) when one has moved, so a
+change made in another worker shows up within that interval.
+``lookup(barcode, fresh=True)`` checks the versions first, for answers that
+must not be stale such as the barcode availability check. On databases
+without sequences (local SQLite, a single process) the versions are kept
+in memory.
+
+Barcodes are unique (migration 0019), so the map has at most one product
+per barcode.
+"""
+import threading
+import time
+
+from django.db import connection, transaction
+
+from realsproj.models import ProductInventory, Products
+
+
+CATALOG_SEQUENCE = "barcode_catalog_version_seq"
+STOCK_SEQUENCE = "barcode_stock_version_seq"
+
+# Seconds a process trusts its map before checking the versions again.
+CHECK_INTERVAL = 1.0
+
+_lock = threading.Lock()
+_index = None            # {barcode: summary}
+_by_product = {}         # {product_id: summary}
+_catalog_version = None
+_stock_version = None
+_checked_at = 0.0
+_local_versions = {CATALOG_SEQUENCE: 1, STOCK_SEQUENCE: 1}
+
+
+def _versions():
+    """Current ``(catalog_version, stock_version)``."""
+    if connection.vendor != "postgresql":
+        return _local_versions[CATALOG_SEQUENCE], _local_versions[STOCK_SEQUENCE]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT (SELECT last_value FROM {CATALOG_SEQUENCE}), (SELECT last_value FROM {STOCK_SEQUENCE})"
+        )
+        return cursor.fetchone()
+
+
+def _bump(sequence):
+    """Advance ``sequence`` and return the new version."""
+    if connection.vendor != "postgresql":
+        _local_versions[sequence] += 1
+        return _local_versions[sequence]
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT nextval(%s)", [sequence])
+        return cursor.fetchone()[0]
+
+
+def _summary(product, stock):
+    return {
+        "id": product.id,
+        "barcode": product.barcode,
+        "name": str(product),
+        "product_type": product.product_type.name,
+        "variant": product.variant.name,
+        "unit_price": product.unit_price.unit_price,
+        "srp_price": product.srp_price.srp_price,
+        "stock": stock,
+        "is_archived": product.is_archived,
+    }
+
+
+def _load(catalog_version, stock_version):
+    global _index, _by_product, _catalog_version, _stock_version
+    products = (
+        Products.objects.exclude(barcode__isnull=True).exclude(barcode="")
+        .select_related("product_type", "variant", "size", "size_unit", "unit_price", "srp_price", "productinventory")
+    )
+    index, by_product = {}, {}
+    for product in products:
+        inventory = getattr(product, "productinventory", None)
+        summary = _summary(product, inventory.total_stock if inventory else 0)
+        index[product.barcode] = by_product[product.id] = summary
+    _index, _by_product = index, by_product
+    _catalog_version, _stock_version = catalog_version, stock_version
+
+
+def _reload_stock(stock_version):
+    global _stock_version
+    stock = dict(
+        ProductInventory.objects.filter(product_id__in=list(_by_product)).values_list("product_id", "total_stock")
+    )
+    for product_id, summary in _by_product.items():
+        summary["stock"] = stock.get(product_id, 0)
+    _stock_version = stock_version
+
+
+def _current(fresh=False):
+    global _checked_at
+    with _lock:
+        now = time.monotonic()
+        if _index is not None and not fresh and now - _checked_at < CHECK_INTERVAL:
+            return _index
+        catalog_version, stock_version = _versions()
+        _checked_at = now
+        if _index is None or _catalog_version != catalog_version:
+            _load(catalog_version, stock_version)
+        elif _stock_version != stock_version:
+            _reload_stock(stock_version)
+        return _index
+
+
+def lookup(barcode, fresh=False):
+    """
+    The summary of the product with ``barcode`` (a copy), or None. With
+    ``fresh`` the map is checked against the current versions first.
+    """
+    barcode = (barcode or "").strip()
+    if not barcode:
+        return None
+    summary = _current(fresh).get(barcode)
+    return dict(summary) if summary else None
+
+
+def _invalidate_now():
+    global _index
+    _bump(CATALOG_SEQUENCE)
+    _index = None
+
+
+def invalidate():
+    """Rebuild every process's map once the current transaction commits."""
+    transaction.on_commit(_invalidate_now)
+
+
+def update_stock(stock_by_product):
+    """Record new ``{product_id: total_stock}`` levels (after commit)."""
+    global _stock_version
+    if not stock_by_product:
+        return
+    with _lock:
+        version = _bump(STOCK_SEQUENCE)
+        for product_id, total_stock in stock_by_product.items():
+            summary = _by_product.get(product_id)
+            if summary is not None:
+                summary["stock"] = total_stock
+        # Only our own bump happened since the map was current; any other
+        # process's change still needs a reload.
+        if _stock_version is not None and version == _stock_version + 1:
+            _stock_version = version
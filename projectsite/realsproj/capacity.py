@@ -0,0 +1,211 @@
+"""
+Production capacity: how many units of each product the raw material
+inventory can make right now.
+
+The recipe matrix (per-unit need of every material for every product,
+``quantity_needed / yield_factor``) and the material stock are read in a
+single query. A product's capacity is the smallest ``stock / per-unit
+need`` over its materials; that material is the binding one. Products
+without a recipe are not limited by raw materials and get no capacity.
+
+The result is cached under a version of the recipe and raw material
+inventory tables: their row count, highest id and the sum of the rows'
+``xmin`` (the id of the transaction that last wrote each row), read with
+two small aggregate queries. Any insert, update or delete changes it, so
+the result is rebuilt exactly when a recipe or a stock level changes,
+including changes made by database triggers or other processes.
+
+``allocate()`` answers what-if plans for several products at once, which
+compete for the same materials: every product first gets the same share
+of its request (the largest fraction the materials allow, i.e. the optimum
+of the linear program "maximize t such that t * request fits"), then
+whatever stock is left tops up the requests in the order given.
+"""
+import hashlib
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection
+
+from realsproj.models import Products, ProductRecipes, RawMaterialInventory
+
+
+CACHE_PREFIX = "production_capacity"
+TIMEOUT = 600
+
+
+def _table_version(model):
+    """
+    SQL for ``count, max(pk), sum(xmin)`` of ``model``'s table. Every insert,
+    update or delete gives a row a new ``xmin`` (the writing transaction) or
+    changes the count, so the triple changes with every write.
+    """
+    meta = model._meta
+    table = connection.ops.quote_name(meta.db_table)
+    pk = connection.ops.quote_name(meta.pk.column)
+    return f"SELECT count(*), max({pk}), coalesce(sum(xmin::text::bigint), 0) FROM {table}"
+
+
+def fingerprint():
+    """
+    Changes with every write to the recipes or the raw material inventory;
+    None when the database cannot tell (non-PostgreSQL), which disables the
+    cache.
+    """
+    if connection.vendor != "postgresql":
+        return None
+    versions = []
+    with connection.cursor() as cursor:
+        for model in (RawMaterialInventory, ProductRecipes):
+            cursor.execute(_table_version(model))
+            versions.append(cursor.fetchone())
+    return hashlib.sha1(repr(versions).encode()).hexdigest()
+
+
+def per_unit(quantity_needed, yield_factor):
+    return quantity_needed / (yield_factor or Decimal(1))
+
+
+def load_matrix():
+    """
+    Return ``(needs, stock, materials)``: ``{product_id: {material_id:
+    per-unit need}}``, ``{material_id: stock}`` and ``{material_id:
+    (name, unit)}``, from one query over the recipes.
+    """
+    needs, stock, materials = {}, {}, {}
+    rows = ProductRecipes.objects.values_list(
+        "product_id",
+        "material_id",
+        "quantity_needed",
+        "yield_factor",
+        "material__rawmaterialinventory__total_stock",
+        "material__name",
+        "material__unit__unit_name",
+    )
+    for product_id, material_id, quantity_needed, yield_factor, total_stock, name, unit in rows:
+        product_needs = needs.setdefault(product_id, {})
+        product_needs[material_id] = product_needs.get(material_id, Decimal(0)) + per_unit(quantity_needed, yield_factor)
+        stock[material_id] = max(total_stock or Decimal(0), Decimal(0))
+        materials[material_id] = (name, unit or "")
+    return needs, stock, materials
+
+
+def _limit(needs, stock):
+    """Whole units ``stock`` allows for one product's ``needs``, and the binding material."""
+    best, binding = None, None
+    for material_id, need in needs.items():
+        if need <= 0:
+            continue
+        units = int(stock.get(material_id, Decimal(0)) // need)
+        if best is None or units < best:
+            best, binding = units, material_id
+    return best, binding
+
+
+def compute():
+    """Capacity of every product with a recipe (uncached)."""
+    needs, stock, materials = load_matrix()
+    products = {
+        product.id: str(product)
+        for product in Products.objects.filter(id__in=list(needs)).select_related(
+            "product_type", "variant", "size", "size_unit"
+        )
+    }
+    rows = []
+    for product_id, product_needs in needs.items():
+        units, binding = _limit(product_needs, stock)
+        rows.append({
+            "product_id": product_id,
+            "product": products.get(product_id, f"Product #{product_id}"),
+            "max_units": units,
+            "binding_material_id": binding,
+            "binding_material": materials[binding][0] if binding else None,
+        })
+    rows.sort(key=lambda row: row["product"])
+    return {"products": rows, "needs": needs, "stock": stock, "materials": materials}
+
+
+def capacity():
+    """Cached ``compute()``; costs two aggregate queries when current."""
+    version = fingerprint()
+    if version is None:
+        return compute()
+    key = f"{CACHE_PREFIX}:{version}"
+    result = cache.get(key)
+    if result is None:
+        result = compute()
+        cache.set(key, result, TIMEOUT)
+    return result
+
+
+def allocate(requested, result=None):
+    """
+    Split the raw materials between ``{product_id: units}`` requests.
+
+    Returns ``{"products": [...], "materials": [...], "feasible": bool}``.
+    """
+    result = result or capacity()
+    needs, stock, materials = result["needs"], result["stock"], result["materials"]
+    names = {row["product_id"]: row["product"] for row in result["products"]}
+    requested = {product_id: int(units) for product_id, units in requested.items() if int(units) > 0}
+
+    demand = {}
+    for product_id, units in requested.items():
+        for material_id, need in needs.get(product_id, {}).items():
+            demand[material_id] = demand.get(material_id, Decimal(0)) + need * units
+
+    # Largest common fraction of every request the stock can cover.
+    share = Decimal(1)
+    for material_id, total in demand.items():
+        if total > 0:
+            share = min(share, stock.get(material_id, Decimal(0)) / total)
+
+    allocated = {product_id: int(units * share) for product_id, units in requested.items()}
+    remaining = dict(stock)
+    for product_id, units in allocated.items():
+        for material_id, need in needs.get(product_id, {}).items():
+            remaining[material_id] = remaining.get(material_id, Decimal(0)) - need * units
+
+    # Top up with what is left, in request order.
+    binding = {}
+    for product_id, units in requested.items():
+        extra, binding[product_id] = _limit(needs.get(product_id, {}), remaining)
+        if extra is None:  # no recipe: not limited by raw materials
+            allocated[product_id] = units
+            continue
+        extra = min(extra, units - allocated[product_id])
+        allocated[product_id] += extra
+        for material_id, need in needs[product_id].items():
+            remaining[material_id] -= need * extra
+
+    products = [
+        {
+            "product_id": product_id,
+            "product": names.get(product_id, f"Product #{product_id}"),
+            "requested": units,
+            "allocated": allocated[product_id],
+            "short": units - allocated[product_id],
+            "binding_material": (
+                materials[binding[product_id]][0]
+                if binding.get(product_id) and allocated[product_id] < units else None
+            ),
+        }
+        for product_id, units in requested.items()
+    ]
+    material_rows = [
+        {
+            "material_id": material_id,
+            "material": materials[material_id][0],
+            "unit": materials[material_id][1],
+            "needed": total,
+            "available": stock.get(material_id, Decimal(0)),
+            "used": stock.get(material_id, Decimal(0)) - remaining.get(material_id, Decimal(0)),
+            "remaining": remaining.get(material_id, Decimal(0)),
+        }
+        for material_id, total in sorted(demand.items(), key=lambda item: materials[item[0]][0])
+    ]
+    return {
+        "products": products,
+        "materials": material_rows,
+        "feasible": all(row["short"] == 0 for row in products),
+    }
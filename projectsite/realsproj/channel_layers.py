@@ -0,0 +1,192 @@
+"""
+Channel layer for running several ASGI worker processes.
+
+``InMemoryChannelLayer`` only reaches consumers in the same process, so a
+phone scanner connected to one daphne worker could not reach the desktop
+page connected to another. ``PostgresChannelLayer`` keeps the in-memory
+layer for delivery inside a process and uses the database's LISTEN/NOTIFY
+between processes, so no extra service is needed:
+
+* channel names carry the id of the process that owns them
+  (``specific.<process id>!<random>``) and group memberships are kept by
+  the process whose consumer joined;
+* ``group_send`` delivers to the local members directly and publishes the
+  message with ``pg_notify``; every other process listening on the same
+  NOTIFY channel delivers it to its own members. ``send`` to another
+  process's channel is published the same way.
+
+Each process opens one extra connection, to LISTEN, when it first receives
+(i.e. when it has consumers) and reconnects if it drops; publishing uses a
+second connection from a worker thread. Messages are sent as JSON
+(``DjangoJSONEncoder``) and must stay under PostgreSQL's 8000 byte NOTIFY
+payload limit, which scan and stock messages easily do. Delivery between
+processes is at most once, like the in-memory layer.
+
+With a non-PostgreSQL database (SQLite test runs) the layer is a plain
+in-memory layer.
+"""
+import asyncio
+import json
+import random
+import string
+import threading
+import uuid
+
+from channels.exceptions import ChannelFull
+from channels.layers import InMemoryChannelLayer
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+
+
+MAX_PAYLOAD = 7999
+RECONNECT_DELAY = 2
+
+
+class PostgresChannelLayer(InMemoryChannelLayer):
+
+    def __init__(self, database="default", notify_channel="realsproj_channel_layer", **kwargs):
+        super().__init__(**kwargs)
+        self.database = database
+        self.notify_channel = notify_channel
+        self.client_id = uuid.uuid4().hex[:12]
+        self._listen_conn = None
+        self._listen_loop = None
+        self._listen_lock = None
+        self._publish_conn = None
+        self._publish_lock = threading.Lock()
+
+    @property
+    def distributed(self):
+        return connections[self.database].vendor == "postgresql"
+
+    def _connect(self):
+        wrapper = connections[self.database]
+        conn = wrapper.get_new_connection(wrapper.get_connection_params())
+        conn.autocommit = True
+        return conn
+
+    # Channel layer API
+
+    async def new_channel(self, prefix="specific"):
+        local = "".join(random.choice(string.ascii_letters) for _ in range(12))
+        return f"{prefix}.{self.client_id}!{local}"
+
+    def _is_local(self, channel):
+        return not self.distributed or f".{self.client_id}!" in channel
+
+    async def send(self, channel, message):
+        if self._is_local(channel):
+            await super().send(channel, message)
+        else:
+            await self._publish({"channel": channel, "message": message})
+
+    async def receive(self, channel):
+        if self.distributed:
+            await self._ensure_listener()
+        return await super().receive(channel)
+
+    async def group_send(self, group, message):
+        await super().group_send(group, message)
+        if self.distributed:
+            await self._publish({"group": group, "message": message})
+
+    async def close(self):
+        self._stop_listener()
+        with self._publish_lock:
+            if self._publish_conn is not None:
+                self._publish_conn.close()
+                self._publish_conn = None
+
+    # Publishing
+
+    def _notify(self, payload):
+        with self._publish_lock:
+            for attempt in (1, 2):
+                try:
+                    if self._publish_conn is None or self._publish_conn.closed:
+                        self._publish_conn = self._connect()
+                    with self._publish_conn.cursor() as cursor:
+                        cursor.execute("SELECT pg_notify(%s, %s)", [self.notify_channel, payload])
+                    return
+                except Exception:
+                    self._publish_conn = None
+                    if attempt == 2:
+                        raise
+
+    async def _publish(self, data):
+        data["origin"] = self.client_id
+        payload = json.dumps(data, cls=DjangoJSONEncoder)
+        if len(payload.encode()) > MAX_PAYLOAD:
+            raise ValueError(f"Channel layer message too large for NOTIFY ({len(payload)} bytes)")
+        await asyncio.get_running_loop().run_in_executor(None, self._notify, payload)
+
+    # Listening
+
+    async def _ensure_listener(self):
+        loop = asyncio.get_running_loop()
+        if self._listen_conn is not None and self._listen_loop is loop:
+            return
+        if self._listen_lock is None or self._listen_loop is not loop:
+            self._listen_lock = asyncio.Lock()
+        async with self._listen_lock:
+            if self._listen_conn is not None and self._listen_loop is loop:
+                return
+            self._stop_listener()
+            conn = await loop.run_in_executor(None, self._connect)
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN "{self.notify_channel}"')
+            loop.add_reader(conn.fileno(), self._on_readable)
+            self._listen_conn, self._listen_loop = conn, loop
+
+    def _stop_listener(self):
+        conn, loop = self._listen_conn, self._listen_loop
+        self._listen_conn = None
+        if conn is None:
+            return
+        try:
+            if loop is not None and not loop.is_closed():
+                loop.remove_reader(conn.fileno())
+        except Exception:
+            pass
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _on_readable(self):
+        conn, loop = self._listen_conn, self._listen_loop
+        try:
+            conn.poll()
+        except Exception as e:
+            print(f"❌ Channel layer listener lost its connection: {str(e)}")
+            self._stop_listener()
+            loop.call_later(RECONNECT_DELAY, lambda: loop.create_task(self._reconnect()))
+            return
+        while conn.notifies:
+            notify = conn.notifies.pop(0)
+            try:
+                data = json.loads(notify.payload)
+            except ValueError:
+                continue
+            if data.get("origin") != self.client_id:
+                loop.create_task(self._deliver(data))
+
+    async def _reconnect(self):
+        try:
+            await self._ensure_listener()
+        except Exception as e:
+            print(f"❌ Channel layer could not listen: {str(e)}")
+            loop = asyncio.get_running_loop()
+            loop.call_later(RECONNECT_DELAY, lambda: loop.create_task(self._reconnect()))
+
+    async def _deliver(self, data):
+        message = data.get("message")
+        if not isinstance(message, dict):
+            return
+        if "group" in data:
+            await InMemoryChannelLayer.group_send(self, data["group"], message)
+        elif data.get("channel") and self._is_local(data["channel"]):
+            try:
+                await InMemoryChannelLayer.send(self, data["channel"], message)
+            except ChannelFull:
+                pass
@@ -0,0 +1,233 @@
+"""
+Multi-line withdrawal checkout.
+
+``WithdrawItemView`` posts one quantity per product (``product_<id>``) or
+raw material (``material_<id>``). ``checkout()`` turns them into
+withdrawals in one transaction, with a fixed number of queries however
+many lines the order has:
+
+* the items and discounts are loaded with one query each;
+* the inventory rows of all lines are locked with a single
+  ``SELECT ... FOR UPDATE`` in primary-key order (so two checkouts touching
+  the same items queue instead of deadlocking), and stock is checked
+  against the locked values in memory;
+* the valid lines are inserted with one ``bulk_create``;
+* stock is decremented with one ``UPDATE ... FROM (VALUES ...)``.
+
+Lines that fail (unknown item, bad quantity or discount, insufficient
+stock) are reported in ``CheckoutResult.errors`` and skipped; the rest of
+the order goes through, as before. ``bulk_create`` and the raw UPDATE skip
+model signals, so the ledger, order header, stock alerts and filter
+facets are updated here.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from realsproj import facets, ledger, orders, stock_alerts
+from realsproj.models import (
+    Discounts, ProductInventory, Products, RawMaterialInventory, RawMaterials, Withdrawals
+)
+
+
+ORDER_CHANNELS = ("ORDER", "CONSIGNMENT", "RESELLER")
+
+# item_type -> (POST key prefix, item model, inventory model, item label)
+ITEM_TYPES = {
+    "PRODUCT": ("product_", Products, ProductInventory, "product"),
+    "RAW_MATERIAL": ("material_", RawMaterials, RawMaterialInventory, "raw material"),
+}
+
+ITEM_SELECT_RELATED = {
+    "PRODUCT": ("product_type", "variant", "size", "size_unit", "unit_price", "srp_price"),
+    "RAW_MATERIAL": ("unit",),
+}
+
+
+class CheckoutResult:
+    def __init__(self):
+        self.withdrawals = []
+        self.errors = []
+
+    @property
+    def count(self):
+        return len(self.withdrawals)
+
+
+class Line:
+    def __init__(self, item_id, quantity, discount=None):
+        self.item_id = item_id
+        self.quantity = quantity
+        self.discount = discount
+
+
+def parse_lines(data, item_type, result):
+    """Read the positive quantity lines of ``item_type`` from POST data."""
+    prefix, _, _, label = ITEM_TYPES[item_type]
+    lines = []
+    for key, value in data.items():
+        if not key.startswith(prefix) or not value:
+            continue
+        try:
+            item_id = int(key[len(prefix):])
+            quantity = Decimal(value)
+        except (ValueError, InvalidOperation):
+            result.errors.append(f"❌ Error withdrawing {label}: invalid quantity '{value}'")
+            continue
+        if quantity <= 0:
+            continue
+        lines.append(Line(item_id, quantity, data.get(f"discount_{item_id}") or None))
+    return lines
+
+
+def _discounts_by_value():
+    by_value = {}
+    for discount in Discounts.objects.order_by("id"):
+        by_value.setdefault(discount.value, discount)
+    return by_value
+
+
+def _line_pricing(product, quantity, price_type, discount_percent):
+    if price_type == "UNIT":
+        base_price = product.unit_price.unit_price
+    else:
+        base_price = product.srp_price.srp_price
+    discount_amount = base_price * (discount_percent / 100)
+    final_price = base_price - discount_amount
+    return {
+        "actual_unit_price": base_price,
+        "actual_discount_percent": discount_percent,
+        "actual_discount_amount": discount_amount,
+        "final_price_per_unit": final_price,
+        "total_amount": quantity * final_price,
+    }
+
+
+def decrement_stock(inventory_model, amounts):
+    """Subtract ``{item_id: quantity}`` from total_stock in one UPDATE."""
+    if not amounts:
+        return
+    if connection.vendor == "postgresql":
+        meta = inventory_model._meta
+        table = connection.ops.quote_name(meta.db_table)
+        pk_column = connection.ops.quote_name(meta.pk.column)
+        values = ", ".join(["(%s::bigint, %s::numeric)"] * len(amounts))
+        params = [value for item in amounts.items() for value in item]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} AS inv SET total_stock = inv.total_stock - v.quantity "
+                f"FROM (VALUES {values}) AS v(item_id, quantity) "
+                f"WHERE inv.{pk_column} = v.item_id",
+                params,
+            )
+        return
+    inventory_model.objects.filter(pk__in=amounts).update(
+        total_stock=F("total_stock") - Case(
+            *[When(pk=item_id, then=Value(quantity)) for item_id, quantity in amounts.items()]
+        )
+    )
+
+
+def checkout(item_type, lines, user, reason, sales_channel=None, price_type=None,
+             custom_price=None, customer_name=None, payment_status="PAID",
+             paid_amount=None, order_group_id=None, result=None):
+    """Withdraw ``lines`` of one item type atomically; returns a CheckoutResult."""
+    result = result or CheckoutResult()
+    if not lines:
+        return result
+    _, item_model, inventory_model, label = ITEM_TYPES[item_type]
+    is_order = sales_channel in ORDER_CHANNELS
+    now = timezone.now()
+
+    items = item_model.objects.select_related(*ITEM_SELECT_RELATED[item_type]).in_bulk(
+        [line.item_id for line in lines]
+    )
+    discounts = _discounts_by_value() if item_type == "PRODUCT" and any(l.discount for l in lines) else {}
+
+    with transaction.atomic():
+        stock = dict(
+            inventory_model.objects.select_for_update()
+            .filter(pk__in=list(items))
+            .order_by("pk")
+            .values_list("pk", "total_stock")
+        )
+
+        withdrawals = []
+        amounts = {}
+        for line in lines:
+            item = items.get(line.item_id)
+            if item is None:
+                result.errors.append(f"❌ Error withdrawing {label}: #{line.item_id} does not exist")
+                continue
+            available = stock.get(line.item_id)
+            if available is None:
+                result.errors.append(f"❌ Error withdrawing {label}: {item} has no inventory record")
+                continue
+            if line.quantity > available:
+                result.errors.append(f"⚠️ Insufficient stock for {item}. Available: {available}")
+                continue
+
+            if item_type == "RAW_MATERIAL":
+                withdrawal = Withdrawals(
+                    item_id=item.id,
+                    item_type=item_type,
+                    quantity=line.quantity,
+                    reason=reason,
+                    date=now,
+                    created_by_admin=user,
+                )
+            else:
+                discount_obj = None
+                custom_value = None
+                discount_percent = Decimal(0)
+                if line.discount:
+                    try:
+                        discount_percent = Decimal(line.discount)
+                    except InvalidOperation:
+                        result.errors.append(f"❌ Error withdrawing {label}: invalid discount '{line.discount}' for {item}")
+                        continue
+                    discount_obj = discounts.get(discount_percent)
+                    if discount_obj is not None:
+                        discount_percent = Decimal(discount_obj.value)
+                    else:
+                        custom_value = line.discount
+
+                pricing = {}
+                if reason == "SOLD" and price_type:
+                    pricing = _line_pricing(item, line.quantity, price_type, discount_percent)
+
+                withdrawal = Withdrawals(
+                    item_id=item.id,
+                    item_type=item_type,
+                    quantity=line.quantity,
+                    reason=reason,
+                    date=now,
+                    created_by_admin=user,
+                    sales_channel=sales_channel if reason == "SOLD" else None,
+                    price_type=price_type if reason == "SOLD" and payment_status == "PAID" else None,
+                    custom_price=custom_price if custom_price else None,
+                    discount_id=discount_obj.id if discount_obj else None,
+                    custom_discount_value=custom_value,
+                    customer_name=customer_name if is_order else None,
+                    payment_status=payment_status if is_order else "PAID",
+                    paid_amount=paid_amount if payment_status == "PARTIAL" else None,
+                    order_group_id=order_group_id,
+                    **pricing,
+                )
+
+            withdrawals.append(withdrawal)
+            amounts[item.id] = line.quantity
+            stock[item.id] = available - line.quantity
+
+        if withdrawals:
+            Withdrawals.objects.bulk_create(withdrawals)
+            decrement_stock(inventory_model, amounts)
+            ledger.mark_changed(ledger.WITHDRAWALS, {timezone.localdate(now)})
+            orders.mark_changed(order_group_id)
+            stock_alerts.mark_changed(item_type, list(amounts))
+            facets.observe(withdrawals)
+
+    result.withdrawals.extend(withdrawals)
+    return result
@@ -1,31 +1,142 @@
 import json
+import re
+import time
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.core.serializers.json import DjangoJSONEncoder
+
+from realsproj import barcodes, stock_feed
+
+
+# Repeated reads of the same barcode within this window are one scan.
+SCAN_DEBOUNCE_SECONDS = 1.0
+
+
+def scan_group(scope):
+    """
+    The pairing group of a scanner connection: the logged-in user's phone
+    and desktop pages share it, and ``?station=<name>`` on the socket URL
+    splits one account into several scanning stations.
+    """
+    query = parse_qs(scope.get("query_string", b"").decode())
+    station = re.sub(r"[^A-Za-z0-9_-]", "", query.get("station", [""])[0])[:32]
+    return f"scan.user{scope['user'].pk}.{station or 'default'}"
+
 
 class ScanConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-       
-        await self.channel_layer.group_add("scan_group", self.channel_name)
+        user = self.scope.get("user")
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+        self.group_name = scan_group(self.scope)
+        self.last_scan = (None, 0.0)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
         await self.accept()
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard("scan_group", self.channel_name)
+        if hasattr(self, "group_name"):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
 
     async def receive(self, text_data):
         data = json.loads(text_data)
-        barcode = data.get("barcode")
+        barcode = (data.get("barcode") or "").strip()
+        if not barcode:
+            return
 
+        now = time.monotonic()
+        last_barcode, last_time = self.last_scan
+        self.last_scan = (barcode, now)
+        if barcode == last_barcode and now - last_time < SCAN_DEBOUNCE_SECONDS:
+            return
+
+        product = await database_sync_to_async(barcodes.lookup)(barcode)
         await self.channel_layer.group_send(
-            "scan_group",
+            self.group_name,
             {
                 "type": "scan_message",
-                "barcode": barcode
+                "barcode": barcode,
+                "product": json.loads(json.dumps(product, cls=DjangoJSONEncoder)),
             }
         )
 
     async def scan_message(self, event):
-        barcode = event["barcode"]
+        await self.send(text_data=json.dumps({
+            "barcode": event["barcode"],
+            "product": event.get("product"),
+        }))
+
+
+class StockConsumer(AsyncWebsocketConsumer):
+    """
+    Pushes ``stock_update`` messages for the items a screen subscribed to:
+    ``{"subscribe": [{"type": "PRODUCT", "id": 1}, ...]}`` (answered with
+    the current levels) and ``{"unsubscribe": [...]}``. Stock changes
+    arrive as ``stock_batch`` messages on the ``stock`` group, which the
+    consumer joins while it has subscriptions.
+    """
+
+    async def connect(self):
+        user = self.scope.get("user")
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+        self.subscriptions = {item_type: set() for item_type in stock_feed.INVENTORIES}
+        self.in_group = False
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if getattr(self, "in_group", False):
+            await self.channel_layer.group_discard(stock_feed.GROUP, self.channel_name)
+
+    def _items(self, entries):
+        items = {}
+        for entry in entries if isinstance(entries, list) else []:
+            try:
+                item_type, item_id = entry["type"], int(entry["id"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if item_type in stock_feed.INVENTORIES:
+                items.setdefault(item_type, set()).add(item_id)
+        return items
+
+    async def receive(self, text_data):
+        data = json.loads(text_data)
+
+        for item_type, item_ids in self._items(data.get("unsubscribe")).items():
+            self.subscriptions[item_type] -= item_ids
+
+        for item_type, item_ids in self._items(data.get("subscribe")).items():
+            room = stock_feed.MAX_ITEMS - sum(len(ids) for ids in self.subscriptions.values())
+            item_ids = sorted(item_ids - self.subscriptions[item_type])[:max(room, 0)]
+            self.subscriptions[item_type].update(item_ids)
+            if item_ids:
+                await self._join(True)
+                current = await database_sync_to_async(stock_feed.levels)(item_type, item_ids)
+                for item_id, total_stock in current.items():
+                    await self.stock_update(stock_feed.message(item_type, item_id, total_stock))
+
+        if not any(self.subscriptions.values()):
+            await self._join(False)
+
+    async def _join(self, join):
+        if join and not self.in_group:
+            await self.channel_layer.group_add(stock_feed.GROUP, self.channel_name)
+        elif not join and self.in_group:
+            await self.channel_layer.group_discard(stock_feed.GROUP, self.channel_name)
+        self.in_group = join
+
+    async def stock_batch(self, event):
+        subscribed = self.subscriptions.get(event.get("item_type"), ())
+        for item_id, total_stock in (event.get("levels") or {}).items():
+            if int(item_id) in subscribed:
+                await self.stock_update(stock_feed.message(event["item_type"], int(item_id), total_stock))
 
-       
+    async def stock_update(self, event):
         await self.send(text_data=json.dumps({
-            "barcode": barcode
+            "item_type": event["item_type"],
+            "item_id": event["item_id"],
+            "total_stock": event["total_stock"],
         }))
@@ -1,10 +1,9 @@
-from .models import Notifications
+from . import notification_header
 
 def notifications_context(request):
-    notifications = Notifications.objects.order_by('-created_at')[:5]
-    unread_count = Notifications.objects.filter(is_read=False).count()
+    summary = notification_header.header_summary()
 
     return {
-        "notifications": notifications,
-        "unread_count": unread_count,
+        "notifications": summary["items"],
+        "unread_count": summary["unread_count"],
     }
@@ -0,0 +1,213 @@
+"""
+Set-based expiration run behind ``manage.py check_expirations``.
+
+Each phase is a fixed number of statements per batch kind, whatever the
+number of batches:
+
+* collect -- one query per kind for the batches that are due (expiration
+  date today or earlier), locked, and one anti-join query for the batches
+  expiring within a month that have no EXPIRATION_ALERT yet;
+* expire  -- one UPDATE zeroing and flagging every due batch;
+* withdraw -- one ``bulk_create`` of EXPIRED withdrawals, written in FEFO
+  order, so the expired stock shows up in the financial loss report;
+* notify  -- one ``bulk_create`` of notifications: EXPIRED_TODAY for the
+  expired batches that were never told about, EXPIRATION_ALERT for the
+  upcoming ones.
+
+A due batch is expired even when it already had an upcoming-expiration
+alert; the alert only guards against repeating the notification.
+"""
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from realsproj import ledger, notification_header, stock_alerts
+from realsproj.models import Notifications, ProductBatches, RawMaterialBatches, User, Withdrawals
+
+
+ALERT_TYPE = "EXPIRATION_ALERT"
+EXPIRED_TYPE = "EXPIRED_TODAY"
+
+WEEK_DAYS = 7
+MONTH_DAYS = 30
+
+BATCH_SIZE = 1000
+
+# item_type -> (batch model, field holding the product/material id)
+BATCH_KINDS = {
+    "PRODUCT": (ProductBatches, "product_id"),
+    "RAW_MATERIAL": (RawMaterialBatches, "material_id"),
+}
+
+
+def open_batches(model, since=None):
+    """Unexpired, unarchived batches with stock and an expiration date."""
+    queryset = model.objects.filter(
+        Q(is_expired=False) | Q(is_expired__isnull=True),
+        is_archived=False,
+        quantity__gt=0,
+        expiration_date__isnull=False,
+    )
+    if since:
+        queryset = queryset.filter(expiration_date__gte=since)
+    return queryset
+
+
+def system_user():
+    """The user expired withdrawals are recorded under (a superuser if any)."""
+    return User.objects.filter(is_superuser=True).first() or User.objects.first()
+
+
+def _notified(item_type, notification_type):
+    return Exists(Notifications.objects.filter(
+        item_type=item_type,
+        item_id=OuterRef("id"),
+        notification_type=notification_type,
+    ))
+
+
+class ExpirationRun:
+    """
+    One expiration pass. ``collect()`` and ``apply()`` fill in ``expired``,
+    ``alerts`` (lists of row dicts per item type) and ``timings``.
+    """
+
+    def __init__(self, today=None, since=None, user=None):
+        self.today = today or timezone.localdate()
+        self.since = since
+        self.user = user
+        self.expired = {item_type: [] for item_type in BATCH_KINDS}
+        self.alerts = {item_type: [] for item_type in BATCH_KINDS}
+        self.timings = {}
+
+    @contextmanager
+    def phase(self, name):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0) + time.monotonic() - started
+
+    # ------------------------------------------------------------------
+    # Counts
+    # ------------------------------------------------------------------
+    @property
+    def expired_count(self):
+        return sum(len(rows) for rows in self.expired.values())
+
+    def alert_count(self, within_days):
+        limit = self.today + timedelta(days=within_days)
+        return sum(1 for rows in self.alerts.values() for row in rows if row["expiration_date"] <= limit)
+
+    # ------------------------------------------------------------------
+    # Phases
+    # ------------------------------------------------------------------
+    def _rows(self, queryset, item_field, item_type):
+        return [
+            {
+                "id": batch_id,
+                "item_id": item_id,
+                "quantity": quantity,
+                "expiration_date": expiration_date,
+                "notified": notified,
+            }
+            for batch_id, item_id, quantity, expiration_date, notified in queryset
+            .annotate(notified=_notified(item_type, EXPIRED_TYPE))
+            .order_by("expiration_date", "id")
+            .values_list("id", item_field, "quantity", "expiration_date", "notified")
+        ]
+
+    def collect(self, lock=False):
+        """Read the due and upcoming batches (``lock`` takes row locks on the due ones)."""
+        month = self.today + timedelta(days=MONTH_DAYS)
+        with self.phase("collect"):
+            for item_type, (model, item_field) in BATCH_KINDS.items():
+                due = open_batches(model, self.since).filter(expiration_date__lte=self.today)
+                if lock:
+                    due = due.select_for_update(of=("self",))
+                self.expired[item_type] = self._rows(due, item_field, item_type)
+
+                upcoming = (
+                    open_batches(model, self.since)
+                    .filter(expiration_date__gt=self.today, expiration_date__lte=month)
+                    .filter(~_notified(item_type, ALERT_TYPE))
+                    .order_by("expiration_date", "id")
+                    .values_list("id", item_field, "quantity", "expiration_date")
+                )
+                self.alerts[item_type] = [
+                    {"id": batch_id, "item_id": item_id, "quantity": quantity, "expiration_date": expiration_date}
+                    for batch_id, item_id, quantity, expiration_date in upcoming
+                ]
+        return self
+
+    def apply(self):
+        """Expire, withdraw and notify in one transaction; returns ``self``."""
+        now = timezone.now()
+        with transaction.atomic():
+            self.collect(lock=True)
+
+            with self.phase("expire"):
+                for item_type, (model, _) in BATCH_KINDS.items():
+                    ids = [row["id"] for row in self.expired[item_type]]
+                    if ids:
+                        model.objects.filter(id__in=ids).update(is_expired=True, quantity=0)
+
+            with self.phase("withdraw"):
+                fefo = sorted(
+                    ((row["expiration_date"], row["id"], item_type, row)
+                     for item_type, rows in self.expired.items() for row in rows),
+                    key=lambda entry: entry[:2],
+                )
+                withdrawals = [
+                    Withdrawals(
+                        item_type=item_type,
+                        item_id=row["item_id"],
+                        quantity=row["quantity"],
+                        reason="EXPIRED",
+                        date=now,
+                        created_by_admin=self.user,
+                    )
+                    for _, _, item_type, row in fefo
+                ]
+                if withdrawals:
+                    Withdrawals.objects.bulk_create(withdrawals, batch_size=BATCH_SIZE)
+
+            with self.phase("notify"):
+                notifications = [
+                    Notifications(
+                        item_type=item_type,
+                        item_id=row["id"],
+                        notification_type=EXPIRED_TYPE,
+                        notification_timestamp=now,
+                        is_read=False,
+                    )
+                    for item_type, rows in self.expired.items()
+                    for row in rows
+                    if not row["notified"]
+                ] + [
+                    Notifications(
+                        item_type=item_type,
+                        item_id=row["id"],
+                        notification_type=ALERT_TYPE,
+                        notification_timestamp=now,
+                        is_read=False,
+                    )
+                    for item_type, rows in self.alerts.items()
+                    for row in rows
+                ]
+                if notifications:
+                    Notifications.objects.bulk_create(notifications, batch_size=BATCH_SIZE)
+
+        with self.phase("ledger"):
+            # bulk_create skips the withdrawal signals that keep the rollup current.
+            if withdrawals:
+                ledger.mark_changed(ledger.WITHDRAWALS, {timezone.localdate(now)})
+            if notifications:
+                notification_header.invalidate()
+            for item_type, rows in self.expired.items():
+                stock_alerts.mark_changed(item_type, [row["item_id"] for row in rows])
+        return self
@@ -0,0 +1,214 @@
+"""
+Cached value lists for the filter dropdowns of the list pages.
+
+The dropdowns (history log admins and log types, sales and expense
+categories, withdrawal sales channels) used to run a ``DISTINCT`` scan of
+their whole table on every page load, which grows with the audit log.
+Each one is now a facet: the distinct values are loaded once and cached,
+so rendering a page costs no query.
+
+The signals in ``signals.py`` keep the facets current. A new row whose
+value is already in the cached set changes nothing; a new value, an edit
+or a delete (which may remove the last row with a value) invalidates the
+facet, and the next page load rebuilds it. Rows written past the ORM
+signals (``bulk_create``, backup restores) go through ``observe()`` or
+``invalidate()``. History log rows inserted by database triggers are not
+seen at all; ``TIMEOUT`` bounds how long a new admin can be missing from
+the history dropdown.
+
+The cache is per process, so each facet's version lives in a Postgres
+sequence (``facet_<name>_version_seq``, migration 0021), as the barcode
+index does it: invalidating advances the sequence once the transaction
+commits, and every process reads the versions with one small query at most
+every ``CHECK_INTERVAL`` seconds, so an edit made in another worker shows
+up within that interval. On databases without sequences the versions are
+kept in memory.
+"""
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from realsproj.models import Expenses, HistoryLog, Sales, Withdrawals
+
+
+CACHE_PREFIX = "facets"
+TIMEOUT = 600
+
+# Seconds a process trusts its facet versions before reading them again.
+CHECK_INTERVAL = 1.0
+
+_lock = threading.Lock()
+_versions = {}
+_checked_at = 0.0
+_local_versions = {}
+
+
+def _format_category(value):
+    # "PHYSICAL_STORE" and "Physical Store" share one entry.
+    return value.replace("_", " ").title()
+
+
+def _categories(values):
+    by_display = {}
+    for value in values:
+        by_display.setdefault(_format_category(value), value)
+    return [{"value": value, "display": display} for display, value in sorted(by_display.items())]
+
+
+class Facet:
+    """
+    The distinct non-empty values of ``field`` over ``model`` rows matching
+    ``filters`` (exact and ``__in`` lookups on the model's own fields).
+    """
+
+    def __init__(self, name, model, field, filters, display=None):
+        self.name = name
+        self.model = model
+        self.field = field
+        self.filters = filters
+        self.display = display or list
+
+    def load(self):
+        values = (
+            self.model.objects.filter(**self.filters)
+            .exclude(**{f"{self.field}__isnull": True})
+            .exclude(**{self.field: ""})
+            .order_by(self.field)
+            .values_list(self.field, flat=True)
+            .distinct()
+        )
+        return list(values)
+
+    def matches(self, instance):
+        for lookup, expected in self.filters.items():
+            name, _, op = lookup.partition("__")
+            value = getattr(instance, name)
+            if not (value in expected if op == "in" else value == expected):
+                return False
+        return True
+
+    def value(self, instance):
+        value = instance
+        for name in self.field.split("__"):
+            value = getattr(value, name, None)
+            if value is None:
+                return None
+        return value
+
+
+FACETS = {}
+
+
+def register(name, model, field, display=None, **filters):
+    FACETS[name] = Facet(name, model, field, filters, display)
+
+
+def sequence(name):
+    return f"facet_{name}_version_seq"
+
+
+def _read_versions():
+    """``{facet name: version}`` of every facet."""
+    names = list(FACETS)
+    if connection.vendor != "postgresql":
+        return {name: _local_versions.get(name, 1) for name in names}
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT " + ", ".join(f"(SELECT last_value FROM {sequence(name)})" for name in names))
+        return dict(zip(names, cursor.fetchone()))
+
+
+def _version(name):
+    global _versions, _checked_at
+    with _lock:
+        now = time.monotonic()
+        if name not in _versions or now - _checked_at >= CHECK_INTERVAL:
+            _versions = _read_versions()
+            _checked_at = now
+        return _versions[name]
+
+
+def _bump(names):
+    """Advance the versions of ``names``."""
+    if connection.vendor != "postgresql":
+        bumped = {name: _local_versions.get(name, 1) + 1 for name in names}
+        _local_versions.update(bumped)
+    else:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT " + ", ".join(["nextval(%s)"] * len(names)), [sequence(name) for name in names])
+            bumped = dict(zip(names, cursor.fetchone()))
+    with _lock:
+        for name, version in bumped.items():
+            _versions[name] = max(_versions.get(name, 0), version)
+
+
+def _key(name):
+    return f"{CACHE_PREFIX}:{name}:{_version(name)}"
+
+
+def _cached(name):
+    """``(raw values, display values)`` of facet ``name``, loading it on a miss."""
+    key = _key(name)
+    entry = cache.get(key)
+    if entry is None:
+        facet = FACETS[name]
+        raw = facet.load()
+        entry = (frozenset(raw), facet.display(raw))
+        cache.set(key, entry, TIMEOUT)
+    return entry
+
+
+def values(name):
+    """The dropdown values of facet ``name``."""
+    return _cached(name)[1]
+
+
+def invalidate(*names):
+    """
+    Drop the cached facets ``names`` (all facets when none are given) in
+    every process, once the current transaction commits.
+    """
+    names = list(names or FACETS)
+    if names:
+        transaction.on_commit(lambda: _bump(names))
+
+
+def facets_for(model):
+    return [facet for facet in FACETS.values() if facet.model is model]
+
+
+def invalidate_model(model):
+    """Drop every facet over ``model``, e.g. after a queryset ``update()``."""
+    invalidate(*[facet.name for facet in facets_for(model)])
+
+
+def observe(instances):
+    """
+    Account for newly written ``instances``: a facet is invalidated only
+    when one of them carries a value its cached set does not have.
+    """
+    stale = set()
+    for instance in instances:
+        for facet in facets_for(type(instance)):
+            if facet.name in stale or not facet.matches(instance):
+                continue
+            value = facet.value(instance)
+            if value in (None, ""):
+                continue
+            entry = cache.get(_key(facet.name))
+            if entry is not None and value not in entry[0]:
+                stale.add(facet.name)
+    if stale:
+        invalidate(*stale)
+
+
+register("history_admins", HistoryLog, "admin__username", is_archived=False)
+register("history_log_types", HistoryLog, "log_type__category", is_archived=False)
+# Withdrawal-based sales are listed separately; only manual categories.
+register("sales_categories", Sales, "category", display=_categories, is_archived=False, source="MANUAL")
+register("expense_categories", Expenses, "category", display=_categories, is_archived=False)
+register(
+    "withdrawal_channels", Withdrawals, "sales_channel",
+    reason="SOLD", is_archived=False, sales_channel__in=["ORDER", "CONSIGNMENT", "RESELLER"],
+)
@@ -0,0 +1,100 @@
+"""
+Order-group pagination for withdrawal lists.
+
+Withdrawal pages show one row per order: lines sharing an
+``order_group_id`` form a group and ungrouped lines stand alone. Groups are
+keyed in SQL by ``COALESCE(order_group_id, -id)`` (order ids are positive,
+so negated line ids never collide) and ordered by their newest line. A page
+selects only its group keys from the database, then loads just those
+groups' lines, so work is proportional to the page rather than the history.
+
+``GroupPaginator`` is a drop-in ``Paginator`` for numbered pages;
+``keyset_page`` walks the same ordering with an opaque ``after`` cursor.
+"""
+from collections import defaultdict
+from datetime import datetime
+
+from django.core.paginator import Paginator
+from django.db.models import BigIntegerField, F, Max, Q
+from django.db.models.functions import Coalesce
+
+
+def group_key():
+    return Coalesce(F("order_group_id"), -F("id"), output_field=BigIntegerField())
+
+
+def group_index(lines):
+    """Grouped ``{group_key, latest}`` rows for ``lines``, newest group first."""
+    return (
+        lines.order_by()
+        .annotate(group_key=group_key())
+        .values("group_key")
+        .annotate(latest=Max("date"))
+        .order_by("-latest", "-group_key")
+    )
+
+
+def fetch_groups(lines, keys):
+    """
+    Load the lines of the given group keys.
+
+    Returns one list of lines per key, in key order and in the ordering of
+    ``lines`` within each group. Keys whose lines no longer match are dropped.
+    """
+    keys = [row["group_key"] if isinstance(row, dict) else row for row in keys]
+    if not keys:
+        return []
+    order_ids = [key for key in keys if key > 0]
+    line_ids = [-key for key in keys if key < 0]
+    by_key = defaultdict(list)
+    for line in lines.filter(
+        Q(order_group_id__in=order_ids) | Q(order_group_id__isnull=True, id__in=line_ids)
+    ):
+        by_key[line.order_group_id or -line.id].append(line)
+    return [by_key[key] for key in keys if by_key[key]]
+
+
+class GroupPaginator(Paginator):
+    """
+    Paginate a withdrawals queryset by order group.
+
+    ``count`` is the number of groups (one COUNT over the grouped query) and
+    each page's ``object_list`` is a list of line lists.
+    """
+
+    def __init__(self, lines, per_page, **kwargs):
+        self.lines = lines
+        super().__init__(group_index(lines), per_page, **kwargs)
+
+    def _get_page(self, keys, number, paginator):
+        return super()._get_page(fetch_groups(self.lines, keys), number, paginator)
+
+
+def encode_cursor(row):
+    return f"{row['latest'].isoformat()}_{row['group_key']}"
+
+
+def decode_cursor(cursor):
+    """Return ``(latest, group_key)`` from a cursor, or None if malformed."""
+    try:
+        latest, key = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(latest), int(key)
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def keyset_page(lines, per_page, after=None):
+    """
+    Return ``(groups, next_cursor)`` for the groups following ``after``.
+
+    Seeks past the cursor instead of counting or offsetting, so deep pages
+    cost the same as the first. ``next_cursor`` is None on the last page.
+    """
+    index = group_index(lines)
+    position = decode_cursor(after) if after else None
+    if position is not None:
+        latest, key = position
+        index = index.filter(Q(latest__lt=latest) | Q(latest=latest, group_key__lt=key))
+    rows = list(index[:per_page + 1])
+    next_cursor = encode_cursor(rows[per_page - 1]) if len(rows) > per_page else None
+    return fetch_groups(lines, rows[:per_page]), next_cursor
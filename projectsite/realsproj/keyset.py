@@ -0,0 +1,148 @@
+"""
+Keyset (cursor) pagination and the JSON feed of the large list views.
+
+OFFSET pagination reads and throws away every row before the page, and
+the paginator runs a COUNT(*) on each request, so deep pages and the
+"show all" modes of history/stock changes get slower the older the data.
+Here a page is "the next ``per_page`` rows after this one" in a fixed,
+unique ordering such as ``(-log_date, -id)``: the cursor holds the last
+row's sort values and the query seeks past them, which the composite
+indexes from migration 0017 answer directly. Page 1000 costs what page 1
+costs.
+
+List views that mix in ``KeysetListMixin`` answer ``?format=json`` with
+``{"results": [...], "next": cursor}`` using the view's own filters; pass
+``after=<next>`` for the following page. ``count=approx`` adds the
+planner's row estimate (no COUNT scan) and ``count=exact`` a real count.
+"""
+import base64
+import json
+
+from django.db import connection
+from django.db.models import Q
+from django.http import JsonResponse
+
+
+DEFAULT_PER_PAGE = 25
+MAX_PER_PAGE = 100
+
+
+def encode_cursor(values):
+    raw = json.dumps([v.isoformat() if hasattr(v, "isoformat") else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, model, ordering):
+    """Sort values from a cursor, converted to field types; None if malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(ordering):
+            return None
+        return [
+            model._meta.get_field(field.lstrip("-")).to_python(value)
+            for field, value in zip(ordering, values)
+        ]
+    except Exception:
+        return None
+
+
+def seek(ordering, values):
+    """
+    Filter selecting the rows that come after ``values`` in ``ordering``.
+
+    ``(a, id) after (v, w)`` expands to ``a < v OR (a = v AND id < w)``,
+    which PostgreSQL cannot use as an index range bound; the redundant
+    ``a <= v`` in front of it can be, so the index scan starts at the
+    cursor instead of filtering every row above it.
+    """
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip("-")
+        lookup = "lt" if field.startswith("-") else "gt"
+        condition |= equal & Q(**{f"{name}__{lookup}": value})
+        equal &= Q(**{name: value})
+    if len(ordering) > 1:
+        first = ordering[0]
+        lookup = "lte" if first.startswith("-") else "gte"
+        condition = Q(**{f"{first.lstrip('-')}__{lookup}": values[0]}) & condition
+    return condition
+
+
+def keyset_page(queryset, ordering, per_page, after=None):
+    """
+    Return ``(objects, next_cursor)`` for the rows of ``queryset`` following
+    the ``after`` cursor in ``ordering`` (whose last field must be unique).
+    """
+    queryset = queryset.order_by(*ordering)
+    if after:
+        values = decode_cursor(after, queryset.model, ordering)
+        if values is not None:
+            queryset = queryset.filter(seek(ordering, values))
+    objects = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(objects) > per_page:
+        objects = objects[:per_page]
+        last = objects[-1]
+        next_cursor = encode_cursor([getattr(last, field.lstrip("-")) for field in ordering])
+    return objects, next_cursor
+
+
+def approximate_count(queryset):
+    """The planner's row estimate on Postgres (no scan); an exact count elsewhere."""
+    if connection.vendor != "postgresql":
+        return queryset.count()
+    sql, params = queryset.order_by().values("pk").query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class KeysetListMixin:
+    """
+    Adds ``?format=json`` keyset pages to a ListView. Views set
+    ``keyset_ordering`` and implement ``keyset_row(obj)``; ``keyset_prepare``
+    can batch-load what the rows need.
+    """
+    keyset_ordering = ("-id",)
+    keyset_select_related = ()
+
+    def keyset_prepare(self, objects):
+        return objects
+
+    def keyset_row(self, obj):
+        return {"id": obj.pk}
+
+    def keyset_response(self):
+        params = self.request.GET
+        try:
+            per_page = min(max(int(params.get("per_page", DEFAULT_PER_PAGE)), 1), MAX_PER_PAGE)
+        except ValueError:
+            per_page = DEFAULT_PER_PAGE
+
+        queryset = self.get_queryset()
+        if self.keyset_select_related:
+            queryset = queryset.select_related(*self.keyset_select_related)
+        objects, next_cursor = keyset_page(queryset, self.keyset_ordering, per_page, params.get("after"))
+        objects = self.keyset_prepare(objects)
+
+        data = {
+            "results": [self.keyset_row(obj) for obj in objects],
+            "next": next_cursor,
+        }
+        count = params.get("count")
+        if count == "approx":
+            data["count"] = approximate_count(queryset)
+            data["count_is_estimate"] = connection.vendor == "postgresql"
+        elif count == "exact":
+            data["count"] = queryset.count()
+        return JsonResponse(data)
+
+    def get(self, request, *args, **kwargs):
+        if request.GET.get("format") == "json":
+            return self.keyset_response()
+        return super().get(request, *args, **kwargs)
@@ -0,0 +1,275 @@
+"""
+Materialized daily ledger for sales, expenses and withdrawals.
+
+Reports read per-day totals from ``DailyLedgerRollup`` instead of
+re-aggregating the raw tables. Whenever a row is saved, archived or deleted
+signals.py calls ``mark_changed()``; the affected days are collected per
+transaction and recomputed once it commits, for that source only (one
+grouped query over those days' rows), so the rollup stays current without
+full scans. Concurrent refreshes of the same day are serialized with a
+Postgres advisory lock per (source, day).
+``manage.py rebuild_ledger`` rebuilds everything and can verify the result.
+
+Archived rows are kept in the rollup under their own ``is_archived`` flag:
+the financial reports count every row, as they did when they aggregated
+the raw tables, while the list-page summaries read only the active rows
+(``rollup(..., include_archived=False)``).
+"""
+import threading
+import zlib
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from realsproj.models import DailyLedgerRollup, Expenses, Sales, Withdrawals
+
+
+SALES = "SALES"
+EXPENSES = "EXPENSES"
+WITHDRAWALS = "WITHDRAWALS"
+SOURCES = (SALES, EXPENSES, WITHDRAWALS)
+
+TOTAL = "TOTAL"
+CATEGORY = "CATEGORY"
+CHANNEL = "CHANNEL"
+
+SOURCE_MODELS = {
+    Sales: SALES,
+    Expenses: EXPENSES,
+    Withdrawals: WITHDRAWALS,
+}
+
+BATCH_SIZE = 1000
+
+_state = threading.local()
+
+
+def instance_day(instance):
+    """Return the ledger day a Sales/Expenses/Withdrawals row belongs to."""
+    value = getattr(instance, "date", None)
+    if value is None:
+        return None
+    if hasattr(value, "hour"):
+        if timezone.is_aware(value):
+            value = timezone.localtime(value)
+        return value.date()
+    return value
+
+
+def _source_rows(source, days=None):
+    """
+    Yield ``(day, is_archived, category, channel, amount, quantity, count)``
+    grouped rows for one source, optionally restricted to ``days``.
+    """
+    if source == SALES:
+        # Sales are split by source (MANUAL / ORDER) on the channel dimension.
+        qs = Sales.objects.all()
+        if days is not None:
+            qs = qs.filter(date__in=days)
+        rows = qs.order_by().values_list("date", "is_archived", "category", "source").annotate(
+            amount=Sum("amount"), n=Count("id")
+        )
+        for day, archived, category, kind, amount, n in rows:
+            yield day, bool(archived), category or "", kind or "", amount or 0, 0, n
+
+    elif source == EXPENSES:
+        qs = Expenses.objects.all()
+        if days is not None:
+            qs = qs.filter(date__in=days)
+        rows = qs.order_by().values_list("date", "is_archived", "category").annotate(
+            amount=Sum("amount"), n=Count("id")
+        )
+        for day, archived, category, amount, n in rows:
+            yield day, bool(archived), category or "", "", amount or 0, 0, n
+
+    elif source == WITHDRAWALS:
+        qs = Withdrawals.objects.all()
+        if days is not None:
+            qs = qs.filter(date__date__in=days)
+        rows = (
+            qs.order_by()
+            .annotate(day=TruncDate("date"))
+            .values_list("day", "is_archived", "reason", "sales_channel")
+            .annotate(amount=Sum("total_amount"), quantity=Sum("quantity"), n=Count("id"))
+        )
+        for day, archived, reason, channel, amount, quantity, n in rows:
+            yield day, bool(archived), reason or "", channel or "", amount or 0, quantity or 0, n
+
+    else:
+        raise ValueError(f"Unknown ledger source: {source}")
+
+
+def _fold(source, rows):
+    """Fold grouped source rows into TOTAL/CATEGORY/CHANNEL rollup slots."""
+    slots = {}
+    for day, archived, category, channel, amount, quantity, n in rows:
+        if day is None:
+            continue
+        keys = [(TOTAL, ""), (CATEGORY, category)]
+        if channel:
+            keys.append((CHANNEL, channel))
+        for dimension, key in keys:
+            slot = slots.get((day, dimension, key, archived))
+            if slot is None:
+                slot = slots[(day, dimension, key, archived)] = [Decimal(0), Decimal(0), 0]
+            slot[0] += amount
+            slot[1] += quantity
+            slot[2] += n
+    return slots
+
+
+def _rollup_objects(source, slots):
+    return [
+        DailyLedgerRollup(
+            date=day, source=source, dimension=dimension, key=key, is_archived=archived,
+            amount=amount, quantity=quantity, count=n,
+        )
+        for (day, dimension, key, archived), (amount, quantity, n) in slots.items()
+    ]
+
+
+def _lock_days(source, days):
+    """Hold a transaction-level advisory lock on each ``(source, day)``."""
+    if connection.vendor != "postgresql":
+        return
+    source_key = zlib.crc32(f"realsproj.ledger:{source}".encode()) - 2**31
+    with connection.cursor() as cursor:
+        # Always in date order, so two refreshes cannot deadlock.
+        for day in sorted(days):
+            cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)", [source_key, day.toordinal()])
+
+
+def refresh_days(source, days):
+    """Recompute the rollup rows of ``source`` for the given days."""
+    days = {day for day in days if day is not None}
+    if not days:
+        return
+    with transaction.atomic():
+        # Another refresh of the same day waits here until it commits, then
+        # reads the source rows as they are after that commit.
+        _lock_days(source, days)
+        objects = _rollup_objects(source, _fold(source, _source_rows(source, days)))
+        DailyLedgerRollup.objects.filter(source=source, date__in=days).delete()
+        DailyLedgerRollup.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+
+
+class _Pending:
+    """Days marked during one transaction, refreshed when it commits."""
+
+    def __init__(self):
+        self.days = {}
+
+    def run(self):
+        if getattr(_state, "pending", None) is self:
+            _state.pending = None
+        for source, days in self.days.items():
+            try:
+                refresh_days(source, days)
+            except Exception as e:
+                print(f"❌ Error refreshing daily ledger for {source} {sorted(days)}: {str(e)}")
+
+
+def mark_changed(source, days):
+    """Queue days of ``source`` to refresh; refreshed once after commit."""
+    days = {day for day in days if day is not None}
+    if not days:
+        return
+    if not connection.in_atomic_block:
+        pending = _Pending()
+        pending.days[source] = days
+        pending.run()
+        return
+    pending = getattr(_state, "pending", None)
+    # A rolled-back transaction drops its on_commit callbacks; start afresh.
+    if pending is None or not any(entry[1] == pending.run for entry in connection.run_on_commit):
+        pending = _state.pending = _Pending()
+        transaction.on_commit(pending.run)
+    pending.days.setdefault(source, set()).update(days)
+
+
+def affected_days(source, queryset):
+    """Distinct ledger days touched by ``queryset`` (call before bulk updates)."""
+    queryset = queryset.order_by()
+    if source == WITHDRAWALS:
+        return set(queryset.annotate(day=TruncDate("date")).values_list("day", flat=True).distinct())
+    return set(queryset.values_list("date", flat=True).distinct())
+
+
+def rebuild(sources=SOURCES):
+    """Drop and rebuild the rollup for ``sources`` from the raw tables."""
+    counts = {}
+    with transaction.atomic():
+        for source in sources:
+            objects = _rollup_objects(source, _fold(source, _source_rows(source)))
+            DailyLedgerRollup.objects.filter(source=source).delete()
+            DailyLedgerRollup.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+            counts[source] = len(objects)
+    return counts
+
+
+def verify(sources=SOURCES):
+    """
+    Compare the stored rollup against a fresh aggregation.
+
+    Returns a list of ``(source, date, dimension, key, is_archived, stored, expected)``
+    tuples, where stored/expected are ``(amount, quantity, count)`` or None.
+    """
+    mismatches = []
+    for source in sources:
+        expected = _fold(source, _source_rows(source))
+        stored = {
+            (day, dimension, key, archived): [amount, quantity, n]
+            for day, dimension, key, archived, amount, quantity, n in DailyLedgerRollup.objects.filter(
+                source=source
+            ).values_list("date", "dimension", "key", "is_archived", "amount", "quantity", "count")
+        }
+        for slot_key in sorted(set(expected) | set(stored)):
+            want = expected.get(slot_key)
+            have = stored.get(slot_key)
+            if want is not None and have is not None and all(
+                Decimal(a) == Decimal(b) for a, b in zip(want, have)
+            ):
+                continue
+            if want is None and have is not None and not any(have):
+                continue
+            mismatches.append((source, *slot_key, have, want))
+    return mismatches
+
+
+def rollup(source, dimension=TOTAL, key=None, include_archived=True):
+    """
+    Rollup rows for one source/dimension, optionally one split key. Pass
+    ``include_archived=False`` for figures over the active rows only.
+    """
+    qs = DailyLedgerRollup.objects.filter(source=source, dimension=dimension)
+    if key is not None:
+        qs = qs.filter(key=key)
+    if not include_archived:
+        qs = qs.filter(is_archived=False)
+    return qs
+
+
+def summarize(queryset):
+    """Return ``(amount, count, average)`` over a set of rollup rows."""
+    totals = queryset.aggregate(amount=Sum("amount"), count=Sum("count"))
+    amount = totals["amount"] or Decimal(0)
+    count = totals["count"] or 0
+    average = (amount / count) if count else None
+    return amount, count, average
+
+
+def monthly_totals(source, queryset=None):
+    """Return ``{month_start: amount}`` ordered by month."""
+    if queryset is None:
+        queryset = rollup(source)
+    rows = (
+        queryset.order_by()
+        .annotate(month=TruncMonth("date"))
+        .values_list("month")
+        .annotate(total=Sum("amount"))
+        .order_by("month")
+    )
+    return {month: total or Decimal(0) for month, total in rows}
@@ -0,0 +1,106 @@
+"""
+Financial loss computation for EXPIRED/DAMAGED withdrawals.
+
+Each withdrawal's loss is ``quantity × current price`` (product unit price
+or raw material price per unit). Prices are joined in SQL so totals are a
+single aggregate; display rows are only built for the slice being shown,
+with item names resolved by one ``in_bulk`` per chunk.
+"""
+from decimal import Decimal
+
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum
+
+from realsproj.models import Products, RawMaterials, Withdrawals
+
+
+LOSS_REASONS = ("EXPIRED", "DAMAGED")
+
+CHUNK_SIZE = 500
+
+
+def loss_withdrawals(item_type):
+    """Active EXPIRED/DAMAGED withdrawals of one item type, newest first."""
+    return Withdrawals.objects.filter(
+        item_type=item_type,
+        reason__in=LOSS_REASONS,
+        is_archived=False,
+    ).order_by("-date")
+
+
+def with_loss(queryset, item_type):
+    """
+    Annotate ``loss_price`` and ``loss_amount`` on a withdrawals queryset.
+
+    Withdrawals whose item no longer exists are dropped, as before.
+    """
+    if item_type == "PRODUCT":
+        price = Products.objects.filter(id=OuterRef("item_id")).values("unit_price__unit_price")[:1]
+    elif item_type == "RAW_MATERIAL":
+        price = RawMaterials.objects.filter(id=OuterRef("item_id")).values("price_per_unit")[:1]
+    else:
+        raise ValueError(f"Unknown item type: {item_type}")
+
+    money = DecimalField(max_digits=14, decimal_places=2)
+    return queryset.annotate(
+        loss_price=Subquery(price, output_field=money),
+    ).filter(
+        loss_price__isnull=False,
+    ).annotate(
+        loss_amount=ExpressionWrapper(F("quantity") * F("loss_price"), output_field=money),
+    )
+
+
+def total_loss(queryset):
+    """Sum of ``loss_amount`` over a ``with_loss`` queryset, in SQL."""
+    total = queryset.order_by().aggregate(total=Sum("loss_amount"))["total"]
+    return Decimal(total or 0).quantize(Decimal("0.01"))
+
+
+def loss_rows(withdrawals, item_type):
+    """
+    Build display rows for already-annotated withdrawals.
+
+    Item names are loaded with a single ``in_bulk`` for the whole slice.
+    """
+    withdrawals = list(withdrawals)
+    item_ids = {w.item_id for w in withdrawals}
+    if item_type == "PRODUCT":
+        items = Products.objects.select_related(
+            "product_type", "variant", "size", "size_unit"
+        ).in_bulk(item_ids)
+    else:
+        items = RawMaterials.objects.select_related("unit").in_bulk(item_ids)
+
+    rows = []
+    for w in withdrawals:
+        item = items.get(w.item_id)
+        if item is None:
+            continue
+        row = {
+            "date": w.date,
+            "quantity": w.quantity,
+            "reason": w.reason,
+            "get_reason_display": w.get_reason_display(),
+            "loss_amount": Decimal(w.loss_amount),
+        }
+        if item_type == "PRODUCT":
+            row["product_name"] = str(item)
+            row["unit_price"] = w.loss_price
+        else:
+            row["material_name"] = item.name
+            row["unit_name"] = item.unit.unit_name
+            row["price_per_unit"] = w.loss_price
+        rows.append(row)
+    return rows
+
+
+def iter_loss_rows(queryset, item_type, chunk_size=CHUNK_SIZE):
+    """Yield display rows for a ``with_loss`` queryset, one chunk at a time."""
+    chunk = []
+    for withdrawal in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(withdrawal)
+        if len(chunk) >= chunk_size:
+            yield from loss_rows(chunk, item_type)
+            chunk = []
+    if chunk:
+        yield from loss_rows(chunk, item_type)
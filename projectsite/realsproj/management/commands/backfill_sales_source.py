@@ -0,0 +1,85 @@
+import re
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from realsproj import ledger, orders
+from realsproj.models import Sales
+
+
+# Order sales written before the source column mention it as "Order #N".
+ORDER_REFERENCE_RE = re.compile(r"order #(\d+)", re.IGNORECASE)
+
+
+def parse_order_reference(description):
+    """Return the order number in an "Order #N ..." sales description, or None."""
+    match = ORDER_REFERENCE_RE.search(description or "")
+    return int(match.group(1)) if match else None
+
+
+class Command(BaseCommand):
+    help = 'Classify existing sales as manual or withdrawal-order sales by parsing "Order #N" descriptions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows to read and update per batch (default: 1000)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would change without writing',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        dry_run = options['dry_run']
+        started = time.monotonic()
+
+        candidates = Sales.objects.filter(
+            order_group_id__isnull=True,
+            description__icontains='order #',
+        ).only('id', 'description', 'source', 'order_group_id').order_by('id')
+
+        last_id = 0
+        scanned = 0
+        updated = 0
+        while True:
+            rows = list(candidates.filter(id__gt=last_id)[:batch_size])
+            if not rows:
+                break
+            last_id = rows[-1].id
+            scanned += len(rows)
+
+            changed = []
+            for sale in rows:
+                order_group_id = parse_order_reference(sale.description)
+                if order_group_id is None:
+                    continue
+                sale.order_group_id = order_group_id
+                sale.source = 'ORDER'
+                changed.append(sale)
+
+            if changed and not dry_run:
+                with transaction.atomic():
+                    Sales.objects.bulk_update(changed, ['source', 'order_group_id'])
+            updated += len(changed)
+            self.stdout.write(f'   ...scanned {scanned}, classified {updated}')
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f'⚠️ Dry run: {updated} of {scanned} sales would be marked as order sales'))
+            return
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Marked {updated} of {scanned} sales as order sales'))
+
+        if updated:
+            ledger.rebuild([ledger.SALES])
+            self.stdout.write(self.style.SUCCESS('✅ Sales ledger rebuilt'))
+            count = orders.rebuild()
+            self.stdout.write(self.style.SUCCESS(f'✅ Rebuilt {count} order header(s) with sales links'))
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'🎉 Backfill complete in {elapsed:.2f}s'))
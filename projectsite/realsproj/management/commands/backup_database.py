@@ -0,0 +1,61 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from realsproj import backup
+
+
+class Command(BaseCommand):
+    help = 'Write a streaming, compressed JSON backup of the database plus a manifest to local disk'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output-dir',
+            default='.',
+            help='Directory to write the backup and manifest into (default: current directory)',
+        )
+        parser.add_argument(
+            '--compression',
+            choices=backup.COMPRESSIONS,
+            default='gzip',
+            help='Compression for the backup file (default: gzip)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=backup.CHUNK_SIZE,
+            help=f'Rows read per query (default: {backup.CHUNK_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        compression = options['compression']
+        output_dir = options['output_dir']
+        timestamp = timezone.localtime().strftime('%Y%m%d_%H%M%S')
+        path = os.path.join(output_dir, f'reals_backup_{timestamp}{backup.EXTENSIONS[compression]}')
+        manifest_path = f'{path}.manifest.json'
+
+        try:
+            os.makedirs(output_dir, exist_ok=True)
+            started = time.monotonic()
+            manifest = backup.write_backup(path, compression, options['chunk_size'])
+            manifest['file'] = os.path.basename(path)
+            with open(manifest_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2)
+            elapsed = time.monotonic() - started
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'❌ Backup failed: {str(e)}'))
+            return
+
+        for entry in manifest['models']:
+            self.stdout.write(f"   {entry['model']}: {entry['count']} row(s)")
+        for entry in manifest['skipped']:
+            self.stderr.write(self.style.WARNING(f"⚠️ Skipped {entry['model']}: {entry['error']}"))
+        size = os.path.getsize(path)
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Backed up {manifest['total']} row(s) from {len(manifest['models'])} model(s) "
+            f"to {path} ({size / 1024:.1f} KiB) in {elapsed:.2f}s"
+        ))
+        self.stdout.write(self.style.SUCCESS(f'✅ Manifest written to {manifest_path}'))
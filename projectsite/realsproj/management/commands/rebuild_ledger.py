@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from realsproj import ledger
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily ledger rollup from sales, expenses and withdrawals, and/or verify it'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source',
+            action='append',
+            choices=ledger.SOURCES,
+            help='Limit to one source (repeatable). Defaults to all sources.',
+        )
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Verify the rollup against the raw tables after rebuilding',
+        )
+        parser.add_argument(
+            '--verify-only',
+            action='store_true',
+            help='Only verify; do not rebuild',
+        )
+
+    def handle(self, *args, **options):
+        sources = tuple(options['source'] or ledger.SOURCES)
+
+        if not options['verify_only']:
+            started = time.monotonic()
+            counts = ledger.rebuild(sources)
+            elapsed = time.monotonic() - started
+            for source, count in counts.items():
+                self.stdout.write(self.style.SUCCESS(f'✅ {source}: {count} rollup rows'))
+            self.stdout.write(self.style.SUCCESS(f'🎉 Ledger rebuilt in {elapsed:.2f}s'))
+
+        if options['verify'] or options['verify_only']:
+            mismatches = ledger.verify(sources)
+            if not mismatches:
+                self.stdout.write(self.style.SUCCESS('✅ Ledger matches the raw tables'))
+                return
+            for source, day, dimension, key, archived, stored, expected in mismatches[:50]:
+                scope = 'archived' if archived else 'active'
+                self.stdout.write(self.style.WARNING(
+                    f'⚠️ {source} {day} {dimension}:{key or "-"} ({scope}) stored={stored} expected={expected}'
+                ))
+            self.stdout.write(self.style.ERROR(f'❌ {len(mismatches)} mismatched rollup rows'))
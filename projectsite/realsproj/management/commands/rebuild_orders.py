@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from realsproj import orders
+
+
+class Command(BaseCommand):
+    help = 'Rebuild withdrawal order headers (totals, status, linked sales) from the withdrawals table'
+
+    def handle(self, *args, **options):
+        try:
+            count = orders.rebuild()
+            self.stdout.write(self.style.SUCCESS(f'✅ Rebuilt {count} order header(s)'))
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'❌ Error: {str(e)}'))
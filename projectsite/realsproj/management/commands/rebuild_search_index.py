@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from realsproj import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product search index (product_search) from the products table'
+
+    def handle(self, *args, **options):
+        try:
+            count = search.rebuild()
+            self.stdout.write(self.style.SUCCESS(f'✅ Indexed {count} product(s)'))
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'❌ Error: {str(e)}'))
@@ -1,21 +1,46 @@
-from django.core.management.base import BaseCommand
-from realsproj.scheduler import start_scheduler
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from realsproj.scheduler import JOBS, run_job, start_scheduler, stop_scheduler
 import time
 
 
 class Command(BaseCommand):
-    help = "Manually start the expiration check scheduler"
+    help = "Start the periodic job scheduler (expiration checks and other jobs)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--run",
+            metavar="JOB",
+            help="Run one job now (under its lock, recorded in the run history) and exit",
+        )
 
     def handle(self, *args, **options):
-        self.stdout.write(self.style.SUCCESS("Starting expiration scheduler..."))
+        if options["run"]:
+            job = JOBS.get(options["run"])
+            if job is None:
+                raise CommandError(f"Unknown job: {options['run']} (jobs: {', '.join(JOBS)})")
+            run = run_job(job, timezone.now())
+            if run is None:
+                self.stdout.write(self.style.WARNING(f"⚠️ {job.name} is already running on another node"))
+            elif run.status == "SUCCESS":
+                self.stdout.write(self.style.SUCCESS(
+                    f"✅ {job.name} finished in {run.duration_seconds:.2f}s ({run.rows} rows)"
+                ))
+            else:
+                self.stdout.write(self.style.ERROR(f"❌ {job.name} failed:\n{run.error}"))
+            return
+
+        self.stdout.write(self.style.SUCCESS("Starting scheduler..."))
         start_scheduler()
         self.stdout.write(self.style.SUCCESS("Scheduler started successfully"))
-        self.stdout.write(self.style.WARNING("Scheduled to run daily at 00:00 (midnight)"))
+        for job in JOBS.values():
+            self.stdout.write(self.style.WARNING(f"  {job.name}: {job.describe()}"))
         self.stdout.write(self.style.WARNING("Scheduler is running in the background..."))
         self.stdout.write(self.style.WARNING("Press Ctrl+C to stop"))
-        
+
         try:
             while True:
                 time.sleep(1)
         except KeyboardInterrupt:
             self.stdout.write(self.style.WARNING("\nStopping scheduler..."))
+            stop_scheduler()
@@ -1,12 +1,15 @@
-from django.utils import timezone
+import re
+
 from django.db import connection
-from realsproj.models import UserActivity
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+from realsproj import activity
 
 
 class UpdateLastActivityMiddleware:
     """
-    Middleware to update user's last_activity timestamp on every request.
+    Middleware to record a last_activity heartbeat on every request.
     This helps track if a user is actively using the system.
+    Heartbeats are written at most once per interval (see realsproj.activity).
     """
     def __init__(self, get_response):
         self.get_response = get_response
@@ -14,9 +17,7 @@ class UpdateLastActivityMiddleware:
     def __call__(self, request):
         if request.user.is_authenticated:
             try:
-                activity, created = UserActivity.objects.get_or_create(user=request.user)
-                activity.last_activity = timezone.now()
-                activity.save(update_fields=['last_activity'])
+                activity.touch(request.user.id)
             except Exception:
                 pass
 
@@ -24,18 +25,32 @@ class UpdateLastActivityMiddleware:
         return response
 
 
+WRITE_SQL_RE = re.compile(r"^\s*(INSERT|UPDATE|DELETE)\b", re.IGNORECASE)
+
+
 class SetCurrentUserMiddleware:
     """
-    Middleware to set the current user ID in PostgreSQL session variable
+    Middleware to set the current user ID in a PostgreSQL setting
     for use in database triggers for accurate history logging.
+
+    Nothing is sent up front. While the request runs, every INSERT/UPDATE/
+    DELETE is prefixed with a transaction-local set_config(), so the value
+    rides along with the write in the same round-trip and transaction and is
+    gone once it commits (pooled connections never carry a stale user id).
+    Read-only requests cost no extra query.
     """
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
-        if request.user.is_authenticated:
+        if request.user.is_authenticated and connection.vendor == 'postgresql':
+            if not is_psycopg3:
+                with connection.execute_wrapper(CurrentUserWrapper(request.user.id)):
+                    return self.get_response(request)
+
+            # psycopg 3 does not return RETURNING rows from a multi-statement
+            # execute, so fall back to setting it up front.
             try:
-                # Set the current user ID in PostgreSQL session variable
                 with connection.cursor() as cursor:
                     cursor.execute("SELECT set_config('app.current_user_id', %s, false)", [str(request.user.id)])
             except Exception:
@@ -43,3 +58,16 @@ class SetCurrentUserMiddleware:
 
         response = self.get_response(request)
         return response
+
+
+class CurrentUserWrapper:
+    """Database execute wrapper that tags write statements with the user id."""
+    def __init__(self, user_id):
+        # User ids are integers, so the literal is safe to inline (and has
+        # no % signs to upset parameter interpolation).
+        self.prefix = f"SELECT set_config('app.current_user_id', '{int(user_id)}', true); "
+
+    def __call__(self, execute, sql, params, many, context):
+        if isinstance(sql, str) and WRITE_SQL_RE.match(sql):
+            sql = self.prefix + sql
+        return execute(sql, params, many, context)
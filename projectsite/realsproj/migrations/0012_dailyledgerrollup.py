@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Fill the rollup from the raw tables, as realsproj.ledger.rebuild() does:
+# one row per day and archived flag for the TOTAL, CATEGORY and (for
+# withdrawals) CHANNEL dimensions. The sales MANUAL/ORDER channel rows need
+# sales.source (0014) and are written by `manage.py backfill_sales_source`.
+# Withdrawal dates are timestamps and fall on the day of TIME_ZONE.
+ROLLUP_COLUMNS = "date, source, dimension, key, is_archived, amount, quantity, count, updated_at"
+
+BACKFILL_SALES = f"""
+WITH r AS (
+    SELECT date::date AS day, COALESCE(is_archived, false) AS archived,
+           COALESCE(category, '') AS category, amount
+    FROM sales WHERE date IS NOT NULL
+)
+INSERT INTO daily_ledger_rollup ({ROLLUP_COLUMNS})
+SELECT day, 'SALES', 'TOTAL', '', archived, COALESCE(SUM(amount), 0), 0, COUNT(*), now()
+FROM r GROUP BY day, archived
+UNION ALL
+SELECT day, 'SALES', 'CATEGORY', category, archived, COALESCE(SUM(amount), 0), 0, COUNT(*), now()
+FROM r GROUP BY day, category, archived
+"""
+
+BACKFILL_EXPENSES = f"""
+WITH r AS (
+    SELECT date::date AS day, COALESCE(is_archived, false) AS archived,
+           COALESCE(category, '') AS category, amount
+    FROM expenses WHERE date IS NOT NULL
+)
+INSERT INTO daily_ledger_rollup ({ROLLUP_COLUMNS})
+SELECT day, 'EXPENSES', 'TOTAL', '', archived, COALESCE(SUM(amount), 0), 0, COUNT(*), now()
+FROM r GROUP BY day, archived
+UNION ALL
+SELECT day, 'EXPENSES', 'CATEGORY', category, archived, COALESCE(SUM(amount), 0), 0, COUNT(*), now()
+FROM r GROUP BY day, category, archived
+"""
+
+BACKFILL_WITHDRAWALS = f"""
+WITH r AS (
+    SELECT (date AT TIME ZONE %s)::date AS day, COALESCE(is_archived, false) AS archived,
+           COALESCE(reason, '') AS category, COALESCE(sales_channel, '') AS channel,
+           total_amount AS amount, quantity
+    FROM withdrawals WHERE date IS NOT NULL
+)
+INSERT INTO daily_ledger_rollup ({ROLLUP_COLUMNS})
+SELECT day, 'WITHDRAWALS', 'TOTAL', '', archived, COALESCE(SUM(amount), 0), COALESCE(SUM(quantity), 0), COUNT(*), now()
+FROM r GROUP BY day, archived
+UNION ALL
+SELECT day, 'WITHDRAWALS', 'CATEGORY', category, archived, COALESCE(SUM(amount), 0), COALESCE(SUM(quantity), 0), COUNT(*), now()
+FROM r GROUP BY day, category, archived
+UNION ALL
+SELECT day, 'WITHDRAWALS', 'CHANNEL', channel, archived, COALESCE(SUM(amount), 0), COALESCE(SUM(quantity), 0), COUNT(*), now()
+FROM r WHERE channel <> '' GROUP BY day, channel, archived
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('realsproj', '0011_fix_attribute_update_triggers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyLedgerRollup',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('source', models.CharField(choices=[('SALES', 'Sales'), ('EXPENSES', 'Expenses'), ('WITHDRAWALS', 'Withdrawals')], max_length=12)),
+                ('dimension', models.CharField(choices=[('TOTAL', 'Total'), ('CATEGORY', 'Category'), ('CHANNEL', 'Channel')], default='TOTAL', max_length=10)),
+                ('key', models.CharField(blank=True, default='', max_length=255)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('quantity', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.IntegerField(default=0)),
+                ('is_archived', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'daily_ledger_rollup',
+                'unique_together': {('date', 'source', 'dimension', 'key', 'is_archived')},
+                'indexes': [models.Index(fields=['source', 'dimension', 'date'], name='ledger_source_dim_date_idx')],
+            },
+        ),
+        migrations.RunSQL(
+            sql=[BACKFILL_SALES, BACKFILL_EXPENSES, (BACKFILL_WITHDRAWALS, [settings.TIME_ZONE])],
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,35 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('realsproj', '0012_dailyledgerrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WithdrawalOrder',
+            fields=[
+                ('order_group_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('customer_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('reason', models.CharField(blank=True, choices=[('SOLD', 'Sold'), ('EXPIRED', 'Expired'), ('DAMAGED', 'Damaged'), ('RETURNED', 'Returned'), ('OTHERS', 'Others')], max_length=20, null=True)),
+                ('sales_channel', models.CharField(blank=True, choices=[('ORDER', 'Order'), ('CONSIGNMENT', 'Consignment'), ('RESELLER', 'Reseller'), ('PHYSICAL_STORE', 'Physical Store')], max_length=20, null=True)),
+                ('payment_status', models.CharField(blank=True, choices=[('PAID', 'Paid'), ('UNPAID', 'Unpaid'), ('PARTIAL', 'Partial Payment')], max_length=20, null=True)),
+                ('paid_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('total_amount', models.DecimalField(blank=True, decimal_places=2, help_text='Custom order price, or the sum of priced lines; NULL if unpriced', max_digits=12, null=True)),
+                ('total_quantity', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('line_count', models.IntegerField(default=0)),
+                ('has_custom_price', models.BooleanField(default=False)),
+                ('has_initial_pricing', models.BooleanField(default=False)),
+                ('sales', models.ForeignKey(blank=True, db_column='sales_id', db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='realsproj.sales')),
+                ('date', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'withdrawal_orders',
+                'indexes': [models.Index(fields=['-date'], name='withdrawal_orders_date_idx'), models.Index(fields=['payment_status'], name='withdrawal_orders_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('realsproj', '0013_withdrawalorder'),
+    ]
+
+    operations = [
+        # sales is an externally managed table: add the columns and indexes
+        # with SQL and record the fields in the migration state only.
+        # Existing rows are classified by `manage.py backfill_sales_source`.
+        migrations.RunSQL(
+            sql="""
+            ALTER TABLE sales ADD COLUMN IF NOT EXISTS source varchar(10) NOT NULL DEFAULT 'MANUAL';
+            ALTER TABLE sales ADD COLUMN IF NOT EXISTS order_group_id bigint NULL;
+            CREATE INDEX IF NOT EXISTS sales_source_idx ON sales (source, is_archived, date);
+            CREATE INDEX IF NOT EXISTS sales_order_group_idx ON sales (order_group_id) WHERE order_group_id IS NOT NULL;
+            """,
+            reverse_sql="""
+            DROP INDEX IF EXISTS sales_order_group_idx;
+            DROP INDEX IF EXISTS sales_source_idx;
+            ALTER TABLE sales DROP COLUMN IF EXISTS order_group_id;
+            ALTER TABLE sales DROP COLUMN IF EXISTS source;
+            """,
+            state_operations=[
+                migrations.AddField(
+                    model_name='sales',
+                    name='source',
+                    field=models.CharField(choices=[('MANUAL', 'Manual'), ('ORDER', 'Withdrawal Order')], default='MANUAL', max_length=10),
+                ),
+                migrations.AddField(
+                    model_name='sales',
+                    name='order_group_id',
+                    field=models.BigIntegerField(blank=True, null=True),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('realsproj', '0014_sales_source_order_group_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledJobRun',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('job_name', models.CharField(max_length=100)),
+                ('scheduled_for', models.DateTimeField()),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('duration_seconds', models.FloatField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('RUNNING', 'Running'), ('SUCCESS', 'Success'), ('FAILED', 'Failed')], default='RUNNING', max_length=10)),
+                ('rows', models.IntegerField(blank=True, help_text='Rows the job reported as processed', null=True)),
+                ('host', models.CharField(blank=True, default='', max_length=255)),
+                ('error', models.TextField(blank=True, default='')),
+            ],
+            options={
+                'db_table': 'scheduled_job_runs',
+                'indexes': [models.Index(fields=['job_name', '-started_at'], name='job_runs_name_started_idx')],
+                'unique_together': {('job_name', 'scheduled_for')},
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('realsproj', '0015_scheduledjobrun'),
+    ]
+
+    operations = [
+        # Order numbers are allocated from this sequence (realsproj.order_numbers),
+        # starting after the highest order_group_id already in use.
+        migrations.RunSQL(
+            sql="""
+            CREATE SEQUENCE IF NOT EXISTS withdrawal_order_number_seq AS bigint;
+            SELECT setval(
+                'withdrawal_order_number_seq',
+                COALESCE((SELECT MAX(order_group_id) FROM withdrawals), 0) + 1,
+                false
+            );
+            """,
+            reverse_sql="DROP SEQUENCE IF EXISTS withdrawal_order_number_seq;",
+        ),
+    ]
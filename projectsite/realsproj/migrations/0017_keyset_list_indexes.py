@@ -0,0 +1,32 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('realsproj', '0016_withdrawal_order_number_seq'),
+    ]
+
+    operations = [
+        # Composite indexes matching the keyset orderings of the list views
+        # (realsproj.keyset): the active rows in page order, so a page after
+        # a cursor is an index range scan instead of OFFSET + sort.
+        migrations.RunSQL(
+            sql="""
+            CREATE INDEX IF NOT EXISTS history_log_keyset_idx ON history_log (is_archived, log_date DESC, id DESC);
+            CREATE INDEX IF NOT EXISTS stock_changes_keyset_idx ON stock_changes (is_archived, date DESC, id DESC);
+            CREATE INDEX IF NOT EXISTS notifications_keyset_idx ON notifications (is_archived, notification_timestamp DESC, id DESC);
+            CREATE INDEX IF NOT EXISTS products_keyset_idx ON products (is_archived, id DESC);
+            CREATE INDEX IF NOT EXISTS product_batches_keyset_idx ON product_batches (is_archived, batch_date DESC, id DESC);
+            CREATE INDEX IF NOT EXISTS raw_material_batches_keyset_idx ON raw_material_batches (is_archived, batch_date DESC, id DESC);
+            """,
+            reverse_sql="""
+            DROP INDEX IF EXISTS raw_material_batches_keyset_idx;
+            DROP INDEX IF EXISTS product_batches_keyset_idx;
+            DROP INDEX IF EXISTS products_keyset_idx;
+            DROP INDEX IF EXISTS notifications_keyset_idx;
+            DROP INDEX IF EXISTS stock_changes_keyset_idx;
+            DROP INDEX IF EXISTS history_log_keyset_idx;
+            """,
+        ),
+    ]
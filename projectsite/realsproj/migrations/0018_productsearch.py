@@ -0,0 +1,50 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('realsproj', '0017_keyset_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearch',
+            fields=[
+                ('product', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='realsproj.products')),
+                ('document', models.TextField()),
+            ],
+            options={
+                'db_table': 'product_search',
+            },
+        ),
+        # One row per existing product, built like search.document():
+        # type, variant, size, unit and barcode, lowercased, with runs of
+        # whitespace collapsed. Later changes are kept in sync by signals.
+        migrations.RunSQL(
+            sql=r"""
+            INSERT INTO product_search (product_id, document)
+            SELECT p.id, lower(btrim(regexp_replace(concat_ws(' ',
+                       NULLIF(pt.name, ''), NULLIF(pv.name, ''), NULLIF(s.size_label, ''),
+                       NULLIF(su.unit_name, ''), NULLIF(p.barcode, '')
+                   ), '\s+', ' ', 'g')))
+            FROM products p
+            JOIN product_types pt ON pt.id = p.product_type_id
+            JOIN product_variants pv ON pv.id = p.variant_id
+            JOIN size_units su ON su.id = p.size_unit_id
+            LEFT JOIN sizes s ON s.id = p.size_id
+            ON CONFLICT (product_id) DO NOTHING;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        # Trigram index for substring (LIKE '%..%') and typo-tolerant word
+        # similarity (%>) matches.
+        migrations.RunSQL(
+            sql="""
+            CREATE EXTENSION IF NOT EXISTS pg_trgm;
+            CREATE INDEX IF NOT EXISTS product_search_document_trgm_idx ON product_search USING gin (document gin_trgm_ops);
+            """,
+            reverse_sql="DROP INDEX IF EXISTS product_search_document_trgm_idx;",
+        ),
+    ]
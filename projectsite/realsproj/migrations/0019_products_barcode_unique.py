@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('realsproj', '0018_productsearch'),
+    ]
+
+    operations = [
+        # products is an externally managed table. Barcodes are looked up by
+        # exact value (realsproj.barcodes, the product form); blank barcodes
+        # are left out so products without one do not collide. Resolve any
+        # duplicate barcodes before migrating.
+        migrations.RunSQL(
+            sql="CREATE UNIQUE INDEX IF NOT EXISTS products_barcode_uniq ON products (barcode) WHERE barcode IS NOT NULL AND barcode <> '';",
+            reverse_sql="DROP INDEX IF EXISTS products_barcode_uniq;",
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('realsproj', '0019_products_barcode_unique'),
+    ]
+
+    operations = [
+        # Versions of the barcode index (realsproj.barcodes), shared by all
+        # worker processes: advanced on catalog and stock changes. setval
+        # marks them as called, so the first nextval moves last_value.
+        migrations.RunSQL(
+            sql="""
+            CREATE SEQUENCE IF NOT EXISTS barcode_catalog_version_seq AS bigint;
+            CREATE SEQUENCE IF NOT EXISTS barcode_stock_version_seq AS bigint;
+            SELECT setval('barcode_catalog_version_seq', 1);
+            SELECT setval('barcode_stock_version_seq', 1);
+            """,
+            reverse_sql="""
+            DROP SEQUENCE IF EXISTS barcode_stock_version_seq;
+            DROP SEQUENCE IF EXISTS barcode_catalog_version_seq;
+            """,
+        ),
+    ]
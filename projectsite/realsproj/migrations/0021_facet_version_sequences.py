@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+FACETS = (
+    'history_admins',
+    'history_log_types',
+    'sales_categories',
+    'expense_categories',
+    'withdrawal_channels',
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('realsproj', '0020_barcode_version_sequences'),
+    ]
+
+    operations = [
+        # Versions of the cached filter dropdowns (realsproj.facets), shared
+        # by all worker processes. setval marks them as called, so the first
+        # nextval moves last_value.
+        migrations.RunSQL(
+            sql=''.join(
+                f"CREATE SEQUENCE IF NOT EXISTS facet_{name}_version_seq AS bigint;"
+                f"SELECT setval('facet_{name}_version_seq', 1);"
+                for name in FACETS
+            ),
+            reverse_sql=''.join(f"DROP SEQUENCE IF EXISTS facet_{name}_version_seq;" for name in FACETS),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('realsproj', '0021_facet_version_sequences'),
+    ]
+
+    operations = [
+        # Version of the cached header dropdown (realsproj.notification_header),
+        # shared by all worker processes. setval marks it as called, so the
+        # first nextval moves last_value.
+        migrations.RunSQL(
+            sql="""
+            CREATE SEQUENCE IF NOT EXISTS notification_header_version_seq AS bigint;
+            SELECT setval('notification_header_version_seq', 1);
+            """,
+            reverse_sql="DROP SEQUENCE IF EXISTS notification_header_version_seq;",
+        ),
+    ]
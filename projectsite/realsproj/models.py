@@ -19,6 +19,30 @@ from django.utils import timezone
 from django.conf import settings
 
 
+# select_related() needed to render each model's display string; shared by
+# resolve_item() and the list-page resolver (realsproj.resolver).
+ITEM_SELECT_RELATED = {
+    "Products": ("product_type", "variant", "size", "size_unit"),
+    "RawMaterials": ("unit",),
+    "ProductBatches": ("product__product_type", "product__variant", "product__size", "product__size_unit"),
+    "RawMaterialBatches": ("material__unit",),
+    "ProductRecipes": ("product__product_type", "product__variant", "product__size", "product__size_unit", "material"),
+}
+
+
+def resolve_item(instance, model, pk):
+    """
+    Fetch a row referenced by ``instance`` for its display methods.
+
+    Rows prefetched by realsproj.resolver come from its identity map;
+    otherwise this falls back to a single query. Returns None if missing.
+    """
+    resolver = getattr(instance, "_resolver", None)
+    if resolver is not None:
+        return resolver.get(model, pk)
+    return model.objects.select_related(*ITEM_SELECT_RELATED.get(model.__name__, ())).filter(pk=pk).first()
+
+
 class AuthGroup(models.Model):
     name = models.CharField(unique=True, max_length=150)
 
@@ -177,40 +201,42 @@ class HistoryLog(models.Model):
         db_table = 'history_log'
 
     def get_entity_display(self):
+        def fetch(model):
+            obj = resolve_item(self, model, self.entity_id)
+            if obj is None:
+                raise model.DoesNotExist
+            return obj
+
         try:
             if self.entity_type == "product":
-                p = Products.objects.select_related(
-                    "product_type", "variant", "size_unit", "size"
-                ).get(pk=self.entity_id)
+                p = fetch(Products)
                 return f"{p.product_type.name} - {p.variant.name} ({p.size.size_label if p.size else ''} {p.size_unit.unit_name})"
 
             elif self.entity_type == "raw_material":
-                rm = RawMaterials.objects.select_related("unit").get(pk=self.entity_id)
+                rm = fetch(RawMaterials)
                 return f"{rm.name} ({rm.unit.unit_name}) - ₱{rm.price_per_unit}"
 
             elif self.entity_type == "product_batch":
-                pb = ProductBatches.objects.select_related(
-                    "product__product_type", "product__variant", "product__size", "product__size_unit"
-                ).get(pk=self.entity_id)
+                pb = fetch(ProductBatches)
                 return f"{pb.product.product_type.name} - {pb.product.variant.name} ({pb.product.size.size_label if pb.product.size else ''} {pb.product.size_unit.unit_name})"
 
             elif self.entity_type == "raw_material_batch":
-                rb = RawMaterialBatches.objects.select_related("material").get(pk=self.entity_id)
+                rb = fetch(RawMaterialBatches)
                 return f"{rb.material.name}"
 
             elif self.entity_type == "expense":
-                e = Expenses.objects.get(pk=self.entity_id)
+                e = fetch(Expenses)
                 return f"{e.category}"
 
             elif self.entity_type == "sale":
-                s = Sales.objects.get(pk=self.entity_id)
+                s = fetch(Sales)
                 # Format category to title case (e.g., ORDER -> Order)
                 category = s.category.replace('_', ' ').title() if s.category else s.category
                 return f"{category}"
 
             elif self.entity_type == "withdrawal":
                 try:
-                    w = Withdrawals.objects.get(pk=self.entity_id)
+                    w = fetch(Withdrawals)
                     return f"{w.get_reason_display()} - {w.quantity} {w.get_item_type_display()} ({w.get_sales_channel_display() or 'N/A'})"
                 except Withdrawals.DoesNotExist:
                     # If withdrawal is deleted, use data from history log details
@@ -223,41 +249,35 @@ class HistoryLog(models.Model):
                     return f"Deleted Withdrawal #{self.entity_id}"
 
             elif self.entity_type == "product_recipe":
-                pr = ProductRecipes.objects.select_related(
-                    "product__product_type",
-                    "product__variant",
-                    "product__size_unit",
-                    "product__size",
-                    "material"
-                ).get(pk=self.entity_id)
+                pr = fetch(ProductRecipes)
                 return f"{pr.product.product_type.name} - {pr.product.variant.name} ({pr.product.size.size_label if pr.product.size else ''} {pr.product.size_unit.unit_name})"
 
             elif self.entity_type == "product_type":
-                pt = ProductTypes.objects.get(pk=self.entity_id)
+                pt = fetch(ProductTypes)
                 return pt.name
 
             elif self.entity_type == "product_variant":
-                pv = ProductVariants.objects.get(pk=self.entity_id)
+                pv = fetch(ProductVariants)
                 return pv.name
 
             elif self.entity_type == "size":
-                sz = Sizes.objects.get(pk=self.entity_id)
+                sz = fetch(Sizes)
                 return sz.size_label
 
             elif self.entity_type == "size_unit":
-                su = SizeUnits.objects.get(pk=self.entity_id)
+                su = fetch(SizeUnits)
                 return f"Size Unit: {su.unit_name}"
 
             elif self.entity_type == "unit_price":
-                up = UnitPrices.objects.get(pk=self.entity_id)
+                up = fetch(UnitPrices)
                 return f"Unit Price: ₱{up.unit_price}"
 
             elif self.entity_type == "srp_price":
-                sp = SrpPrices.objects.get(pk=self.entity_id)
+                sp = fetch(SrpPrices)
                 return f"SRP Price: ₱{sp.srp_price}"
 
             elif self.entity_type == "user":
-                u = AuthUser.objects.get(pk=self.entity_id)
+                u = fetch(AuthUser)
                 full_name = f"{u.first_name} {u.last_name}".strip()
                 return f"{u.username}" + (f" ({full_name})" if full_name else "")
 
@@ -279,10 +299,10 @@ class HistoryLog(models.Model):
                             variant = before_data.get('variant_id', '')
                             size = before_data.get('size_id', '')
                             size_unit = before_data.get('size_unit_id', '')
-                            product_type_name = ProductTypes.objects.get(id=product_type).name if product_type else ''
-                            variant_name = ProductVariants.objects.get(id=variant).name if variant else ''
-                            size_label = Sizes.objects.get(id=size).size_label if size else ''
-                            size_unit_name = SizeUnits.objects.get(id=size_unit).unit_name if size_unit else ''
+                            product_type_name = resolve_item(self, ProductTypes, product_type).name if product_type else ''
+                            variant_name = resolve_item(self, ProductVariants, variant).name if variant else ''
+                            size_label = resolve_item(self, Sizes, size).size_label if size else ''
+                            size_unit_name = resolve_item(self, SizeUnits, size_unit).unit_name if size_unit else ''
                             
                             return f"Deleted ({product_type_name} - {variant_name} ({size_label} {size_unit_name}))"
                         except:
@@ -315,53 +335,36 @@ class HistoryLog(models.Model):
                 if key == "category" and isinstance(value, str):
                     return value.replace('_', ' ').title()
                 if key == "product_id":
-                    try:
-                        product = Products.objects.select_related("product_type", "variant", "size_unit", "size").get(id=value)
-                        return str(product)
-                    except Products.DoesNotExist:
-                        return f"Product #{value}"
+                    product = resolve_item(self, Products, value)
+                    return str(product) if product else f"Product #{value}"
 
                 if key == "variant_id":
-                    try:
-                        return ProductVariants.objects.get(id=value).name
-                    except ProductVariants.DoesNotExist:
-                        return f"Variant #{value}"
+                    variant = resolve_item(self, ProductVariants, value)
+                    return variant.name if variant else f"Variant #{value}"
 
                 if key == "product_type_id":
-                    try:
-                        return ProductTypes.objects.get(id=value).name
-                    except ProductTypes.DoesNotExist:
-                        return f"ProductType #{value}"
+                    product_type = resolve_item(self, ProductTypes, value)
+                    return product_type.name if product_type else f"ProductType #{value}"
 
                 if key == "size_id":
-                    try:
-                        return Sizes.objects.get(id=value).size_label
-                    except Sizes.DoesNotExist:
-                        return f"Size #{value}"
+                    size = resolve_item(self, Sizes, value)
+                    return size.size_label if size else f"Size #{value}"
 
                 if key in ("size_unit_id", "unit_id"):
-                    try:
-                        return SizeUnits.objects.get(id=value).unit_name
-                    except SizeUnits.DoesNotExist:
-                        return f"Unit #{value}"
+                    unit = resolve_item(self, SizeUnits, value)
+                    return unit.unit_name if unit else f"Unit #{value}"
 
                 if key == "material_id":
-                    try:
-                        return RawMaterials.objects.get(id=value).name
-                    except RawMaterials.DoesNotExist:
-                        return f"Material #{value}"
+                    material = resolve_item(self, RawMaterials, value)
+                    return material.name if material else f"Material #{value}"
 
                 if key == "srp_price_id":
-                    try:
-                        return str(SrpPrices.objects.get(id=value))
-                    except SrpPrices.DoesNotExist:
-                        return f"SRP #{value}"
+                    srp_price = resolve_item(self, SrpPrices, value)
+                    return str(srp_price) if srp_price else f"SRP #{value}"
 
                 if key == "unit_price_id":
-                    try:
-                        return str(UnitPrices.objects.get(id=value))
-                    except UnitPrices.DoesNotExist:
-                        return f"Unit Price #{value}"
+                    unit_price = resolve_item(self, UnitPrices, value)
+                    return str(unit_price) if unit_price else f"Unit Price #{value}"
 
                 return value
 
@@ -496,15 +499,7 @@ class Notifications(models.Model):
             if self.item_type.upper() == "PRODUCT":
         
                 if notif_type in ["EXPIRATION_ALERT", "EXPIRED_TODAY", "EXPIRES_IN_WEEK", "EXPIRES_IN_MONTH"]:
-                    batch = (
-                        ProductBatches.objects.filter(id=self.item_id)
-                        .select_related(
-                            "product__product_type",
-                            "product__variant",
-                            "product__size_unit",
-                            "product__size"
-                        ).first()
-                    )
+                    batch = resolve_item(self, ProductBatches, self.item_id)
                     if batch and batch.product:
                         p = batch.product
                         product_type = getattr(p.product_type, "name", "")
@@ -515,15 +510,7 @@ class Notifications(models.Model):
                         batch_date = batch.batch_date.strftime("%m/%d/%Y") if batch.batch_date else "Unknown"
                         item_name = f"{product_type} - {variant}{size_text} Batch {batch_date}"
                 else:
-                    product = (
-                        Products.objects.filter(id=self.item_id)
-                        .select_related(
-                            "product_type",
-                            "variant",
-                            "size_unit",
-                            "size"
-                        ).first()
-                    )
+                    product = resolve_item(self, Products, self.item_id)
                     if product:
                         product_type = getattr(product.product_type, "name", "")
                         variant = getattr(product.variant, "name", "")
@@ -534,11 +521,7 @@ class Notifications(models.Model):
 
             elif self.item_type.upper() == "RAW_MATERIAL":
                 if notif_type in ["EXPIRATION_ALERT", "EXPIRED_TODAY", "EXPIRES_IN_WEEK", "EXPIRES_IN_MONTH"]:
-                    batch = (
-                        RawMaterialBatches.objects.filter(id=self.item_id)
-                        .select_related("material__unit")
-                        .first()
-                    )
+                    batch = resolve_item(self, RawMaterialBatches, self.item_id)
                     if batch and batch.material:
                         material_name = getattr(batch.material, "name", "")
                         unit_name = getattr(batch.material.unit, "unit_name", "")
@@ -546,11 +529,7 @@ class Notifications(models.Model):
                         item_name = f"{material_name} ({unit_name}) Batch {batch_date}"
                 else:
 
-                    material = (
-                        RawMaterials.objects.filter(id=self.item_id)
-                        .select_related("unit")
-                        .first()
-                    )
+                    material = resolve_item(self, RawMaterials, self.item_id)
                     if material:
                         material_name = getattr(material, "name", "")
                         unit_name = getattr(material.unit, "unit_name", "")
@@ -576,11 +555,9 @@ class Notifications(models.Model):
 
         try:
             if self.item_type.upper() == "PRODUCT":
-                from .models import ProductBatches
-                batch = ProductBatches.objects.filter(id=self.item_id).first()
+                batch = resolve_item(self, ProductBatches, self.item_id)
             else:
-                from .models import RawMaterialBatches
-                batch = RawMaterialBatches.objects.filter(id=self.item_id).first()
+                batch = resolve_item(self, RawMaterialBatches, self.item_id)
 
             if not batch or not batch.expiration_date:
                 return "has no expiration date"
@@ -759,6 +736,13 @@ class Sales(models.Model):
     created_by_admin = models.ForeignKey(AuthUser, models.DO_NOTHING)
     is_archived = models.BooleanField(default=False) # <-- Idagdag ito
 
+    SOURCE_CHOICES = [
+        ('MANUAL', 'Manual'),
+        ('ORDER', 'Withdrawal Order'),
+    ]
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, default='MANUAL')
+    order_group_id = models.BigIntegerField(null=True, blank=True)
+
     class Meta:
         managed = False
         db_table = 'sales'
@@ -836,9 +820,9 @@ class StockChanges(models.Model):
         item_type = self.item_type.strip().lower()
 
         if item_type in ("raw", "raw_material", "rawmaterials"):
-            return RawMaterials.objects.filter(id=self.item_id).first()
+            return resolve_item(self, RawMaterials, self.item_id)
         elif item_type in ("product", "products"):
-            return Products.objects.filter(id=self.item_id).first()
+            return resolve_item(self, Products, self.item_id)
         return None
 
     @property
@@ -911,11 +895,14 @@ class UserActivity(models.Model):
         if not self.active:
             return False
         
-        if not self.last_activity:
+        # Include a heartbeat newer than the stored one
+        from realsproj import activity
+        last_activity = activity.merged_last_activity(self)
+        if not last_activity:
             return False
 
         time_threshold = timezone.now() - timedelta(minutes=5)
-        return self.last_activity >= time_threshold
+        return last_activity >= time_threshold
     
 
 class Withdrawals(models.Model):
@@ -1048,19 +1035,15 @@ class Withdrawals(models.Model):
 
     def get_item_display(self):
         if self.item_type == "PRODUCT":
-            from .models import Products
-            try:
-                product = Products.objects.get(id=self.item_id)
-                return str(product)
-            except Products.DoesNotExist:
+            product = resolve_item(self, Products, self.item_id)
+            if product is None:
                 return f"Unknown Product (ID {self.item_id})"
+            return str(product)
         elif self.item_type == "RAW_MATERIAL":
-            from .models import RawMaterials
-            try:
-                material = RawMaterials.objects.get(id=self.item_id)
-                return str(material)
-            except RawMaterials.DoesNotExist:
+            material = resolve_item(self, RawMaterials, self.item_id)
+            if material is None:
                 return f"Unknown Material (ID {self.item_id})"
+            return str(material)
         return f"Unknown Item (ID {self.item_id})"
 
     def compute_revenue(self):
@@ -1202,4 +1185,155 @@ class PriceHistory(models.Model):
         """Calculate absolute change in price"""
         if self.old_price:
             return self.new_price - self.old_price
-        return None
\ No newline at end of file
+        return None
+
+class DailyLedgerRollup(models.Model):
+    """
+    Materialized per-day totals for sales, expenses and withdrawals.
+
+    One row per (date, source, dimension, key, is_archived): the TOTAL
+    dimension holds the day's overall figures, CATEGORY/CHANNEL rows hold the
+    splits, and archived source rows are totalled separately. Maintained
+    by realsproj.ledger; rebuild with `manage.py rebuild_ledger`.
+    """
+    SOURCE_CHOICES = [
+        ('SALES', 'Sales'),
+        ('EXPENSES', 'Expenses'),
+        ('WITHDRAWALS', 'Withdrawals'),
+    ]
+    DIMENSION_CHOICES = [
+        ('TOTAL', 'Total'),
+        ('CATEGORY', 'Category'),
+        ('CHANNEL', 'Channel'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    date = models.DateField()
+    source = models.CharField(max_length=12, choices=SOURCE_CHOICES)
+    dimension = models.CharField(max_length=10, choices=DIMENSION_CHOICES, default='TOTAL')
+    key = models.CharField(max_length=255, blank=True, default='')
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    quantity = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+    is_archived = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'daily_ledger_rollup'
+        unique_together = (('date', 'source', 'dimension', 'key', 'is_archived'),)
+        indexes = [
+            models.Index(fields=['source', 'dimension', 'date'], name='ledger_source_dim_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.source} {self.dimension}:{self.key} ₱{self.amount}"
+
+
+class WithdrawalOrder(models.Model):
+    """
+    Header row for a grouped withdrawal order (ORDER/CONSIGNMENT/RESELLER).
+
+    Holds the order-level fields that are otherwise repeated on every line,
+    plus the computed total and the linked Sales entry. Kept in sync by
+    realsproj.orders whenever the order's withdrawals change.
+    """
+    order_group_id = models.BigIntegerField(primary_key=True)
+    customer_name = models.CharField(max_length=255, null=True, blank=True)
+    reason = models.CharField(max_length=20, choices=Withdrawals.REASON_CHOICES, null=True, blank=True)
+    sales_channel = models.CharField(
+        max_length=20, choices=Withdrawals.SALES_CHANNEL_CHOICES, null=True, blank=True
+    )
+    payment_status = models.CharField(
+        max_length=20, choices=Withdrawals.PAYMENT_STATUS_CHOICES, null=True, blank=True
+    )
+    paid_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    total_amount = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        help_text="Custom order price, or the sum of priced lines; NULL if unpriced"
+    )
+    total_quantity = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    line_count = models.IntegerField(default=0)
+    has_custom_price = models.BooleanField(default=False)
+    has_initial_pricing = models.BooleanField(default=False)
+    sales = models.ForeignKey(
+        Sales,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        db_column='sales_id',
+        db_constraint=False,  # sales is an externally managed table
+        related_name='+'
+    )
+    date = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'withdrawal_orders'
+        indexes = [
+            models.Index(fields=['-date'], name='withdrawal_orders_date_idx'),
+            models.Index(fields=['payment_status'], name='withdrawal_orders_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Order #{self.order_group_id} - {self.customer_name or 'N/A'}"
+
+
+class ScheduledJobRun(models.Model):
+    """
+    One run of a periodic job started by realsproj.scheduler.
+
+    A row is written (as RUNNING) by whichever node wins the job's advisory
+    lock for a scheduled slot; the unique (job_name, scheduled_for) pair is
+    what stops the other nodes from running the same slot again.
+    """
+    STATUS_CHOICES = [
+        ('RUNNING', 'Running'),
+        ('SUCCESS', 'Success'),
+        ('FAILED', 'Failed'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    job_name = models.CharField(max_length=100)
+    scheduled_for = models.DateTimeField()
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True, blank=True)
+    duration_seconds = models.FloatField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='RUNNING')
+    rows = models.IntegerField(null=True, blank=True, help_text="Rows the job reported as processed")
+    host = models.CharField(max_length=255, blank=True, default='')
+    error = models.TextField(blank=True, default='')
+
+    class Meta:
+        db_table = 'scheduled_job_runs'
+        unique_together = (('job_name', 'scheduled_for'),)
+        indexes = [
+            models.Index(fields=['job_name', '-started_at'], name='job_runs_name_started_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.job_name} @ {self.scheduled_for} ({self.status})"
+
+
+class ProductSearch(models.Model):
+    """
+    Denormalized search text of a product (type, variant, size, unit and
+    barcode, lowercased), trigram-indexed on PostgreSQL. Kept in sync by
+    realsproj.search whenever a product or one of its attributes is saved.
+    """
+    product = models.OneToOneField(
+        Products,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        db_constraint=False,  # products is an externally managed table
+        related_name='search_document'
+    )
+    document = models.TextField()
+
+    class Meta:
+        db_table = 'product_search'
+
+    def __str__(self):
+        return self.document
@@ -0,0 +1,122 @@
+"""
+Cached notification dropdown for the page header.
+
+``notifications_context`` runs on every rendered page. Rendering the five
+latest notifications means resolving their products/batches and building
+their messages, so the rendered dropdown is cached and each request only
+runs one aggregate query: the newest notification id plus the unread
+count.
+
+That pair is part of the cache key. A new notification (including ones
+inserted by database triggers) raises the id, and marking notifications read
+changes the count, so the dropdown is rebuilt exactly when it can differ.
+The day is in the key too, because expiration messages are relative to
+today. ``invalidate()`` drops the cached copy explicitly, e.g. after editing
+the item a notification points at. The cache is per process, so that
+version is a Postgres sequence (``notification_header_version_seq``,
+migration 0022) advanced when the transaction commits; every process
+reads it at most every ``CHECK_INTERVAL`` seconds, as the barcode index
+does. On databases without sequences it is kept in memory.
+"""
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from realsproj.models import Notifications
+from realsproj.resolver import ItemResolver
+
+
+HEADER_SIZE = 5
+
+CACHE_PREFIX = "notification_header"
+VERSION_SEQUENCE = "notification_header_version_seq"
+TIMEOUT = 300
+
+# Seconds a process trusts its version before reading it again.
+CHECK_INTERVAL = 1.0
+
+_lock = threading.Lock()
+_current_version = None
+_checked_at = 0.0
+_local_version = 1
+
+
+def _read_version():
+    if connection.vendor != "postgresql":
+        return _local_version
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT last_value FROM {VERSION_SEQUENCE}")
+        return cursor.fetchone()[0]
+
+
+def _version():
+    global _current_version, _checked_at
+    with _lock:
+        now = time.monotonic()
+        if _current_version is None or now - _checked_at >= CHECK_INTERVAL:
+            _current_version = _read_version()
+            _checked_at = now
+        return _current_version
+
+
+def _bump():
+    global _current_version, _local_version
+    if connection.vendor != "postgresql":
+        _local_version += 1
+        version = _local_version
+    else:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT nextval(%s)", [VERSION_SEQUENCE])
+            version = cursor.fetchone()[0]
+    with _lock:
+        _current_version = max(_current_version or 0, version)
+
+
+def invalidate():
+    """Force every process to rebuild the dropdown once the transaction commits."""
+    # One bump per transaction, however many notifications it wrote.
+    if connection.in_atomic_block and any(entry[1] == _bump for entry in connection.run_on_commit):
+        return
+    transaction.on_commit(_bump)
+
+
+def render_items(notifications):
+    """Plain dicts with everything the header template reads."""
+    notifications = ItemResolver().attach(notifications)
+    return [
+        {
+            "id": notif.id,
+            "is_read": notif.is_read,
+            "css_class": notif.css_class,
+            "icon_class": notif.icon_class,
+            "formatted_message": notif.formatted_message,
+            "notification_timestamp": notif.notification_timestamp,
+        }
+        for notif in notifications
+    ]
+
+
+def header_summary():
+    """
+    Return ``{"items": [...], "unread_count": n}`` for the header dropdown.
+
+    Costs one query when the cached dropdown is current.
+    """
+    state = Notifications.objects.aggregate(
+        latest_id=Max("id"),
+        unread_count=Count("id", filter=Q(is_read=False)),
+    )
+    unread_count = state["unread_count"] or 0
+    key = (
+        f"{CACHE_PREFIX}:{_version()}:{state['latest_id'] or 0}:"
+        f"{unread_count}:{timezone.localdate().isoformat()}"
+    )
+    items = cache.get(key)
+    if items is None:
+        items = render_items(Notifications.objects.order_by("-created_at")[:HEADER_SIZE])
+        cache.set(key, items, TIMEOUT)
+    return {"items": items, "unread_count": unread_count}
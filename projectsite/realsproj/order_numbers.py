@@ -0,0 +1,77 @@
+"""
+Order number (``order_group_id``) allocation.
+
+Numbers come from the ``withdrawal_order_number_seq`` Postgres sequence,
+so two cashiers checking out at the same moment can never get the same
+number and allocating one costs no table scan. Each process reserves a
+block of ``ORDER_NUMBER_BLOCK_SIZE`` numbers per round trip and hands them
+out from memory. Numbers stay unique but are not gap-free: a process that
+exits loses the rest of its block, and with several workers the numbers of
+concurrent orders interleave.
+
+On databases without sequences (local SQLite) numbers continue from the
+highest id in use, under a process-wide lock.
+
+Anything that creates order ids by other means (e.g. restoring a backup)
+should call ``sync_sequence()`` afterwards.
+"""
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max
+
+from realsproj.models import WithdrawalOrder, Withdrawals
+
+
+SEQUENCE = "withdrawal_order_number_seq"
+
+_lock = threading.Lock()
+_reserved = deque()
+_high_water = 0
+
+
+def block_size():
+    return max(1, getattr(settings, "ORDER_NUMBER_BLOCK_SIZE", 10))
+
+
+def highest_in_use():
+    return max(
+        Withdrawals.objects.aggregate(value=Max("order_group_id"))["value"] or 0,
+        WithdrawalOrder.objects.aggregate(value=Max("order_group_id"))["value"] or 0,
+    )
+
+
+def _reserve(count):
+    global _high_water
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT nextval(%s) FROM generate_series(1, %s)", [SEQUENCE, count])
+            return [row[0] for row in cursor.fetchall()]
+    start = max(highest_in_use(), _high_water) + 1
+    _high_water = start + count - 1
+    return list(range(start, start + count))
+
+
+def next_order_number():
+    """Allocate a new, never-used ``order_group_id``."""
+    with _lock:
+        if not _reserved:
+            _reserved.extend(_reserve(block_size()))
+        return _reserved.popleft()
+
+
+def sync_sequence():
+    """Move the sequence past every id in use and drop reserved blocks."""
+    global _high_water
+    with _lock:
+        _reserved.clear()
+        _high_water = 0
+        if connection.vendor != "postgresql":
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT setval(%s, GREATEST(%s, (SELECT last_value FROM " + SEQUENCE + ")))",
+                [SEQUENCE, highest_in_use() or 1],
+            )
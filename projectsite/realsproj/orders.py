@@ -0,0 +1,255 @@
+"""
+Order headers for grouped withdrawals.
+
+Every withdrawal line of an ORDER/CONSIGNMENT/RESELLER sale shares an
+``order_group_id``. ``WithdrawalOrder`` keeps one header per group with the
+customer, channel, payment status, computed total and linked Sales entry, so
+order pages and sales summaries read a single row instead of re-pricing
+every line and searching Sales descriptions.
+
+Headers are re-synced from their lines whenever a line is saved or deleted
+(see signals.py). Views that touch many lines wrap the work in ``batch()``
+so each affected order is synced once, at the end.
+
+The Sales link is set when the Sales entry is written (``link_sales()``,
+or the Sales save signal for entries that carry an ``order_group_id``), so
+syncing an order never searches Sales; only a header built for a legacy
+order looks its entry up once.
+"""
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import transaction
+
+from realsproj.models import Discounts, Products, Sales, WithdrawalOrder, Withdrawals
+
+
+ORDER_CHANNELS = ("ORDER", "CONSIGNMENT", "RESELLER")
+
+_state = threading.local()
+
+
+# ----------------------------------------------------------------------
+# Pricing
+# ----------------------------------------------------------------------
+def line_prices(lines):
+    """
+    Return ``{withdrawal_id: (unit_price, subtotal)}`` for priced lines.
+
+    Stored prices are used when present; older lines are priced from the
+    product's current unit/SRP price less discount, with products and
+    discounts loaded in one query each.
+    """
+    legacy = [w for w in lines if w.price_type and (w.total_amount is None or w.final_price_per_unit is None)]
+    product_ids = {w.item_id for w in legacy if w.item_type == "PRODUCT"}
+    discount_ids = {w.discount_id for w in legacy if w.discount_id}
+    products = (
+        Products.objects.select_related("unit_price", "srp_price").in_bulk(product_ids)
+        if product_ids else {}
+    )
+    discounts = Discounts.objects.in_bulk(discount_ids) if discount_ids else {}
+
+    prices = {}
+    for w in lines:
+        if not w.price_type:
+            continue
+        if w.total_amount is not None and w.final_price_per_unit is not None:
+            prices[w.id] = (w.final_price_per_unit, w.total_amount)
+            continue
+
+        product = products.get(w.item_id)
+        if product is None:
+            continue
+        if w.price_type == "UNIT":
+            base_price = product.unit_price.unit_price
+        elif w.price_type == "SRP":
+            base_price = product.srp_price.srp_price
+        else:
+            continue
+
+        discount_percent = Decimal(0)
+        discount = discounts.get(w.discount_id) if w.discount_id else None
+        if discount is not None:
+            discount_percent = Decimal(discount.value)
+        elif w.custom_discount_value:
+            discount_percent = Decimal(w.custom_discount_value)
+
+        final_price = base_price * (1 - (discount_percent / 100))
+        prices[w.id] = (final_price, Decimal(w.quantity) * final_price)
+    return prices
+
+
+def order_total(lines, prices=None):
+    """
+    Total for an order's lines.
+
+    A custom price is the total for the whole order; otherwise the priced
+    lines are summed. Returns None when nothing in the order is priced.
+    """
+    for w in lines:
+        if w.custom_price:
+            return Decimal(w.custom_price)
+    if prices is None:
+        prices = line_prices(lines)
+    if not prices:
+        return None
+    return sum((subtotal for _, subtotal in prices.values()), Decimal(0))
+
+
+# ----------------------------------------------------------------------
+# Sales link
+# ----------------------------------------------------------------------
+def find_order_sales(order_group_id):
+    """First active Sales entry recorded for an order."""
+    return Sales.objects.filter(
+        is_archived=False, order_group_id=order_group_id
+    ).order_by("id").first()
+
+
+def link_sales(order_group_id, sales):
+    """Point the order header at its Sales entry."""
+    if not order_group_id:
+        return
+    WithdrawalOrder.objects.filter(pk=order_group_id).update(sales=sales)
+
+
+def sales_saved(sales):
+    """Link a newly recorded Sales entry to its order if it has none yet."""
+    if not sales.order_group_id or sales.is_archived:
+        return
+    WithdrawalOrder.objects.filter(pk=sales.order_group_id, sales__isnull=True).update(sales=sales)
+
+
+# ----------------------------------------------------------------------
+# Sync
+# ----------------------------------------------------------------------
+def _apply_lines(order, lines, prices=None):
+    first = lines[0]
+    order.customer_name = first.customer_name
+    order.reason = first.reason
+    order.sales_channel = first.sales_channel
+    order.payment_status = first.payment_status
+    order.paid_amount = first.paid_amount
+    order.date = first.date
+    order.line_count = len(lines)
+    order.total_quantity = sum((Decimal(w.quantity) for w in lines), Decimal(0))
+    order.has_custom_price = any(w.custom_price for w in lines)
+    order.has_initial_pricing = any(w.price_type or w.custom_price for w in lines)
+    order.total_amount = order_total(lines, prices)
+
+
+def sync_order(order_group_id):
+    """
+    Rebuild one order header from its active lines.
+
+    Runs in a transaction holding the header row lock. The header is
+    removed once the order has no active lines left. Returns the header,
+    or None.
+    """
+    if not order_group_id:
+        return None
+    with transaction.atomic():
+        lines = list(
+            Withdrawals.objects.filter(order_group_id=order_group_id, is_archived=False).order_by("id")
+        )
+        if not lines:
+            WithdrawalOrder.objects.filter(pk=order_group_id).delete()
+            return None
+
+        order, created = WithdrawalOrder.objects.select_for_update().get_or_create(pk=order_group_id)
+        _apply_lines(order, lines)
+        if created:
+            order.sales = find_order_sales(order_group_id)
+        order.save()
+        return order
+
+
+def get_order(order_group_id):
+    """Return the order header, building it first for legacy orders."""
+    if not order_group_id:
+        return None
+    order = WithdrawalOrder.objects.select_related("sales").filter(pk=order_group_id).first()
+    if order is None:
+        order = sync_order(order_group_id)
+    return order
+
+
+def mark_changed(order_group_id):
+    """Sync an order now, or at the end of the enclosing ``batch()``."""
+    if not order_group_id:
+        return
+    pending = getattr(_state, "pending", None)
+    if pending is not None:
+        pending.add(order_group_id)
+    else:
+        sync_order(order_group_id)
+
+
+def affected_orders(queryset):
+    """Distinct order ids touched by a withdrawals queryset (call before bulk updates)."""
+    return set(
+        queryset.order_by().filter(order_group_id__isnull=False)
+        .values_list("order_group_id", flat=True).distinct()
+    )
+
+
+def sync_orders(order_group_ids):
+    for order_group_id in sorted(order_group_ids):
+        sync_order(order_group_id)
+
+
+@contextmanager
+def batch():
+    """Defer header syncs until the block exits, syncing each order once."""
+    if getattr(_state, "pending", None) is not None:
+        yield
+        return
+    _state.pending = set()
+    try:
+        yield
+        pending = _state.pending
+    finally:
+        _state.pending = None
+    sync_orders(pending)
+
+
+def rebuild():
+    """Rebuild every order header from the withdrawals table in bulk."""
+    lines_by_order = {}
+    for w in Withdrawals.objects.filter(order_group_id__isnull=False, is_archived=False).order_by("order_group_id", "id"):
+        lines_by_order.setdefault(w.order_group_id, []).append(w)
+
+    all_lines = [w for lines in lines_by_order.values() for w in lines]
+    prices = line_prices(all_lines)
+
+    existing_links = dict(
+        WithdrawalOrder.objects.filter(sales__isnull=False).values_list("order_group_id", "sales_id")
+    )
+    order_sales = {}
+    for order_group_id, sale_id in Sales.objects.filter(
+        is_archived=False, order_group_id__isnull=False
+    ).order_by("id").values_list("order_group_id", "id"):
+        order_sales.setdefault(order_group_id, sale_id)
+
+    headers = []
+    for order_group_id, lines in lines_by_order.items():
+        order = WithdrawalOrder(order_group_id=order_group_id)
+        _apply_lines(order, lines, {w.id: prices[w.id] for w in lines if w.id in prices})
+        order.sales_id = existing_links.get(order_group_id) or order_sales.get(order_group_id)
+        headers.append(order)
+
+    with transaction.atomic():
+        WithdrawalOrder.objects.exclude(pk__in=list(lines_by_order)).delete()
+        WithdrawalOrder.objects.bulk_create(
+            headers,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=["order_group_id"],
+            update_fields=[
+                "customer_name", "reason", "sales_channel", "payment_status", "paid_amount",
+                "total_amount", "total_quantity", "line_count", "has_custom_price",
+                "has_initial_pricing", "sales", "date", "updated_at",
+            ],
+        )
+    return len(headers)
@@ -0,0 +1,130 @@
+"""
+Production runs: many product batches created at once.
+
+``plan()`` works out what a run consumes before anything is written: the
+recipes of all submitted products are loaded in one query and summed into
+the total demand per raw material (``quantity_needed * qty /
+yield_factor``), which is checked against the locked inventory rows in one
+pass. Every shortfall is reported together, instead of stopping at the
+first product whose trigger raises "Not enough stock".
+
+``produce()`` then inserts all batches with one ``bulk_create``, each with
+the submitted ``deduct_raw_material`` flag. The deduction itself stays
+with the product_batches insert trigger, along with everything else it
+does; the plan only guarantees, under the row locks, that the trigger
+will find enough stock. A run that cannot be covered raises
+``InsufficientStock`` with every shortfall, and nothing is written.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+
+from realsproj import stock_alerts
+from realsproj.models import ProductBatches, ProductRecipes, RawMaterialInventory
+
+
+class InsufficientStock(Exception):
+    """Raised by ``produce()`` when raw materials do not cover the run."""
+
+    def __init__(self, shortfalls):
+        self.shortfalls = shortfalls
+        super().__init__("; ".join(str(shortfall) for shortfall in shortfalls))
+
+
+class Shortfall:
+    def __init__(self, material, needed, available):
+        self.material = material
+        self.needed = needed
+        self.available = available
+
+    @property
+    def missing(self):
+        return self.needed - self.available
+
+    def __str__(self):
+        unit = getattr(self.material.unit, "unit_name", "")
+        return (
+            f"❌ Not enough stock for {self.material.name}: need {self.needed:,.2f} {unit}, "
+            f"have {self.available:,.2f} {unit} (short {self.missing:,.2f})"
+        )
+
+
+class ProductionPlan:
+    def __init__(self, quantities):
+        self.quantities = quantities  # {product: qty}
+        self.demand = {}              # {material_id: Decimal}
+        self.materials = {}           # {material_id: RawMaterials}
+        self.shortfalls = []
+
+    @property
+    def ok(self):
+        return not self.shortfalls
+
+
+def material_demand(quantities):
+    """
+    Total raw material use of ``{product_id: qty}``; returns
+    ``({material_id: Decimal}, {material_id: RawMaterials})``.
+    """
+    demand, materials = {}, {}
+    recipes = ProductRecipes.objects.filter(product_id__in=quantities).select_related("material__unit")
+    for recipe in recipes:
+        yield_factor = recipe.yield_factor or Decimal(1)
+        needed = recipe.quantity_needed * Decimal(quantities[recipe.product_id]) / yield_factor
+        demand[recipe.material_id] = demand.get(recipe.material_id, Decimal(0)) + needed
+        materials[recipe.material_id] = recipe.material
+    return demand, materials
+
+
+def plan(quantities, deduct_raw_material=True, lock=False):
+    """
+    Build a ProductionPlan for ``{product: qty}``. With ``lock`` (inside a
+    transaction) the inventory rows are locked until it ends.
+    """
+    production = ProductionPlan(quantities)
+    if not deduct_raw_material or not quantities:
+        return production
+
+    production.demand, production.materials = material_demand(
+        {product.id: qty for product, qty in quantities.items()}
+    )
+    inventory = RawMaterialInventory.objects.filter(pk__in=list(production.demand)).order_by("pk")
+    if lock:
+        inventory = inventory.select_for_update()
+    stock = dict(inventory.values_list("pk", "total_stock"))
+
+    for material_id, needed in sorted(production.demand.items()):
+        available = stock.get(material_id) or Decimal(0)
+        if needed > available:
+            production.shortfalls.append(
+                Shortfall(production.materials[material_id], needed, available)
+            )
+    production.shortfalls.sort(key=lambda s: s.material.name)
+    return production
+
+
+def produce(quantities, user, manufactured_date, batch_date, deduct_raw_material=True):
+    """
+    Create one batch per ``{product: qty}`` entry in one transaction and
+    return the ProductionPlan. Raises InsufficientStock (writing nothing)
+    when the raw materials do not cover the run.
+    """
+    with transaction.atomic():
+        production = plan(quantities, deduct_raw_material, lock=True)
+        if not production.ok:
+            raise InsufficientStock(production.shortfalls)
+        ProductBatches.objects.bulk_create([
+            ProductBatches(
+                product=product,
+                quantity=qty,
+                batch_date=batch_date,
+                manufactured_date=manufactured_date,
+                created_by_admin=user,
+                deduct_raw_material=deduct_raw_material,
+            )
+            for product, qty in quantities.items()
+        ])
+        # bulk_create skips the batch signals.
+        stock_alerts.mark_changed("PRODUCT", [product.id for product in quantities])
+        stock_alerts.mark_changed("RAW_MATERIAL", list(production.demand))
+    return production
@@ -0,0 +1,198 @@
+"""
+Batched item lookups for list pages.
+
+Withdrawals, stock changes, notifications and history log rows reference
+products, materials and batches by ``(item_type, item_id)`` rather than by
+foreign key, so rendering a page used to cost one query per row (or several
+per history log row). ``ItemResolver`` collects every reference on a page,
+loads each referenced model with one ``in_bulk`` query, and attaches itself
+to the rows; their display methods then read from its identity map through
+``models.resolve_item``.
+
+One resolver is kept per request (``for_request``) so the row lists
+rendered for one page share loaded rows. The header notification dropdown
+is not among them: it is cached across requests
+(``realsproj.notification_header``) and resolves its rows with a resolver
+of its own when it is rebuilt.
+"""
+from django.core.exceptions import ValidationError
+
+from realsproj.models import (
+    ITEM_SELECT_RELATED,
+    AuthUser,
+    Expenses,
+    HistoryLog,
+    Notifications,
+    ProductBatches,
+    ProductRecipes,
+    Products,
+    ProductTypes,
+    ProductVariants,
+    RawMaterialBatches,
+    RawMaterials,
+    Sales,
+    Sizes,
+    SizeUnits,
+    SrpPrices,
+    StockChanges,
+    UnitPrices,
+    Withdrawals,
+)
+
+
+# HistoryLog.entity_type -> model
+ENTITY_MODELS = {
+    "product": Products,
+    "raw_material": RawMaterials,
+    "product_batch": ProductBatches,
+    "raw_material_batch": RawMaterialBatches,
+    "expense": Expenses,
+    "sale": Sales,
+    "withdrawal": Withdrawals,
+    "product_recipe": ProductRecipes,
+    "product_type": ProductTypes,
+    "product_variant": ProductVariants,
+    "size": Sizes,
+    "size_unit": SizeUnits,
+    "unit_price": UnitPrices,
+    "srp_price": SrpPrices,
+    "user": AuthUser,
+}
+
+# HistoryLog.details keys humanized through a lookup -> model
+DETAIL_FK_MODELS = {
+    "product_id": Products,
+    "variant_id": ProductVariants,
+    "product_type_id": ProductTypes,
+    "size_id": Sizes,
+    "size_unit_id": SizeUnits,
+    "unit_id": SizeUnits,
+    "material_id": RawMaterials,
+    "srp_price_id": SrpPrices,
+    "unit_price_id": UnitPrices,
+}
+
+EXPIRATION_TYPES = ("EXPIRATION_ALERT", "EXPIRED_TODAY", "EXPIRES_IN_WEEK", "EXPIRES_IN_MONTH")
+
+
+def _normalize_pk(model, pk):
+    try:
+        return model._meta.pk.to_python(pk)
+    except (TypeError, ValueError, ValidationError):
+        return None
+
+
+class ItemResolver:
+    """Identity map of referenced rows, keyed by model and primary key."""
+
+    def __init__(self):
+        self._cache = {}
+
+    def get(self, model, pk):
+        """Return the cached row (loading it if needed), or None if missing."""
+        pk = _normalize_pk(model, pk)
+        if pk is None:
+            return None
+        cache = self._cache.setdefault(model, {})
+        if pk not in cache:
+            self.load(model, [pk])
+        return cache.get(pk)
+
+    def load(self, model, ids):
+        """Load every not-yet-cached id of ``model`` in one query."""
+        cache = self._cache.setdefault(model, {})
+        missing = set()
+        for pk in ids:
+            pk = _normalize_pk(model, pk)
+            if pk is not None and pk not in cache:
+                missing.add(pk)
+        if not missing:
+            return
+        found = model.objects.select_related(
+            *ITEM_SELECT_RELATED.get(model.__name__, ())
+        ).in_bulk(missing)
+        for pk in missing:
+            cache[pk] = found.get(pk)
+
+    def attach(self, objects):
+        """
+        Prefetch everything ``objects`` will look up and attach the resolver.
+
+        Returns the objects as a list.
+        """
+        objects = list(objects)
+        refs = {}
+        for obj in objects:
+            for model, pk in _references(obj):
+                if pk is not None:
+                    refs.setdefault(model, set()).add(pk)
+            obj._resolver = self
+        for model, ids in refs.items():
+            self.load(model, ids)
+        return objects
+
+
+def _references(obj):
+    """Yield the ``(model, pk)`` pairs a row's display methods will look up."""
+    if isinstance(obj, Withdrawals):
+        if obj.item_type == "PRODUCT":
+            yield Products, obj.item_id
+        elif obj.item_type == "RAW_MATERIAL":
+            yield RawMaterials, obj.item_id
+
+    elif isinstance(obj, StockChanges):
+        item_type = (obj.item_type or "").lower()
+        if item_type in ("raw", "raw_material", "rawmaterials"):
+            yield RawMaterials, obj.item_id
+        elif item_type in ("product", "products"):
+            yield Products, obj.item_id
+
+    elif isinstance(obj, Notifications):
+        if obj.item_id is None:
+            return
+        item_type = (obj.item_type or "").upper()
+        if (obj.notification_type or "").upper() in EXPIRATION_TYPES:
+            yield (ProductBatches if item_type == "PRODUCT" else RawMaterialBatches), obj.item_id
+        elif item_type == "PRODUCT":
+            yield Products, obj.item_id
+        elif item_type == "RAW_MATERIAL":
+            yield RawMaterials, obj.item_id
+
+    elif isinstance(obj, HistoryLog):
+        model = ENTITY_MODELS.get(obj.entity_type)
+        if model is not None:
+            yield model, obj.entity_id
+        details = obj.details if isinstance(obj.details, dict) else {}
+        for section in ("before", "after"):
+            data = details.get(section)
+            if isinstance(data, dict):
+                for key, value in data.items():
+                    if key in DETAIL_FK_MODELS and value not in (None, ""):
+                        yield DETAIL_FK_MODELS[key], value
+
+
+def for_request(request):
+    """The resolver shared by everything rendered for ``request``."""
+    resolver = getattr(request, "_item_resolver", None)
+    if resolver is None:
+        resolver = request._item_resolver = ItemResolver()
+    return resolver
+
+
+def attach_page(request, context):
+    """
+    Resolve the rows of a ListView page, in place in ``context``.
+
+    The page's queryset is evaluated once and every context name that
+    pointed at it (``object_list``, the view's ``context_object_name``,
+    ``page_obj.object_list``) is replaced with the resolved list.
+    """
+    original = context["object_list"]
+    rows = for_request(request).attach(original)
+    for name, value in list(context.items()):
+        if value is original:
+            context[name] = rows
+    page_obj = context.get("page_obj")
+    if page_obj is not None:
+        page_obj.object_list = rows
+    return rows
@@ -0,0 +1,211 @@
+"""
+In-process scheduler for periodic jobs (``manage.py start_scheduler``).
+
+Jobs are registered with ``@register(name, at="HH:MM")`` (daily, local
+time) or ``@register(name, every=seconds)``. Every node may run the
+scheduler; a background thread wakes up every ``POLL_SECONDS`` and, for each
+job whose latest slot has not been handled yet:
+
+1. takes a Postgres advisory lock named after the job
+   (``pg_try_advisory_lock``), so only one node works on a job at a time;
+2. checks ``ScheduledJobRun`` for a row for that slot, since another node
+   may already have run it, and otherwise inserts one as RUNNING;
+3. runs the job and records the outcome, duration and the row count the
+   job returned.
+
+A slot missed while no scheduler was running (only the most recent one) is
+run at the next start, which is safe because the jobs are idempotent. On
+databases without advisory locks the lock step is skipped (single node).
+"""
+import hashlib
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from django.db import IntegrityError, close_old_connections, connection
+from django.utils import timezone
+
+from realsproj.models import ScheduledJobRun
+
+
+POLL_SECONDS = 30
+HISTORY_DAYS = 90
+
+JOBS = {}
+
+_thread = None
+_stop = threading.Event()
+
+
+class Job:
+    def __init__(self, name, func, at=None, every=None):
+        if (at is None) == (every is None):
+            raise ValueError(f"Job {name} needs exactly one of at= or every=")
+        self.name = name
+        self.func = func
+        self.at = datetime.strptime(at, "%H:%M").time() if at else None
+        self.every = every
+        self.done_slot = None
+
+    def describe(self):
+        if self.at:
+            return f"daily at {self.at.strftime('%H:%M')}"
+        return f"every {self.every} seconds"
+
+    def slot(self, now):
+        """Start of the most recent scheduled slot at or before ``now``."""
+        if self.every:
+            return datetime.fromtimestamp(
+                int(now.timestamp()) // self.every * self.every, tz=now.tzinfo
+            )
+        local = timezone.localtime(now)
+        slot = local.replace(hour=self.at.hour, minute=self.at.minute, second=0, microsecond=0)
+        if slot > local:
+            slot = timezone.make_aware(datetime.combine(slot.date() - timedelta(days=1), self.at))
+        return slot
+
+
+def register(name, at=None, every=None):
+    """Decorator adding a periodic job; the function may return a row count."""
+    def decorator(func):
+        JOBS[name] = Job(name, func, at=at, every=every)
+        return func
+    return decorator
+
+
+# ----------------------------------------------------------------------
+# Leader election
+# ----------------------------------------------------------------------
+def lock_key(name):
+    """Stable signed 64-bit advisory lock key for a job name."""
+    digest = hashlib.sha256(f"realsproj.scheduler:{name}".encode()).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+
+def try_lock(name):
+    if connection.vendor != "postgresql":
+        return True
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", [lock_key(name)])
+        return cursor.fetchone()[0]
+
+
+def unlock(name):
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_unlock(%s)", [lock_key(name)])
+
+
+# ----------------------------------------------------------------------
+# Running
+# ----------------------------------------------------------------------
+def run_job(job, slot):
+    """
+    Run ``job`` for ``slot`` unless another node holds it or already ran it.
+
+    Returns the ScheduledJobRun row, or None if the slot was skipped.
+    """
+    if not try_lock(job.name):
+        return None
+    try:
+        if ScheduledJobRun.objects.filter(job_name=job.name, scheduled_for=slot).exists():
+            job.done_slot = slot
+            return None
+        try:
+            run = ScheduledJobRun.objects.create(
+                job_name=job.name,
+                scheduled_for=slot,
+                started_at=timezone.now(),
+                host=socket.gethostname(),
+            )
+        except IntegrityError:
+            job.done_slot = slot
+            return None
+
+        started = time.monotonic()
+        try:
+            rows = job.func()
+            run.status = "SUCCESS"
+            run.rows = rows if isinstance(rows, int) else None
+        except Exception as e:
+            run.status = "FAILED"
+            run.error = traceback.format_exc()
+            print(f"❌ Scheduled job {job.name} failed: {str(e)}")
+        run.finished_at = timezone.now()
+        run.duration_seconds = round(time.monotonic() - started, 3)
+        run.save(update_fields=["status", "rows", "error", "finished_at", "duration_seconds"])
+        job.done_slot = slot
+        return run
+    finally:
+        unlock(job.name)
+
+
+def tick(now=None):
+    """Run every job whose latest slot has not been handled by this process."""
+    now = now or timezone.now()
+    close_old_connections()
+    for job in list(JOBS.values()):
+        if _stop.is_set():
+            break
+        slot = job.slot(now)
+        if job.done_slot == slot:
+            continue
+        try:
+            run_job(job, slot)
+        except Exception as e:
+            print(f"❌ Scheduler error for {job.name}: {str(e)}")
+    close_old_connections()
+
+
+def _loop():
+    while not _stop.is_set():
+        tick()
+        _stop.wait(POLL_SECONDS)
+
+
+def start_scheduler():
+    """Start the scheduler thread (once per process) and return it."""
+    global _thread
+    if _thread is None or not _thread.is_alive():
+        _stop.clear()
+        _thread = threading.Thread(target=_loop, name="realsproj-scheduler", daemon=True)
+        _thread.start()
+    return _thread
+
+
+def stop_scheduler(timeout=None):
+    """Ask the scheduler thread to stop after the job it is running."""
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout)
+
+
+# ----------------------------------------------------------------------
+# Jobs
+# ----------------------------------------------------------------------
+@register("check_expirations", at="00:00")
+def check_expirations():
+    from realsproj.expirations import ExpirationRun, system_user
+
+    user = system_user()
+    if not user:
+        raise RuntimeError("No user found to create withdrawals")
+    run = ExpirationRun(user=user).apply()
+    return run.expired_count + sum(len(rows) for rows in run.alerts.values())
+
+
+@register("stock_alerts", at="00:30")
+def stock_alerts_sweep():
+    from realsproj import stock_alerts
+
+    return stock_alerts.sweep()
+
+
+@register("prune_job_runs", at="03:00")
+def prune_job_runs():
+    cutoff = timezone.now() - timedelta(days=HISTORY_DAYS)
+    deleted, _ = ScheduledJobRun.objects.filter(started_at__lt=cutoff).delete()
+    return deleted
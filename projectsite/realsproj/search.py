@@ -0,0 +1,163 @@
+"""
+Product search shared by the product, inventory, batch and price history
+lists and the typeahead endpoint.
+
+Searching used to be ``icontains`` over three joined tables (type, variant,
+size); a leading-wildcard ILIKE cannot use an index, so every search scanned
+and joined the whole catalog. Each product now has one ``ProductSearch``
+row holding its search text (type, variant, size, unit and barcode,
+lowercased), and searches only read that table.
+
+On PostgreSQL the text has a ``gin_trgm_ops`` index (migration 0018). A
+product matches when every word of the query occurs in its text (``LIKE
+'%word%'``, answered by the trigram index) or when the query is similar
+enough to part of it (``document %> query``, pg_trgm word similarity), which
+tolerates typos like "mangoe". Results are ranked by word similarity. Other
+databases (SQLite test runs) fall back to the substring match only, ranked
+by whether the text starts with the query.
+
+The rows are refreshed by signals (see signals.py) when a product, product
+type, variant, size or size unit is saved; ``rebuild()`` (``manage.py
+rebuild_search_index``) recreates them all.
+"""
+from django.db import connection
+from django.db.models import Case, F, IntegerField, Q, Value, When
+
+from realsproj.models import (
+    Products, ProductSearch, ProductTypes, ProductVariants, Sizes, SizeUnits
+)
+
+
+SUGGEST_LIMIT = 10
+
+PRODUCT_SELECT_RELATED = ("product_type", "variant", "size", "size_unit")
+
+# attribute model -> the Products foreign key pointing at it
+ATTRIBUTE_FIELDS = {
+    ProductTypes: "product_type",
+    ProductVariants: "variant",
+    Sizes: "size",
+    SizeUnits: "size_unit",
+}
+
+
+def normalize(text):
+    return " ".join(str(text).lower().split())
+
+
+def document(product):
+    """The search text of ``product`` (its attributes must be loaded)."""
+    parts = [
+        product.product_type.name,
+        product.variant.name,
+        product.size.size_label if product.size_id else None,
+        product.size_unit.unit_name,
+        product.barcode,
+    ]
+    return normalize(" ".join(part for part in parts if part))
+
+
+def _save(products):
+    ProductSearch.objects.bulk_create(
+        [ProductSearch(product_id=product.pk, document=document(product)) for product in products],
+        update_conflicts=True,
+        unique_fields=["product"],
+        update_fields=["document"],
+    )
+
+
+def refresh(product_ids):
+    """Recompute the search text of ``product_ids``."""
+    product_ids = [pk for pk in set(product_ids) if pk is not None]
+    if product_ids:
+        _save(Products.objects.filter(pk__in=product_ids).select_related(*PRODUCT_SELECT_RELATED))
+
+
+def refresh_attribute(instance):
+    """Recompute the products using a renamed type, variant, size or unit."""
+    field = ATTRIBUTE_FIELDS[type(instance)]
+    refresh(Products.objects.filter(**{field: instance}).values_list("pk", flat=True))
+
+
+def rebuild(chunk_size=1000):
+    """Recreate every search row; returns the number of products indexed."""
+    ProductSearch.objects.all().delete()
+    count = 0
+    products = Products.objects.select_related(*PRODUCT_SELECT_RELATED).order_by("pk")
+    batch = []
+    for product in products.iterator(chunk_size=chunk_size):
+        batch.append(product)
+        if len(batch) >= chunk_size:
+            _save(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        _save(batch)
+        count += len(batch)
+    return count
+
+
+def _trigram():
+    return connection.vendor == "postgresql"
+
+
+def matches(query):
+    """``ProductSearch`` rows matching ``query``; None for a blank query."""
+    query = normalize(query)
+    if not query:
+        return None
+    condition = Q()
+    for word in query.split():
+        condition &= Q(document__contains=word)
+    if _trigram():
+        from django.contrib.postgres.lookups import TrigramWordSimilar
+
+        condition |= Q(TrigramWordSimilar(F("document"), query))
+    return ProductSearch.objects.filter(condition)
+
+
+def filter_queryset(queryset, query, field="pk"):
+    """Narrow ``queryset`` to rows whose ``field`` is a product matching ``query``."""
+    found = matches(query)
+    if found is None:
+        return queryset
+    return queryset.filter(**{f"{field}__in": found.values("product_id")})
+
+
+def ranked(query):
+    """Matching ``ProductSearch`` rows, best match first."""
+    found = matches(query)
+    if found is None:
+        return ProductSearch.objects.none()
+    query = normalize(query)
+    if _trigram():
+        from django.contrib.postgres.search import TrigramWordSimilarity
+
+        rank = TrigramWordSimilarity(query, "document")
+    else:
+        rank = Case(
+            When(document=query, then=Value(3)),
+            When(document__startswith=query, then=Value(2)),
+            When(document__contains=query, then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    return found.annotate(rank=rank).order_by("-rank", "document", "product_id")
+
+
+def suggest(query, limit=SUGGEST_LIMIT):
+    """Best matching active products for the typeahead, as plain dicts."""
+    rows = (
+        ranked(query)
+        .filter(product__is_archived=False)
+        .select_related(*[f"product__{name}" for name in PRODUCT_SELECT_RELATED])[:limit]
+    )
+    return [
+        {
+            "id": row.product_id,
+            "name": str(row.product),
+            "barcode": row.product.barcode,
+            "score": float(row.rank),
+        }
+        for row in rows
+    ]
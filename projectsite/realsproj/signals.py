@@ -1,9 +1,14 @@
 from django.contrib.auth.signals import user_logged_in, user_logged_out
 from django.dispatch import receiver
 from django.utils import timezone
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_save, post_delete
 from django.contrib.auth.models import User
-from .models import UserActivity, HistoryLog, HistoryLogTypes, AuthUser
+from .models import (
+    UserActivity, HistoryLog, HistoryLogTypes, AuthUser, Sales, Withdrawals, Notifications,
+    ProductInventory, RawMaterialInventory, ProductBatches, RawMaterialBatches, Products,
+    SrpPrices, UnitPrices,
+)
+from . import barcodes, facets, ledger, notification_header, orders, search, stock_alerts
 
 @receiver(user_logged_in)
 def user_logged_in_handler(sender, request, user, **kwargs):
@@ -58,3 +63,201 @@ def user_registered_handler(sender, instance, created, **kwargs):
             print(f"❌ Error creating history log for user {instance.username}: {str(e)}")
             import traceback
             traceback.print_exc()
+
+
+# ----------------------------------------------------------------------
+# Daily ledger rollup maintenance
+# ----------------------------------------------------------------------
+
+def _ledger_refresh(instance, days):
+    source = ledger.SOURCE_MODELS[type(instance)]
+    try:
+        ledger.mark_changed(source, days)
+    except Exception as e:
+        print(f"❌ Error queueing daily ledger refresh for {source} {days}: {str(e)}")
+
+
+def ledger_pre_save_handler(sender, instance, **kwargs):
+    """Remember the stored day so moving a row refreshes both days."""
+    instance._ledger_previous_day = None
+    if kwargs.get("raw"):
+        return
+    if instance.pk:
+        previous = sender.objects.filter(pk=instance.pk).only("date").first()
+        if previous is not None:
+            instance._ledger_previous_day = ledger.instance_day(previous)
+
+
+def ledger_post_save_handler(sender, instance, **kwargs):
+    # Fixture/backup loads (raw saves) rebuild the ledger once at the end.
+    if kwargs.get("raw"):
+        return
+    _ledger_refresh(instance, {
+        getattr(instance, "_ledger_previous_day", None),
+        ledger.instance_day(instance),
+    })
+
+
+def ledger_post_delete_handler(sender, instance, **kwargs):
+    _ledger_refresh(instance, {ledger.instance_day(instance)})
+
+
+for _ledger_model in ledger.SOURCE_MODELS:
+    pre_save.connect(ledger_pre_save_handler, sender=_ledger_model, dispatch_uid=f"ledger_pre_save_{_ledger_model.__name__}")
+    post_save.connect(ledger_post_save_handler, sender=_ledger_model, dispatch_uid=f"ledger_post_save_{_ledger_model.__name__}")
+    post_delete.connect(ledger_post_delete_handler, sender=_ledger_model, dispatch_uid=f"ledger_post_delete_{_ledger_model.__name__}")
+
+
+# ----------------------------------------------------------------------
+# Withdrawal order headers
+# ----------------------------------------------------------------------
+
+@receiver(post_save, sender=Withdrawals, dispatch_uid="withdrawal_order_post_save")
+@receiver(post_delete, sender=Withdrawals, dispatch_uid="withdrawal_order_post_delete")
+def withdrawal_order_sync_handler(sender, instance, **kwargs):
+    if not instance.order_group_id or kwargs.get("raw"):
+        return
+    try:
+        orders.mark_changed(instance.order_group_id)
+    except Exception as e:
+        print(f"❌ Error syncing order #{instance.order_group_id}: {str(e)}")
+
+
+@receiver(post_save, sender=Sales, dispatch_uid="withdrawal_order_sales_link")
+def withdrawal_order_sales_link_handler(sender, instance, **kwargs):
+    if not instance.order_group_id or kwargs.get("raw"):
+        return
+    try:
+        orders.sales_saved(instance)
+    except Exception as e:
+        print(f"❌ Error linking sales entry to order #{instance.order_group_id}: {str(e)}")
+
+
+# ----------------------------------------------------------------------
+# Notification header cache
+# ----------------------------------------------------------------------
+
+@receiver(post_save, sender=Notifications, dispatch_uid="notification_header_post_save")
+@receiver(post_delete, sender=Notifications, dispatch_uid="notification_header_post_delete")
+def notification_header_handler(sender, instance, **kwargs):
+    notification_header.invalidate()
+
+
+# ----------------------------------------------------------------------
+# Stock alerts
+# ----------------------------------------------------------------------
+
+def _mark_stock_changed(item_type, item_ids):
+    try:
+        stock_alerts.mark_changed(item_type, item_ids)
+    except Exception as e:
+        print(f"❌ Error queueing stock alerts for {item_type} {item_ids}: {str(e)}")
+
+
+@receiver(post_save, sender=ProductInventory, dispatch_uid="stock_alert_product_inventory")
+def product_inventory_stock_alert_handler(sender, instance, **kwargs):
+    if not kwargs.get("raw"):
+        _mark_stock_changed("PRODUCT", [instance.pk])
+
+
+@receiver(post_save, sender=RawMaterialInventory, dispatch_uid="stock_alert_raw_material_inventory")
+def raw_material_inventory_stock_alert_handler(sender, instance, **kwargs):
+    if not kwargs.get("raw"):
+        _mark_stock_changed("RAW_MATERIAL", [instance.pk])
+
+
+@receiver(post_save, sender=ProductBatches, dispatch_uid="stock_alert_product_batch_post_save")
+@receiver(post_delete, sender=ProductBatches, dispatch_uid="stock_alert_product_batch_post_delete")
+def product_batch_stock_alert_handler(sender, instance, **kwargs):
+    if kwargs.get("raw"):
+        return
+    _mark_stock_changed("PRODUCT", [instance.product_id])
+    # New batches consume their recipe's raw materials (database trigger).
+    if instance.deduct_raw_material:
+        try:
+            _mark_stock_changed("RAW_MATERIAL", stock_alerts.recipe_materials([instance.product_id]))
+        except Exception as e:
+            print(f"❌ Error loading recipe for product {instance.product_id}: {str(e)}")
+
+
+@receiver(post_save, sender=RawMaterialBatches, dispatch_uid="stock_alert_raw_material_batch_post_save")
+@receiver(post_delete, sender=RawMaterialBatches, dispatch_uid="stock_alert_raw_material_batch_post_delete")
+def raw_material_batch_stock_alert_handler(sender, instance, **kwargs):
+    if not kwargs.get("raw"):
+        _mark_stock_changed("RAW_MATERIAL", [instance.material_id])
+
+
+@receiver(post_save, sender=Withdrawals, dispatch_uid="stock_alert_withdrawal_post_save")
+@receiver(post_delete, sender=Withdrawals, dispatch_uid="stock_alert_withdrawal_post_delete")
+def withdrawal_stock_alert_handler(sender, instance, **kwargs):
+    if not kwargs.get("raw"):
+        _mark_stock_changed(instance.item_type, [instance.item_id])
+
+
+# ----------------------------------------------------------------------
+# Filter dropdown facets
+# ----------------------------------------------------------------------
+
+def facet_post_save_handler(sender, instance, created, **kwargs):
+    if kwargs.get("raw"):
+        return
+    try:
+        if created:
+            facets.observe([instance])
+        else:
+            # An edit or (un)archive can add or remove a value.
+            facets.invalidate_model(sender)
+    except Exception as e:
+        print(f"❌ Error updating filter facets for {sender.__name__}: {str(e)}")
+
+
+def facet_post_delete_handler(sender, instance, **kwargs):
+    facets.invalidate_model(sender)
+
+
+for _facet_model in {facet.model for facet in facets.FACETS.values()}:
+    post_save.connect(facet_post_save_handler, sender=_facet_model, dispatch_uid=f"facet_post_save_{_facet_model.__name__}")
+    post_delete.connect(facet_post_delete_handler, sender=_facet_model, dispatch_uid=f"facet_post_delete_{_facet_model.__name__}")
+
+
+# ----------------------------------------------------------------------
+# Product search index
+# ----------------------------------------------------------------------
+
+@receiver(post_save, sender=Products, dispatch_uid="product_search_post_save")
+def product_search_handler(sender, instance, **kwargs):
+    if kwargs.get("raw"):
+        return
+    try:
+        search.refresh([instance.pk])
+    except Exception as e:
+        print(f"❌ Error updating search index for product {instance.pk}: {str(e)}")
+
+
+def product_attribute_search_handler(sender, instance, created, **kwargs):
+    # A new attribute has no products yet.
+    if created or kwargs.get("raw"):
+        return
+    try:
+        search.refresh_attribute(instance)
+    except Exception as e:
+        print(f"❌ Error updating search index for {sender.__name__} {instance.pk}: {str(e)}")
+
+
+for _attribute_model in search.ATTRIBUTE_FIELDS:
+    post_save.connect(product_attribute_search_handler, sender=_attribute_model, dispatch_uid=f"product_search_{_attribute_model.__name__}")
+
+
+# ----------------------------------------------------------------------
+# Barcode index
+# ----------------------------------------------------------------------
+
+def barcode_index_handler(sender, instance, **kwargs):
+    if kwargs.get("raw"):
+        return
+    barcodes.invalidate()
+
+
+for _barcode_model in (Products, UnitPrices, SrpPrices, *search.ATTRIBUTE_FIELDS):
+    post_save.connect(barcode_index_handler, sender=_barcode_model, dispatch_uid=f"barcode_index_post_save_{_barcode_model.__name__}")
+    post_delete.connect(barcode_index_handler, sender=_barcode_model, dispatch_uid=f"barcode_index_post_delete_{_barcode_model.__name__}")
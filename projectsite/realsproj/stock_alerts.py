@@ -0,0 +1,161 @@
+"""
+LOW_STOCK / OUT_OF_STOCK / STOCK_HEALTHY notifications.
+
+Alerts are raised when an item's stock *crosses* its threshold, not on
+every page view. Anything that can move ``total_stock`` (inventory edits,
+withdrawals, batches, and the raw materials a product batch consumes)
+calls ``mark_changed()`` from signals.py. The changed items are collected
+per transaction and evaluated once, after commit, when the database
+triggers have already updated the inventory:
+
+* one query per item type reads the affected inventory rows together with
+  the latest stock notification of each item;
+* the new state is compared with that latest alert in memory, so an item
+  only gets a notification when its state changed;
+* the new notifications are written with a single ``bulk_create``.
+
+States follow the inventory pages: out of stock at zero or below, low
+below the threshold, healthy otherwise. STOCK_HEALTHY is only sent to
+close an earlier LOW_STOCK/OUT_OF_STOCK alert. ``sweep()`` re-checks every
+item and runs nightly from the scheduler, for changes made outside Django.
+The stock levels read here also refresh the barcode index
+(realsproj.barcodes) and are pushed to the screens showing those items
+(realsproj.stock_feed).
+"""
+import threading
+
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from realsproj import barcodes, notification_header, stock_feed
+from realsproj.models import Notifications, ProductInventory, ProductRecipes, RawMaterialInventory
+
+
+LOW_STOCK = "LOW_STOCK"
+OUT_OF_STOCK = "OUT_OF_STOCK"
+STOCK_HEALTHY = "STOCK_HEALTHY"
+STOCK_TYPES = (LOW_STOCK, OUT_OF_STOCK, STOCK_HEALTHY)
+
+CHUNK_SIZE = 1000
+
+# item_type -> (inventory model, threshold field)
+INVENTORIES = {
+    "PRODUCT": (ProductInventory, "restock_threshold"),
+    "RAW_MATERIAL": (RawMaterialInventory, "reorder_threshold"),
+}
+
+_state = threading.local()
+
+
+def stock_state(total_stock, threshold):
+    if total_stock is None or total_stock <= 0:
+        return OUT_OF_STOCK
+    if threshold is not None and total_stock < threshold:
+        return LOW_STOCK
+    return STOCK_HEALTHY
+
+
+def transition(state, last_alert):
+    """Notification type to send for ``state`` given the latest alert, or None."""
+    if state == last_alert:
+        return None
+    if state == STOCK_HEALTHY and last_alert not in (LOW_STOCK, OUT_OF_STOCK):
+        return None
+    return state
+
+
+# ----------------------------------------------------------------------
+# Evaluation
+# ----------------------------------------------------------------------
+def evaluate(item_type, item_ids):
+    """Check the given items and bulk-create notifications for crossings; returns them."""
+    model, threshold_field = INVENTORIES[item_type]
+    item_ids = sorted(set(item_ids))
+    now = timezone.now()
+    latest_alert = (
+        Notifications.objects
+        .filter(item_type=item_type, item_id=OuterRef("pk"), notification_type__in=STOCK_TYPES)
+        .order_by("-id")
+        .values("notification_type")[:1]
+    )
+    notifications = []
+    levels = {}
+    for start in range(0, len(item_ids), CHUNK_SIZE):
+        rows = (
+            model.objects
+            .filter(pk__in=item_ids[start:start + CHUNK_SIZE])
+            .annotate(last_alert=Subquery(latest_alert))
+            .values_list("pk", "total_stock", threshold_field, "last_alert")
+        )
+        for item_id, total_stock, threshold, last_alert in rows:
+            levels[item_id] = total_stock
+            notification_type = transition(stock_state(total_stock, threshold), last_alert)
+            if notification_type:
+                notifications.append(Notifications(
+                    item_type=item_type,
+                    item_id=item_id,
+                    notification_type=notification_type,
+                    notification_timestamp=now,
+                    is_read=False,
+                ))
+    if notifications:
+        Notifications.objects.bulk_create(notifications, batch_size=CHUNK_SIZE)
+        notification_header.invalidate()
+    if item_type == "PRODUCT":
+        barcodes.update_stock(levels)
+    stock_feed.publish(item_type, levels)
+    return notifications
+
+
+class _Pending:
+    """Items marked during one transaction, evaluated when it commits."""
+
+    def __init__(self):
+        self.items = {}
+
+    def run(self):
+        if getattr(_state, "pending", None) is self:
+            _state.pending = None
+        for item_type, item_ids in self.items.items():
+            try:
+                evaluate(item_type, item_ids)
+            except Exception as e:
+                print(f"❌ Error evaluating stock alerts for {item_type}: {str(e)}")
+
+
+def mark_changed(item_type, item_ids):
+    """Queue items whose stock may have changed; evaluated once after commit."""
+    if item_type not in INVENTORIES:
+        return
+    item_ids = {item_id for item_id in item_ids if item_id}
+    if not item_ids:
+        return
+    if not connection.in_atomic_block:
+        pending = _Pending()
+        pending.items[item_type] = item_ids
+        pending.run()
+        return
+    pending = getattr(_state, "pending", None)
+    # A rolled-back transaction drops its on_commit callbacks; start afresh.
+    if pending is None or not any(entry[1] == pending.run for entry in connection.run_on_commit):
+        pending = _state.pending = _Pending()
+        transaction.on_commit(pending.run)
+    pending.items.setdefault(item_type, set()).update(item_ids)
+
+
+def recipe_materials(product_ids):
+    """Raw materials consumed by batches of the given products."""
+    return set(
+        ProductRecipes.objects.filter(product_id__in=product_ids)
+        .values_list("material_id", flat=True).distinct()
+    )
+
+
+def sweep():
+    """Evaluate every inventory row; returns the number of notifications written."""
+    written = 0
+    for item_type, (model, _) in INVENTORIES.items():
+        item_ids = list(model.objects.values_list("pk", flat=True))
+        written += len(evaluate(item_type, item_ids))
+    return written
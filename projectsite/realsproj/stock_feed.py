@@ -0,0 +1,88 @@
+"""
+Live stock levels for the withdraw and edit screens.
+
+Screens used to poll ``get_stock`` once per displayed item. Now they load
+the levels of all their items with one ``get_stock?type=...&ids=...``
+call and then subscribe over a WebSocket (``StockConsumer``,
+``/ws/stock/``) to just those items.
+
+Every committed stock change already goes through
+``stock_alerts.evaluate()``, which reads the new ``total_stock`` of the
+changed items after commit; it hands those levels to ``publish()``. All
+levels of one ``publish()`` call go out together as ``stock_batch``
+messages to the ``stock`` group, split only to stay under the channel
+layer's NOTIFY payload limit, so a checkout or production run of N items
+costs one group send (one ``pg_notify`` with ``PostgresChannelLayer``)
+rather than N. Each consumer that has subscriptions is in the group and
+forwards the items its screen shows as ``stock_update`` messages; the
+per-item fan-out happens in the receiving process.
+"""
+import json
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from realsproj.channel_layers import MAX_PAYLOAD
+from realsproj.models import ProductInventory, RawMaterialInventory
+
+
+INVENTORIES = {
+    "PRODUCT": ProductInventory,
+    "RAW_MATERIAL": RawMaterialInventory,
+}
+
+MAX_ITEMS = 500
+
+GROUP = "stock"
+
+# Room left in a NOTIFY payload for the group name and envelope.
+MAX_BATCH_BYTES = MAX_PAYLOAD - 500
+
+
+def message(item_type, item_id, total_stock):
+    return {
+        "type": "stock_update",
+        "item_type": item_type,
+        "item_id": item_id,
+        "total_stock": str(total_stock if total_stock is not None else 0),
+    }
+
+
+def levels(item_type, item_ids):
+    """``{item_id: total_stock}`` of ``item_ids`` in one query; missing items are 0."""
+    model = INVENTORIES[item_type]
+    item_ids = list(item_ids)[:MAX_ITEMS]
+    found = dict(model.objects.filter(pk__in=item_ids).values_list("pk", "total_stock"))
+    return {item_id: found.get(item_id, 0) for item_id in item_ids}
+
+
+def batches(item_type, stock_by_item):
+    """Split ``{item_id: total_stock}`` into ``stock_batch`` messages under MAX_BATCH_BYTES."""
+    messages, levels, size = [], {}, 0
+    for item_id, total_stock in stock_by_item.items():
+        key, value = str(item_id), str(total_stock if total_stock is not None else 0)
+        entry_size = len(json.dumps({key: value})) + 2
+        if levels and size + entry_size > MAX_BATCH_BYTES:
+            messages.append({"type": "stock_batch", "item_type": item_type, "levels": levels})
+            levels, size = {}, 0
+        levels[key] = value
+        size += entry_size
+    if levels:
+        messages.append({"type": "stock_batch", "item_type": item_type, "levels": levels})
+    return messages
+
+
+async def _send(layer, messages):
+    for batch in messages:
+        await layer.group_send(GROUP, batch)
+
+
+def publish(item_type, stock_by_item):
+    """Send the new ``{item_id: total_stock}`` levels to the subscribed screens."""
+    layer = get_channel_layer()
+    if layer is None or not stock_by_item:
+        return
+    try:
+        async_to_sync(_send)(layer, batches(item_type, stock_by_item))
+    except Exception as e:
+        print(f"❌ Error publishing stock of {len(stock_by_item)} {item_type} item(s): {str(e)}")
@@ -1,3 +1,124 @@
+import datetime
+from decimal import Decimal
+
+from django.apps import apps
+from django.db import connection
 from django.test import TestCase
+from django.utils import timezone
+
+from realsproj import checkout, production
+from realsproj.models import (
+    AuthUser, ProductBatches, ProductInventory, ProductRecipes, ProductTypes, ProductVariants,
+    Products, RawMaterialInventory, RawMaterials, SizeUnits, Sizes, SrpPrices, UnitPrices,
+)
+
+
+def setUpModule():
+    # Most tables are managed outside Django (managed = False), so the test
+    # database has none of them; create the missing ones from the models.
+    existing = set(connection.introspection.table_names())
+    for model in apps.get_app_config("realsproj").get_models():
+        if model._meta.db_table in existing:
+            continue
+        with connection.schema_editor() as schema_editor:
+            schema_editor.create_model(model)
+        existing.add(model._meta.db_table)
+
+
+class InventoryFixtureMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = AuthUser.objects.create(
+            username="admin", password="!", is_superuser=True, is_staff=True, is_active=True,
+            first_name="", last_name="", email="", date_joined=timezone.now(),
+        )
+        cls.unit = SizeUnits.objects.create(unit_name="g", created_by_admin=cls.admin)
+
+    @classmethod
+    def make_product(cls, stock=0):
+        product = Products.objects.create(
+            product_type=ProductTypes.objects.create(name="Jam", created_by_admin=cls.admin),
+            variant=ProductVariants.objects.create(name="Mango", created_by_admin=cls.admin),
+            size=Sizes.objects.create(size_label="250", created_by_admin=cls.admin),
+            size_unit=cls.unit,
+            unit_price=UnitPrices.objects.create(unit_price=Decimal("10"), created_by_admin=cls.admin),
+            srp_price=SrpPrices.objects.create(srp_price=Decimal("12"), created_by_admin=cls.admin),
+            created_by_admin=cls.admin,
+        )
+        ProductInventory.objects.create(product=product, total_stock=Decimal(stock), restock_threshold=Decimal(1))
+        return product
+
+    @classmethod
+    def make_material(cls, name, stock):
+        material = RawMaterials.objects.create(
+            name=name, unit=cls.unit, price_per_unit=Decimal(1), size=Decimal(1), created_by_admin=cls.admin
+        )
+        RawMaterialInventory.objects.create(material=material, total_stock=Decimal(stock), reorder_threshold=Decimal(1))
+        return material
+
+
+class DecrementStockTests(InventoryFixtureMixin, TestCase):
+    def test_subtracts_each_amount_from_its_own_row(self):
+        sugar = self.make_material("Sugar", 100)
+        mango = self.make_material("Mango", 10)
+        salt = self.make_material("Salt", 5)
+
+        checkout.decrement_stock(RawMaterialInventory, {sugar.id: Decimal("12.5"), mango.id: Decimal(3)})
+
+        stock = dict(RawMaterialInventory.objects.values_list("pk", "total_stock"))
+        self.assertEqual(stock[sugar.id], Decimal("87.5"))
+        self.assertEqual(stock[mango.id], Decimal(7))
+        self.assertEqual(stock[salt.id], Decimal(5))
+
+    def test_no_amounts_runs_no_query(self):
+        with self.assertNumQueries(0):
+            checkout.decrement_stock(RawMaterialInventory, {})
+
+
+class ProduceTests(InventoryFixtureMixin, TestCase):
+    def setUp(self):
+        self.sugar = self.make_material("Sugar", 100)
+        self.mango = self.make_material("Mango", 10)
+        self.products = [self.make_product() for _ in range(3)]
+        for product in self.products:
+            ProductRecipes.objects.create(
+                product=product, material=self.sugar, quantity_needed=Decimal(2),
+                yield_factor=Decimal(1), created_by_admin=self.admin,
+            )
+            ProductRecipes.objects.create(
+                product=product, material=self.mango, quantity_needed=Decimal(1),
+                yield_factor=Decimal(2), created_by_admin=self.admin,
+            )
+        self.today = datetime.date(2025, 6, 1)
+
+    def produce(self, qty, deduct_raw_material=True):
+        return production.produce(
+            {product: qty for product in self.products}, self.admin,
+            manufactured_date=self.today, batch_date=self.today,
+            deduct_raw_material=deduct_raw_material,
+        )
+
+    def test_plan_sums_demand_over_all_products(self):
+        plan = production.plan({product: 4 for product in self.products})
+        self.assertEqual(plan.demand, {self.sugar.id: Decimal(24), self.mango.id: Decimal(6)})
+        self.assertTrue(plan.ok)
+
+    def test_inserts_batches_with_the_submitted_flag(self):
+        self.produce(4)
+        self.assertEqual(
+            sorted(ProductBatches.objects.values_list("product_id", "quantity", "deduct_raw_material")),
+            sorted((product.id, 4, True) for product in self.products),
+        )
+
+    def test_shortfall_raises_and_writes_nothing(self):
+        with self.assertRaises(production.InsufficientStock) as raised:
+            self.produce(10)
+        self.assertEqual([s.material.id for s in raised.exception.shortfalls], [self.mango.id])
+        self.assertEqual(raised.exception.shortfalls[0].missing, Decimal(5))
+        self.assertFalse(ProductBatches.objects.exists())
 
-# Create your tests here.
+    def test_without_deduction_stock_is_not_checked(self):
+        self.produce(10, deduct_raw_material=False)
+        self.assertEqual(
+            set(ProductBatches.objects.values_list("deduct_raw_material", flat=True)), {False}
+        )
@@ -97,6 +97,10 @@ from django.db.models.functions import Cast
 import re
 from urllib.parse import urlparse, parse_qs
 from django.db.models import Count
+from django.utils.dateparse import parse_date
+from realsproj.aggregation import BUCKET_CHOICES, sales_expenses_series
+from realsproj import activity, backup, barcodes, capacity, checkout, exports, facets, grouping, keyset, ledger, losses, notification_header, order_numbers, orders, production, resolver, stock_feed
+from realsproj import search as product_search
 
 
 def get_or_create_auth_user(user):
@@ -173,11 +177,8 @@ class HomePageView(LoginRequiredMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        sales_summary = SalesSummary.objects.first()
-        total_sales = sales_summary.total_amount if sales_summary else 0
-
-        expenses_summary = ExpensesSummary.objects.first()
-        total_expenses = expenses_summary.total_amount if expenses_summary else 0
+        total_sales, _, _ = ledger.summarize(ledger.rollup(ledger.SALES))
+        total_expenses, _, _ = ledger.summarize(ledger.rollup(ledger.EXPENSES))
 
         context['total_revenue'] = total_sales - total_expenses
 
@@ -185,113 +186,76 @@ class HomePageView(LoginRequiredMixin, TemplateView):
             total=Sum('total_stock')
         )['total'] or 0
 
-        context['recent_sales'] = Withdrawals.objects.filter(
-            item_type="PRODUCT", reason="SOLD"
-        ).order_by('-date')[:6]
+        context['recent_sales'] = resolver.for_request(self.request).attach(
+            Withdrawals.objects.filter(
+                item_type="PRODUCT", reason="SOLD"
+            ).order_by('-date')[:6]
+        )
 
         return context
 
 
 def sales_vs_expenses(request):
-    sales_monthly = (
-        Sales.objects
-        .annotate(month=TruncMonth('date'))
-        .values('month')
-        .annotate(total=Sum('amount'))
-        .order_by('month')
-    )
-    expenses_monthly = (
-        Expenses.objects
-        .annotate(month=TruncMonth('date'))
-        .values('month')
-        .annotate(total=Sum('amount'))
-        .order_by('month')
-    )
-
-    months = sorted(
-        set([s['month'].strftime("%Y-%m") for s in sales_monthly] +
-            [e['month'].strftime("%Y-%m") for e in expenses_monthly])
-    )
-
-    sales_totals = []
-    expenses_totals = []
-
-    for m in months:
-        sales_totals.append(
-            next((float(s['total']) for s in sales_monthly if s['month'].strftime("%Y-%m") == m), 0)
-        )
-        expenses_totals.append(
-            next((float(e['total']) for e in expenses_monthly if e['month'].strftime("%Y-%m") == m), 0)
-        )
-
-    sales_daily = (
-        Sales.objects
-        .annotate(day=TruncDay('date'))
-        .values('day')
-        .annotate(total=Sum('amount'))
-        .order_by('day')
-    )
-    expenses_daily = (
-        Expenses.objects
-        .annotate(day=TruncDay('date'))
-        .values('day')
-        .annotate(total=Sum('amount'))
-        .order_by('day')
-    )
-
-    daily_dates = sorted(
-        set([s['day'].strftime("%Y-%m-%d") for s in sales_daily] +
-            [e['day'].strftime("%Y-%m-%d") for e in expenses_daily])
-    )
+    """
+    Monthly and daily sales vs expenses for the dashboard chart.
 
-    sales_daily_totals = []
-    expenses_daily_totals = []
+    Optional query params: ``start``/``end`` (YYYY-MM-DD, inclusive) bound the
+    range, and ``bucket`` (week/year) adds an extra series at that size.
+    """
+    bounds = {}
+    for name in ("start", "end"):
+        raw = request.GET.get(name, "").strip()
+        try:
+            bounds[name] = parse_date(raw) if raw else None
+        except ValueError:
+            bounds[name] = None
+        # parse_date returns None for text that is not YYYY-MM-DD at all.
+        if raw and bounds[name] is None:
+            return JsonResponse({"error": f"Invalid {name} date, expected YYYY-MM-DD."}, status=400)
+    start, end = bounds["start"], bounds["end"]
+    bucket = request.GET.get("bucket", "").strip()
+
+    buckets = ["month", "day"]
+    if bucket in BUCKET_CHOICES and bucket not in buckets:
+        buckets.append(bucket)
+
+    series = sales_expenses_series(buckets=buckets, start=start, end=end)
+
+    data = {
+        "months": series["month"]["labels"],
+        "sales": series["month"]["sales"],
+        "expenses": series["month"]["expenses"],
+        "daily_dates": series["day"]["labels"],
+        "sales_daily": series["day"]["sales"],
+        "expenses_daily": series["day"]["expenses"],
+    }
+    if bucket in BUCKET_CHOICES:
+        data["bucket"] = bucket
+        data["labels"] = series[bucket]["labels"]
+        data["bucket_sales"] = series[bucket]["sales"]
+        data["bucket_expenses"] = series[bucket]["expenses"]
 
-    for d in daily_dates:
-        sales_daily_totals.append(
-            next((float(s['total']) for s in sales_daily if s['day'].strftime("%Y-%m-%d") == d), 0)
-        )
-        expenses_daily_totals.append(
-            next((float(e['total']) for e in expenses_daily if e['day'].strftime("%Y-%m-%d") == d), 0)
-        )
-
-    return JsonResponse({
-        "months": months,
-        "sales": sales_totals,
-        "expenses": expenses_totals,
-        "daily_dates": daily_dates,
-        "sales_daily": sales_daily_totals,
-        "expenses_daily": expenses_daily_totals,
-    })
+    return JsonResponse(data)
 
 def revenue_change_api(request):
     year = request.GET.get("year")
     month = request.GET.get("month")
 
-    sales_qs = Sales.objects.all()
+    sales_qs = ledger.rollup(ledger.SALES)
 
     if year:
         sales_qs = sales_qs.filter(date__year=year)
 
     if month and month != "all":
         sales_qs = sales_qs.filter(date__month=month)
-        sales_data = (
-            sales_qs.annotate(day=TruncDay('date'))
-            .values('day')
-            .annotate(total=Sum('amount'))
-            .order_by('day')
-        )
-        labels = [s['day'].strftime("%Y-%m-%d") for s in sales_data]
+        # Rollup rows are already one per day.
+        sales_data = sales_qs.order_by('date').values_list('date', 'amount')
+        labels = [day.strftime("%Y-%m-%d") for day, _ in sales_data]
     else:
-        sales_data = (
-            sales_qs.annotate(month=TruncMonth('date'))
-            .values('month')
-            .annotate(total=Sum('amount'))
-            .order_by('month')
-        )
-        labels = [s['month'].strftime("%Y-%m") for s in sales_data]
+        sales_data = ledger.monthly_totals(ledger.SALES, sales_qs).items()
+        labels = [month_start.strftime("%Y-%m") for month_start, _ in sales_data]
 
-    revenues = [float(s['total']) for s in sales_data]
+    revenues = [float(total) for _, total in sales_data]
 
     return JsonResponse({
         "labels": labels,
@@ -301,28 +265,13 @@ def revenue_change_api(request):
 
 def monthly_report(request):
 
-    sales = (
-        Sales.objects.annotate(month=TruncMonth("date"))
-        .values("month")
-        .annotate(total_sales=Sum("amount"))
-        .order_by("month")
-    )
-
-    expenses = (
-        Expenses.objects.annotate(month=TruncMonth("date"))
-        .values("month")
-        .annotate(total_expenses=Sum("amount"))
-        .order_by("month") 
-    )
-
-    expenses_dict = {e["month"]: e["total_expenses"] for e in expenses}
+    sales = ledger.monthly_totals(ledger.SALES)
+    expenses_dict = ledger.monthly_totals(ledger.EXPENSES)
 
     report = []
     prev = None
 
-    for s in sales:
-        month = s["month"]
-        revenue = s["total_sales"] or 0
+    for month, revenue in sales.items():
         cost = expenses_dict.get(month, 0) or 0
         profit = revenue - cost
 
@@ -358,25 +307,8 @@ def monthly_report_export(request):
     if not request.user.is_superuser:
         messages.error(request, "❌ You don't have permission to export financial reports.")
         return redirect('home')
-    response = HttpResponse(content_type="text/csv")
-    response["Content-Disposition"] = 'attachment; filename="financial_report.csv"'
-    response.write(u'\ufeff'.encode('utf8'))
-    writer = csv.writer(response)
-    writer.writerow(["Month", "Revenue", "Expenses", "Profit", "Revenue Change", "Profit Change", "Trend"])
-    sales = (
-        Sales.objects.annotate(month=TruncMonth("date"))
-        .values("month")
-        .annotate(total_sales=Sum("amount"))
-        .order_by("month")
-    )
-    expenses = (
-        Expenses.objects.annotate(month=TruncMonth("date"))
-        .values("month")
-        .annotate(total_expenses=Sum("amount"))
-        .order_by("month")
-    )
-    sales_dict = {s["month"]: Decimal(s["total_sales"] or 0) for s in sales}
-    expenses_dict = {e["month"]: Decimal(e["total_expenses"] or 0) for e in expenses}
+    sales_dict = ledger.monthly_totals(ledger.SALES)
+    expenses_dict = ledger.monthly_totals(ledger.EXPENSES)
     all_months = sorted(set(list(sales_dict.keys()) + list(expenses_dict.keys())))
 
     report = []
@@ -391,47 +323,60 @@ def monthly_report_export(request):
             "profit": profit,
         })
 
-    for i in range(len(report)):
-        if i > 0: 
-            older = report[i - 1]
-            rc = report[i]["revenue"] - older["revenue"]
-            pc = report[i]["profit"] - older["profit"]
-
-            rev_change = f"↑ ₱{rc:,.2f}" if rc > 0 else f"↓ ₱{abs(rc):,.2f}" if rc < 0 else "₱0.00"
-            prof_change = f"↑ ₱{pc:,.2f}" if pc > 0 else f"↓ ₱{abs(pc):,.2f}" if pc < 0 else "₱0.00"
-
-            if rc > 0 and pc > 0:
-                trend = "Revenue & Profit Increased"
-            elif rc > 0 and pc < 0:
-                trend = "Revenue Increased, Profit Decreased"
-            elif rc < 0 and pc > 0:
-                trend = "Revenue Decreased, Profit Increased"
-            elif rc == 0 and pc == 0:
-                trend = "No Change"
+    def rows():
+        yield ["Month", "Revenue", "Expenses", "Profit", "Revenue Change", "Profit Change", "Trend"]
+        for i in range(len(report)):
+            if i > 0: 
+                older = report[i - 1]
+                rc = report[i]["revenue"] - older["revenue"]
+                pc = report[i]["profit"] - older["profit"]
+
+                rev_change = f"↑ ₱{rc:,.2f}" if rc > 0 else f"↓ ₱{abs(rc):,.2f}" if rc < 0 else "₱0.00"
+                prof_change = f"↑ ₱{pc:,.2f}" if pc > 0 else f"↓ ₱{abs(pc):,.2f}" if pc < 0 else "₱0.00"
+
+                if rc > 0 and pc > 0:
+                    trend = "Revenue & Profit Increased"
+                elif rc > 0 and pc < 0:
+                    trend = "Revenue Increased, Profit Decreased"
+                elif rc < 0 and pc > 0:
+                    trend = "Revenue Decreased, Profit Increased"
+                elif rc == 0 and pc == 0:
+                    trend = "No Change"
+                else:
+                    trend = "Revenue & Profit Decreased"
             else:
-                trend = "Revenue & Profit Decreased"
-        else:
-            rev_change = "-"
-            prof_change = "-"
-            trend = "-"
-
-        writer.writerow([
-            report[i]["month"].strftime("%B %Y"),
-            f"₱{report[i]['revenue']:,.2f}",
-            f"₱{report[i]['expenses']:,.2f}",
-            f"₱{report[i]['profit']:,.2f}",
-            rev_change,
-            prof_change,
-            trend,
-        ])
-
-    return response
-
-class ProductsList(ListView):
+                rev_change = "-"
+                prof_change = "-"
+                trend = "-"
+
+            yield [
+                report[i]["month"].strftime("%B %Y"),
+                f"₱{report[i]['revenue']:,.2f}",
+                f"₱{report[i]['expenses']:,.2f}",
+                f"₱{report[i]['profit']:,.2f}",
+                rev_change,
+                prof_change,
+                trend,
+            ]
+
+    return exports.csv_response(request, rows(), "financial_report.csv", bom=True)
+
+class ProductsList(keyset.KeysetListMixin, ListView):
     model = Products
     context_object_name = 'products'
     template_name = "prod_list.html"
     paginate_by = 10
+    keyset_ordering = ("-id",)
+
+    def keyset_row(self, obj):
+        return {
+            "id": obj.id,
+            "name": str(obj),
+            "barcode": obj.barcode,
+            "unit_price": obj.unit_price.unit_price,
+            "srp_price": obj.srp_price.srp_price,
+            "date_created": obj.date_created,
+        }
 
     def get_queryset(self):
         
@@ -444,11 +389,7 @@ class ProductsList(ListView):
         # Unified search field for Product Type, Variant, and Size
         search = self.request.GET.get("search", "").strip()
         if search:
-            queryset = queryset.filter(
-                Q(product_type__name__icontains=search) |
-                Q(variant__name__icontains=search) |
-                Q(size__size_label__icontains=search)
-            )
+            queryset = product_search.filter_queryset(queryset, search)
         
         date_created = self.request.GET.get("date_created")
         barcode = self.request.GET.get("barcode")
@@ -496,6 +437,7 @@ class ProductsList(ListView):
         return context
 
 
+@login_required
 def product_scan_phone(request):
     
     return render(request, "product_scan_phone.html")
@@ -509,19 +451,13 @@ def check_barcode_availability(request):
     if not barcode:
         return JsonResponse({'available': True, 'message': ''})
     
-    # Check if barcode exists
-    qs = Products.objects.filter(barcode=barcode)
-    
-    # Exclude current product if editing
-    if product_id:
-        qs = qs.exclude(pk=product_id)
-    
-    if qs.exists():
-        product = qs.first()
+    # Check the barcode index, ignoring the current product if editing
+    product = barcodes.lookup(barcode, fresh=True)
+    if product and str(product['id']) != str(product_id or ''):
         return JsonResponse({
             'available': False,
-            'message': f'Barcode already used by: {product.product_type.name} - {product.variant.name}',
-            'product_id': product.id
+            'message': f"Barcode already used by: {product['product_type']} - {product['variant']}",
+            'product_id': product['id']
         })
     
     return JsonResponse({
@@ -529,6 +465,16 @@ def check_barcode_availability(request):
         'message': 'Barcode is available'
     })
 
+
+@login_required
+@require_GET
+def barcode_lookup(request):
+    """Resolve a scanned barcode to the product's name, prices and stock."""
+    product = barcodes.lookup(request.GET.get('barcode', ''))
+    if product is None:
+        return JsonResponse({'found': False}, status=404)
+    return JsonResponse({'found': True, 'product': product})
+
 class ProductArchiveView(View):
     def post(self, request, pk):
         product = get_object_or_404(Products, pk=pk)
@@ -559,6 +505,7 @@ class ProductArchiveOldView(View):
     def post(self, request):
         one_year_ago = timezone.now() - timedelta(days=365)
         Products.objects.filter(is_archived=False, date_created__lt=one_year_ago).update(is_archived=True)
+        barcodes.invalidate()
         return redirect('product-list')
 
 @require_http_methods(["POST"])
@@ -588,6 +535,7 @@ def product_bulk_archive(request):
             return JsonResponse({'success': False, 'message': 'No products selected'})
         
         archived_count = Products.objects.filter(id__in=ids).update(is_archived=True)
+        barcodes.invalidate()
         return JsonResponse({
             'success': True,
             'message': f'Successfully archived {archived_count} product(s)'
@@ -605,6 +553,7 @@ def product_bulk_restore(request):
             return JsonResponse({'success': False, 'message': 'No products selected'})
         
         restored_count = Products.objects.filter(id__in=ids).update(is_archived=False)
+        barcodes.invalidate()
         return JsonResponse({
             'success': True,
             'message': f'Successfully restored {restored_count} product(s)'
@@ -1075,11 +1024,26 @@ class RawMaterialsDeleteView(LoginRequiredMixin, DeleteView):
         messages.success(self.request, "🗑️ Raw Material deleted successfully.")
         return super().get_success_url()
 
-class HistoryLogList(ListView):
+class HistoryLogList(keyset.KeysetListMixin, ListView):
     model = HistoryLog
     context_object_name = 'historylog'
     template_name = "historylog_list.html"
     paginate_by = 10
+    keyset_ordering = ("-log_date", "-id")
+
+    def keyset_prepare(self, objects):
+        return resolver.for_request(self.request).attach(objects)
+
+    def keyset_row(self, obj):
+        return {
+            "id": obj.id,
+            "admin": obj.admin.username,
+            "log_type": obj.log_type.category,
+            "log_date": obj.log_date,
+            "entity_type": obj.entity_type,
+            "entity_id": obj.entity_id,
+            "entity": obj.get_entity_display(),
+        }
 
     def get_queryset(self):
         queryset = (
@@ -1140,18 +1104,14 @@ class HistoryLogList(ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        resolver.attach_page(self.request, context)
 
         today = timezone.now()
         context['current_month_value'] = today.strftime("%Y-%m")
         
-        # Get unique admins and log types for the filter dropdowns
-        context['admins'] = HistoryLog.objects.filter(
-            is_archived=False
-        ).order_by('admin__username').values_list('admin__username', flat=True).distinct()
-        
-        context['logs'] = HistoryLog.objects.filter(
-            is_archived=False
-        ).order_by('log_type__category').values_list('log_type__category', flat=True).distinct()
+        # Unique admins and log types for the filter dropdowns (cached)
+        context['admins'] = facets.values("history_admins")
+        context['logs'] = facets.values("history_log_types")
         
         # Preserve filter parameters in pagination
         filter_params = self.request.GET.copy()
@@ -1176,7 +1136,11 @@ class SaleArchiveView(View):
 class SaleArchiveOldView(View):
     def post(self, request):
         one_year_ago = timezone.now() - timedelta(days=365)
-        Sales.objects.filter(is_archived=False, date__lt=one_year_ago).update(is_archived=True)
+        old_sales = Sales.objects.filter(is_archived=False, date__lt=one_year_ago)
+        days = ledger.affected_days(ledger.SALES, old_sales)
+        old_sales.update(is_archived=True)
+        ledger.mark_changed(ledger.SALES, days)
+        facets.invalidate_model(Sales)
         return redirect('salesexpenses')
     
 class ArchivedSalesListView(ListView):
@@ -1246,7 +1210,11 @@ def sales_bulk_archive(request):
         if not ids:
             return JsonResponse({'success': False, 'message': 'No sales selected'})
         
-        archived_count = Sales.objects.filter(id__in=ids).update(is_archived=True)
+        selected = Sales.objects.filter(id__in=ids)
+        days = ledger.affected_days(ledger.SALES, selected)
+        archived_count = selected.update(is_archived=True)
+        ledger.mark_changed(ledger.SALES, days)
+        facets.invalidate_model(Sales)
         return JsonResponse({
             'success': True,
             'message': f'Successfully archived {archived_count} sale(s)'
@@ -1263,7 +1231,11 @@ class SaleBulkRestoreView(View):
                 return JsonResponse({'success': False, 'message': 'No sales selected'})
             
             # Restore selected sales
-            count = Sales.objects.filter(id__in=sale_ids, is_archived=True).update(is_archived=False)
+            selected = Sales.objects.filter(id__in=sale_ids, is_archived=True)
+            days = ledger.affected_days(ledger.SALES, selected)
+            count = selected.update(is_archived=False)
+            ledger.mark_changed(ledger.SALES, days)
+            facets.invalidate_model(Sales)
             
             return JsonResponse({'success': True, 'count': count})
         except Exception as e:
@@ -1284,6 +1256,31 @@ class SaleBulkDeleteView(View):
         except Exception as e:
             return JsonResponse({'success': False, 'message': str(e)})
 
+def withdrawal_order_rows(groups):
+    """Template rows for order groups from ``grouping`` (one list of lines each)."""
+    withdrawal_orders = []
+    for withdrawals in groups:
+        first_withdrawal = withdrawals[0]
+        # Check if this is a real order group or a single withdrawal
+        is_single = not first_withdrawal.order_group_id
+        actual_group_id = first_withdrawal.order_group_id if not is_single else None
+        
+        withdrawal_orders.append({
+            'group_id': actual_group_id if not is_single else f"single_{first_withdrawal.id}",
+            'actual_group_id': actual_group_id,
+            'is_single': is_single,
+            'customer_name': first_withdrawal.customer_name,
+            'sales_channel': first_withdrawal.get_sales_channel_display(),
+            'payment_status': first_withdrawal.payment_status,
+            'payment_status_display': first_withdrawal.get_payment_status_display() if first_withdrawal.payment_status else 'N/A',
+            'paid_amount': first_withdrawal.paid_amount,
+            'date': first_withdrawal.date,
+            'item_count': len(withdrawals),
+            'withdrawals': withdrawals,
+        })
+    return withdrawal_orders
+
+
 class SalesExpensesList(ListView):
     model = Sales
     context_object_name = 'sales'
@@ -1301,9 +1298,7 @@ class SalesExpensesList(ListView):
         # Exclude withdrawal-based sales (they have their own table below)
         # Withdrawal sales have "Order #" or "order #" in description
         qs = Sales.objects.filter(
-            is_archived=False
-        ).exclude(
-            Q(description__icontains="Order #") | Q(description__icontains="order #")
+            is_archived=False, source="MANUAL"
         ).select_related("created_by_admin").order_by("-date")
 
         query = self.request.GET.get("q", "").strip()
@@ -1390,9 +1385,7 @@ class SalesExpensesList(ListView):
             )
         
         # Calculate MANUAL sales summary (excludes withdrawal sales)
-        manual_sales_qs = Sales.objects.filter(is_archived=False).exclude(
-            Q(description__icontains="Order #") | Q(description__icontains="order #")
-        ).order_by("-date")
+        manual_sales_qs = Sales.objects.filter(is_archived=False, source="MANUAL").order_by("-date")
         
         # Apply same filters to manual sales
         if month:
@@ -1425,12 +1418,8 @@ class SalesExpensesList(ListView):
             sales_count=Count("id"),
         )
         
-        # Calculate WITHDRAWAL sales summary (only from Sales table with "Order #")
-        withdrawal_sales_qs = Sales.objects.filter(
-            is_archived=False
-        ).filter(
-            Q(description__icontains="Order #") | Q(description__icontains="order #")
-        ).order_by("-date")
+        # Calculate WITHDRAWAL sales summary from the ledger's ORDER split
+        withdrawal_sales_rollup = ledger.rollup(ledger.SALES, ledger.CHANNEL, "ORDER", include_archived=False)
         
         # Apply same month filter
         if month:
@@ -1438,18 +1427,19 @@ class SalesExpensesList(ListView):
                 year_str, month_str = month.split("-")
                 year = int(year_str)
                 month_num = int(month_str.lstrip("0"))
-                withdrawal_sales_qs = withdrawal_sales_qs.filter(date__year=year, date__month=month_num)
+                withdrawal_sales_rollup = withdrawal_sales_rollup.filter(date__year=year, date__month=month_num)
             except ValueError:
                 pass
         else:
             today = timezone.now()
-            withdrawal_sales_qs = withdrawal_sales_qs.filter(date__year=today.year, date__month=today.month)
+            withdrawal_sales_rollup = withdrawal_sales_rollup.filter(date__year=today.year, date__month=today.month)
         
-        context["withdrawal_sales_summary"] = withdrawal_sales_qs.aggregate(
-            total_sales=Sum("amount"),
-            average_sales=Avg("amount"),
-            sales_count=Count("id"),
-        )
+        withdrawal_total, withdrawal_count, withdrawal_average = ledger.summarize(withdrawal_sales_rollup)
+        context["withdrawal_sales_summary"] = {
+            "total_sales": withdrawal_total if withdrawal_count else None,
+            "average_sales": withdrawal_average,
+            "sales_count": withdrawal_count,
+        }
         
         # Calculate TOTAL sales summary (manual + withdrawal)
         manual_total = context["manual_sales_summary"]["total_sales"] or 0
@@ -1464,6 +1454,8 @@ class SalesExpensesList(ListView):
         
         # Add expenses summary for combined display
         expenses_qs = Expenses.objects.filter(is_archived=False)
+        # Summary totals come from the daily ledger rollup
+        expenses_rollup = ledger.rollup(ledger.EXPENSES, include_archived=False)
         
         # Get expense-specific filter parameters
         expense_category = self.request.GET.get("expense_category", "").strip()
@@ -1473,6 +1465,7 @@ class SalesExpensesList(ListView):
         # Apply expense category filter
         if expense_category:
             expenses_qs = expenses_qs.filter(category__iexact=expense_category)
+            expenses_rollup = ledger.rollup(ledger.EXPENSES, ledger.CATEGORY, include_archived=False).filter(key__iexact=expense_category)
         
         # Apply expense month filter
         if expense_month:
@@ -1481,18 +1474,21 @@ class SalesExpensesList(ListView):
                 year = int(year_str)
                 month_num = int(month_str.lstrip("0"))
                 expenses_qs = expenses_qs.filter(date__year=year, date__month=month_num)
+                expenses_rollup = expenses_rollup.filter(date__year=year, date__month=month_num)
             except ValueError:
                 pass
         elif not expense_show_all:
             # Default to current month if no filter and not showing all
             today = timezone.now()
             expenses_qs = expenses_qs.filter(date__year=today.year, date__month=today.month)
+            expenses_rollup = expenses_rollup.filter(date__year=today.year, date__month=today.month)
         
-        context["expenses_summary"] = expenses_qs.aggregate(
-            total_expenses=Sum("amount"),
-            average_expenses=Avg("amount"),
-            expenses_count=Count("id"),
-        )
+        total_expenses, expenses_count, average_expenses = ledger.summarize(expenses_rollup)
+        context["expenses_summary"] = {
+            "total_expenses": total_expenses if expenses_count else None,
+            "average_expenses": average_expenses,
+            "expenses_count": expenses_count,
+        }
         
         # Calculate net profit
         total_sales = context["sales_summary"]["total_sales"] or 0
@@ -1518,50 +1514,9 @@ class SalesExpensesList(ListView):
         context["expenses_page_obj"] = expenses_page_obj
         context["expenses_is_paginated"] = expenses_paginator.num_pages > 1
         
-        # Format categories for display (exclude withdrawal-based sales)
-        raw_categories = Sales.objects.filter(
-            is_archived=False
-        ).exclude(
-            Q(description__icontains="Order #") | Q(description__icontains="order #")
-        ).values_list('category', flat=True).distinct()
-        
-        # Create clean list of unique categories with proper formatting
-        # Convert UPPERCASE_WITH_UNDERSCORE to Title Case
-        # Use a dict to ensure uniqueness by normalized display name
-        categories_dict = {}
-        for cat in raw_categories:
-            if cat:  # Skip empty/None values
-                # Replace underscores with spaces and convert to title case for display
-                formatted = cat.replace('_', ' ').title()
-                
-                # Use the formatted display name as the key to prevent duplicates
-                # This ensures "Physical Store" and "PHYSICAL_STORE" are treated as the same
-                if formatted not in categories_dict:
-                    # Use original category value from database (don't convert to uppercase)
-                    categories_dict[formatted] = {'value': cat, 'display': formatted}
-        
-        # Sort by display name
-        categories = sorted(categories_dict.values(), key=lambda x: x['display'])
-        context['categories'] = categories
-
-        # Format expense categories for display
-        raw_expense_categories = Expenses.objects.filter(
-            is_archived=False
-        ).values_list('category', flat=True).distinct()
-        
-        # Create clean list of unique expense categories with proper formatting
-        expense_categories_dict = {}
-        for cat in raw_expense_categories:
-            if cat:  # Skip empty/None values
-                # Replace underscores with spaces and convert to title case for display
-                formatted = cat.replace('_', ' ').title()
-                
-                if formatted not in expense_categories_dict:
-                    expense_categories_dict[formatted] = {'value': cat, 'display': formatted}
-        
-        # Sort by display name
-        expense_categories = sorted(expense_categories_dict.values(), key=lambda x: x['display'])
-        context['expense_categories'] = expense_categories
+        # Category dropdowns, formatted for display (exclude withdrawal-based sales)
+        context['categories'] = facets.values("sales_categories")
+        context['expense_categories'] = facets.values("expense_categories")
 
         # Add withdrawal-based sales grouped by order_group_id
         month = self.request.GET.get("month", "").strip()
@@ -1584,39 +1539,14 @@ class SalesExpensesList(ListView):
             today = timezone.now()
             withdrawal_sales_qs = withdrawal_sales_qs.filter(date__year=today.year, date__month=today.month)
         
-        # Group withdrawals by order_group_id
-        from collections import defaultdict
-        grouped_orders = defaultdict(list)
-        for withdrawal in withdrawal_sales_qs:
-            if withdrawal.order_group_id:
-                grouped_orders[withdrawal.order_group_id].append(withdrawal)
-            else:
-                # For withdrawals without order_group_id, treat each as individual
-                grouped_orders[f"single_{withdrawal.id}"].append(withdrawal)
+        # Group withdrawals by order_group_id, one page of orders at a time
+        orders_paginator = grouping.GroupPaginator(withdrawal_sales_qs, 10)
+        orders_page_obj = orders_paginator.get_page(self.request.GET.get('order_page', 1))
+        orders_page_obj.object_list = withdrawal_order_rows(orders_page_obj.object_list)
         
-        # Convert to list of dicts for template
-        withdrawal_orders = []
-        for group_id, withdrawals in grouped_orders.items():
-            first_withdrawal = withdrawals[0]
-            # Check if this is a real order group or a single withdrawal
-            is_single = isinstance(group_id, str) and group_id.startswith('single_')
-            actual_group_id = group_id if not is_single else None
-            
-            withdrawal_orders.append({
-                'group_id': group_id,
-                'actual_group_id': actual_group_id,
-                'is_single': is_single,
-                'customer_name': first_withdrawal.customer_name,
-                'sales_channel': first_withdrawal.get_sales_channel_display(),
-                'payment_status': first_withdrawal.payment_status,
-                'payment_status_display': first_withdrawal.get_payment_status_display() if first_withdrawal.payment_status else 'N/A',
-                'paid_amount': first_withdrawal.paid_amount,
-                'date': first_withdrawal.date,
-                'item_count': len(withdrawals),
-                'withdrawals': withdrawals,
-            })
-        
-        context['withdrawal_orders'] = sorted(withdrawal_orders, key=lambda x: x['date'], reverse=True)
+        context['withdrawal_orders'] = orders_page_obj.object_list
+        context['withdrawal_orders_page_obj'] = orders_page_obj
+        context['withdrawal_orders_is_paginated'] = orders_paginator.num_pages > 1
         
         # Add current month value for default display
         today = timezone.now()
@@ -1681,104 +1611,55 @@ class WithdrawalOrderDetailView(View):
     template_name = "withdrawal_order_detail.html"
     
     def get(self, request, order_group_id):
-        withdrawals = Withdrawals.objects.filter(
-            order_group_id=order_group_id,
-            is_archived=False
-        ).select_related('created_by_admin').order_by('id')
+        order = orders.get_order(order_group_id)
         
-        if not withdrawals.exists():
+        if order is None:
             messages.error(request, "Order not found.")
             return redirect('withdrawalSales')
         
-        first_withdrawal = withdrawals.first()
+        withdrawals = resolver.for_request(request).attach(Withdrawals.objects.filter(
+            order_group_id=order_group_id,
+            is_archived=False
+        ).select_related('created_by_admin').order_by('id'))
+        
+        # Order-level flags come from the header:
+        # has_initial_pricing - priced during withdrawal (vs. during payment update)
+        # has_custom_price - custom price is the total for the whole order
+        has_initial_pricing = order.has_initial_pricing
+        has_custom_price = order.has_custom_price
+        
+        # Payment rows for this order, used for both the total and the history
+        sales_payments = list(Sales.objects.filter(
+            is_archived=False, order_group_id=order_group_id
+        ).order_by('date'))
+        is_paid = order.payment_status in ['PAID', 'PARTIAL']
+        
+        # For custom price or no initial pricing, the total is what was paid
+        if (has_custom_price or not has_initial_pricing) and is_paid and sales_payments:
+            total_amount = sum((p.amount for p in sales_payments), Decimal(0))
+        elif order.payment_status == 'PARTIAL':
+            # For partial, paid_amount is the TOTAL for the entire order
+            total_amount = Decimal(order.paid_amount or 0)
+        elif order.payment_status == 'PAID' and has_initial_pricing:
+            total_amount = order.total_amount or Decimal(0)
+        else:
+            total_amount = Decimal(0)
         
-        # Calculate total amount and add subtotals to each withdrawal
-        total_amount = Decimal(0)
+        prices = orders.line_prices(withdrawals) if order.payment_status == 'PAID' and has_initial_pricing else {}
         withdrawal_list = []
         
-        # Check if this order was created with prices (during withdrawal) or will be priced later (during payment update)
-        # If any withdrawal has price_type or custom_price, it was priced during withdrawal
-        # Otherwise, pricing happens during payment update
-        has_initial_pricing = any(w.price_type or w.custom_price for w in withdrawals)
-        has_custom_price = any(w.custom_price for w in withdrawals)
-        
-        # For PARTIAL payment, paid_amount is the TOTAL for the order, not per item
-        is_partial = first_withdrawal.payment_status == 'PARTIAL'
-        partial_amount_added = False
-        
-        # For custom price or no initial pricing, get total from Sales table
-        if has_custom_price or not has_initial_pricing:
-            if first_withdrawal.payment_status in ['PAID', 'PARTIAL']:
-                # Get all sales entries for this order (case-insensitive search)
-                sales_entries_list = Sales.objects.filter(
-                    is_archived=False
-                ).filter(
-                    Q(description__icontains=f"Order #{order_group_id}") | 
-                    Q(description__icontains=f"order #{order_group_id}")
-                )
-                
-                total_sum = sales_entries_list.aggregate(total=Sum('amount'))['total']
-                if total_sum:
-                    total_amount = total_sum
-                    partial_amount_added = True
-        
         for withdrawal in withdrawals:
             subtotal = None
             unit_price = None
             price_type_display = None
             
-            if withdrawal.payment_status == 'PAID':
-                if has_initial_pricing:
-                    # Order was created with prices - show individual item prices
-                    if withdrawal.custom_price:
-                        # Custom price - don't show individual subtotals
-                        # The total will be fetched from Sales table
-                        subtotal = None
-                        unit_price = None
-                        price_type_display = "Custom Price"
-                    elif withdrawal.price_type:
-                        if withdrawal.total_amount is not None and withdrawal.final_price_per_unit is not None:
-                            unit_price = withdrawal.final_price_per_unit
-                            subtotal = withdrawal.total_amount
-                            price_type_display = "Unit Price" if withdrawal.price_type == 'UNIT' else "SRP Price"
-                        else:
-                            product = Products.objects.get(id=withdrawal.item_id)
-                            if withdrawal.price_type == 'UNIT':
-                                unit_price = product.unit_price.unit_price
-                                subtotal = Decimal(withdrawal.quantity) * unit_price
-                                price_type_display = "Unit Price"
-                            elif withdrawal.price_type == 'SRP':
-                                unit_price = product.srp_price.srp_price
-                                subtotal = Decimal(withdrawal.quantity) * unit_price
-                                price_type_display = "SRP Price"
-                    if subtotal:
-                        total_amount += subtotal
-                else:
-                    # Order was created as UNPAID, then updated to PAID with total amount
-                    # Don't show individual prices, just show total at the end
-                    subtotal = None
-                    unit_price = None
-                    price_type_display = None
-                    # Get total from Sales table for this order
-                    if not partial_amount_added:
-                        sales_entries = Sales.objects.filter(
-                            description__contains=f"order #{order_group_id}",
-                            is_archived=False
-                        ).aggregate(total=Sum('amount'))
-                        if sales_entries['total']:
-                            total_amount = sales_entries['total']
-                        partial_amount_added = True
-            elif withdrawal.payment_status == 'PARTIAL':
-                # For partial, paid_amount is the TOTAL for the entire order
-                if withdrawal.paid_amount and not partial_amount_added:
-                    total_amount = Decimal(withdrawal.paid_amount)
-                    partial_amount_added = True
-                # Don't show individual prices
-                subtotal = None
-                price_type_display = None
-            else:  # UNPAID
-                subtotal = None
-                price_type_display = None
+            if withdrawal.payment_status == 'PAID' and has_initial_pricing:
+                if withdrawal.custom_price:
+                    # Custom price - don't show individual subtotals
+                    price_type_display = "Custom Price"
+                elif withdrawal.price_type and withdrawal.id in prices:
+                    unit_price, subtotal = prices[withdrawal.id]
+                    price_type_display = "Unit Price" if withdrawal.price_type == 'UNIT' else "SRP Price"
             
             # Add attributes to the withdrawal object
             withdrawal.subtotal = subtotal
@@ -1786,16 +1667,9 @@ class WithdrawalOrderDetailView(View):
             withdrawal.price_type_display = price_type_display
             withdrawal_list.append(withdrawal)
         
-        # Get payment history from Sales table
+        # Payment history from the Sales rows loaded above
         payment_history = []
         if order_group_id:
-            sales_payments = Sales.objects.filter(
-                is_archived=False
-            ).filter(
-                Q(description__icontains=f"Order #{order_group_id}") | 
-                Q(description__icontains=f"order #{order_group_id}")
-            ).order_by('date')
-            
             payment_count = 0
             for payment in sales_payments:
                 
@@ -1826,11 +1700,11 @@ class WithdrawalOrderDetailView(View):
         
         context = {
             'order_group_id': order_group_id,
-            'customer_name': first_withdrawal.customer_name,
-            'sales_channel': first_withdrawal.get_sales_channel_display(),
-            'payment_status': first_withdrawal.payment_status,
-            'payment_status_display': first_withdrawal.get_payment_status_display(),
-            'date': first_withdrawal.date,
+            'customer_name': order.customer_name,
+            'sales_channel': order.get_sales_channel_display(),
+            'payment_status': order.payment_status,
+            'payment_status_display': order.get_payment_status_display(),
+            'date': order.date,
             'withdrawals': withdrawal_list,
             'total_amount': total_amount,
             'payment_history': payment_history,
@@ -1855,8 +1729,9 @@ class WithdrawalOrderUpdatePaymentView(View):
             order_group_id=order_group_id,
             is_archived=False
         )
+        order = orders.get_order(order_group_id)
         
-        if not withdrawals.exists():
+        if order is None:
             messages.error(request, "Order not found.")
             return redirect('salesexpenses')
         
@@ -1887,26 +1762,27 @@ class WithdrawalOrderUpdatePaymentView(View):
                 return redirect('withdrawal-order-detail', order_group_id=order_group_id)
         
         # Check if transitioning from PARTIAL to PAID
-        old_payment_status = withdrawals.first().payment_status
+        old_payment_status = order.payment_status
         previous_partial_amount = Decimal(0)
         
-        if old_payment_status == 'PARTIAL' and withdrawals.first().paid_amount:
-            previous_partial_amount = Decimal(withdrawals.first().paid_amount)
+        if old_payment_status == 'PARTIAL' and order.paid_amount:
+            previous_partial_amount = Decimal(order.paid_amount)
         
-        # Update all withdrawals in the order
-        for withdrawal in withdrawals:
-            withdrawal.payment_status = new_payment_status
-            
-            if new_payment_status == 'PARTIAL':
-                # Store the total paid amount (same for all withdrawals in the order)
-                withdrawal.paid_amount = sales_amount
-            elif new_payment_status == 'PAID':
-                withdrawal.paid_amount = None
-                # Don't set custom_price - let the detail view fetch from Sales table
-            else:  # UNPAID
-                withdrawal.paid_amount = None
-            
-            withdrawal.save()
+        # Update all withdrawals in the order; the header is re-synced once
+        with transaction.atomic(), orders.batch():
+            for withdrawal in withdrawals:
+                withdrawal.payment_status = new_payment_status
+                
+                if new_payment_status == 'PARTIAL':
+                    # Store the total paid amount (same for all withdrawals in the order)
+                    withdrawal.paid_amount = sales_amount
+                elif new_payment_status == 'PAID':
+                    withdrawal.paid_amount = None
+                    # Don't set custom_price - let the detail view fetch from Sales table
+                else:  # UNPAID
+                    withdrawal.paid_amount = None
+                
+                withdrawal.save()
         
         # Create our consolidated sales entry based on payment status
         # Get AuthUser instance from request.user
@@ -1922,24 +1798,32 @@ class WithdrawalOrderUpdatePaymentView(View):
                 description = f"Payment received for order #{order_group_id}"
                 success_msg = f"✅ Order marked as PAID. ₱{sales_amount:,.2f} added to sales."
             
-            Sales.objects.create(
-                category=f"{withdrawals.first().get_sales_channel_display()} - {withdrawals.first().customer_name}",
+            sales_entry = Sales.objects.create(
+                category=f"{order.get_sales_channel_display()} - {order.customer_name}",
                 amount=sales_amount,
                 date=timezone.now().date(),
                 description=description,
-                created_by_admin=auth_user
+                created_by_admin=auth_user,
+                source="ORDER",
+                order_group_id=order_group_id
             )
+            if order.sales_id is None:
+                orders.link_sales(order_group_id, sales_entry)
             # print(f"PAID Sales entry created: Amount=P{sales_amount}, Date={timezone.now().date()}")
             messages.success(request, success_msg)
         elif new_payment_status == 'PARTIAL':
             # Add partial amount to sales
-            Sales.objects.create(
-                category=f"{withdrawals.first().get_sales_channel_display()} - {withdrawals.first().customer_name}",
+            sales_entry = Sales.objects.create(
+                category=f"{order.get_sales_channel_display()} - {order.customer_name}",
                 amount=sales_amount,
                 date=timezone.now().date(),
                 description=f"Partial payment for order #{order_group_id}",
-                created_by_admin=auth_user
+                created_by_admin=auth_user,
+                source="ORDER",
+                order_group_id=order_group_id
             )
+            if order.sales_id is None:
+                orders.link_sales(order_group_id, sales_entry)
             # print(f"PARTIAL Sales entry created: Amount=P{sales_amount}, Date={timezone.now().date()}")
             messages.success(request, f"✅ Partial payment recorded. ₱{sales_amount:,.2f} added to sales.")
         else:  # UNPAID
@@ -1988,51 +1872,22 @@ class WithdrawalSalesList(ListView):
             qs = qs.filter(sales_channel=channel)
         
         self._full_queryset = qs
-        
-        # Group by order_group_id
-        from collections import defaultdict
-        grouped_orders = defaultdict(list)
-        for withdrawal in qs:
-            if withdrawal.order_group_id:
-                grouped_orders[withdrawal.order_group_id].append(withdrawal)
-            else:
-                # For withdrawals without order_group_id, treat each as individual
-                grouped_orders[f"single_{withdrawal.id}"].append(withdrawal)
-        
-        # Convert to list of dicts for template
-        withdrawal_orders = []
-        for group_id, withdrawals in grouped_orders.items():
-            first_withdrawal = withdrawals[0]
-            # Check if this is a real order group or a single withdrawal
-            is_single = isinstance(group_id, str) and group_id.startswith('single_')
-            actual_group_id = group_id if not is_single else None
-            
-            withdrawal_orders.append({
-                'group_id': group_id,
-                'actual_group_id': actual_group_id,
-                'is_single': is_single,
-                'customer_name': first_withdrawal.customer_name,
-                'sales_channel': first_withdrawal.get_sales_channel_display(),
-                'payment_status': first_withdrawal.payment_status,
-                'payment_status_display': first_withdrawal.get_payment_status_display() if first_withdrawal.payment_status else 'N/A',
-                'paid_amount': first_withdrawal.paid_amount,
-                'date': first_withdrawal.date,
-                'item_count': len(withdrawals),
-                'withdrawals': withdrawals,
-            })
-        
-        return sorted(withdrawal_orders, key=lambda x: x['date'], reverse=True)
+        return qs
+    
+    def paginate_queryset(self, queryset, page_size):
+        # Keyset pagination over order groups: ?after=<cursor> continues
+        # from the last order shown, without counting the history.
+        groups, self.next_cursor = grouping.keyset_page(
+            queryset, page_size, self.request.GET.get("after")
+        )
+        return (None, None, withdrawal_order_rows(groups), self.next_cursor is not None)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        context["next_cursor"] = self.next_cursor
         
-        # Get unique sales channels for filter
-        channels = Withdrawals.objects.filter(
-            reason='SOLD',
-            is_archived=False,
-            sales_channel__in=['ORDER', 'CONSIGNMENT', 'RESELLER']
-        ).values_list('sales_channel', flat=True).distinct()
-        context["channels"] = channels
+        # Unique sales channels for the filter (cached)
+        context["channels"] = facets.values("withdrawal_channels")
         
         return context
 
@@ -2048,7 +1903,11 @@ class ExpenseArchiveView(View):
 class ExpenseArchiveOldView(View):
     def post(self, request):
         one_year_ago = timezone.now() - timedelta(days=365)
-        Expenses.objects.filter(is_archived=False, date__lt=one_year_ago).update(is_archived=True)
+        old_expenses = Expenses.objects.filter(is_archived=False, date__lt=one_year_ago)
+        days = ledger.affected_days(ledger.EXPENSES, old_expenses)
+        old_expenses.update(is_archived=True)
+        ledger.mark_changed(ledger.EXPENSES, days)
+        facets.invalidate_model(Expenses)
         messages.success(request, " Old expenses archived successfully.")
         return redirect('salesexpenses')
 
@@ -2078,7 +1937,11 @@ def expenses_bulk_archive(request):
         if not ids:
             return JsonResponse({'success': False, 'message': 'No expenses selected'})
         
-        archived_count = Expenses.objects.filter(id__in=ids).update(is_archived=True)
+        selected = Expenses.objects.filter(id__in=ids)
+        days = ledger.affected_days(ledger.EXPENSES, selected)
+        archived_count = selected.update(is_archived=True)
+        ledger.mark_changed(ledger.EXPENSES, days)
+        facets.invalidate_model(Expenses)
         return JsonResponse({
             'success': True,
             'message': f'Successfully archived {archived_count} expense(s)'
@@ -2207,11 +2070,25 @@ class SalesExpensesCreateView(View):
             return render(request, self.template_name, {'form': form})
 
 
-class ProductBatchList(ListView):
+class ProductBatchList(keyset.KeysetListMixin, ListView):
     model = ProductBatches
     context_object_name = 'product_batch'
     template_name = "prodbatch_list.html"
     paginate_by = 10
+    keyset_ordering = ("-batch_date", "-id")
+    keyset_select_related = ("product__product_type", "product__variant", "product__size", "product__size_unit")
+
+    def keyset_row(self, obj):
+        return {
+            "id": obj.id,
+            "product_id": obj.product_id,
+            "product": str(obj.product),
+            "quantity": obj.quantity,
+            "batch_date": obj.batch_date,
+            "manufactured_date": obj.manufactured_date,
+            "expiration_date": obj.expiration_date,
+            "is_expired": bool(obj.is_expired),
+        }
 
     def get_queryset(self):
         queryset = (
@@ -2219,7 +2096,7 @@ class ProductBatchList(ListView):
             .get_queryset()
             .select_related("product", "created_by_admin")
             .filter(is_archived=False)
-            .order_by('-id')
+            .order_by('-batch_date', '-id')
         )
 
         search = self.request.GET.get("search", "").strip()
@@ -2227,11 +2104,7 @@ class ProductBatchList(ListView):
         show_all = self.request.GET.get("show_all", "").strip()
 
         if search:
-            queryset = queryset.filter(
-                Q(product__product_type__name__icontains=search) |
-                Q(product__variant__name__icontains=search) |
-                Q(product__size__size_label__icontains=search)
-            )
+            queryset = product_search.filter_queryset(queryset, search, "product_id")
 
         if date_filter:
             try:
@@ -2410,11 +2283,7 @@ class ProductInventoryList(ListView):
         # Unified search field for Product Type, Variant, and Size
         search = self.request.GET.get("search", "").strip()
         if search:
-            queryset = queryset.filter(
-                Q(product__product_type__name__icontains=search) |
-                Q(product__variant__name__icontains=search) |
-                Q(product__size__size_label__icontains=search)
-            )
+            queryset = product_search.filter_queryset(queryset, search, "product_id")
 
         status = self.request.GET.get("status", "")
         if status == "on_stock":
@@ -2451,11 +2320,25 @@ class RawMaterialList(ListView):
         return queryset
 
     
-class RawMaterialBatchList(ListView):
+class RawMaterialBatchList(keyset.KeysetListMixin, ListView):
     model = RawMaterialBatches
     context_object_name = 'rawmatbatch'
     template_name = "rawmatbatch_list.html"
     paginate_by = 10
+    keyset_ordering = ("-batch_date", "-id")
+    keyset_select_related = ("material",)
+
+    def keyset_row(self, obj):
+        return {
+            "id": obj.id,
+            "material_id": obj.material_id,
+            "material": obj.material.name,
+            "quantity": obj.quantity,
+            "batch_date": obj.batch_date,
+            "received_date": obj.received_date,
+            "expiration_date": obj.expiration_date,
+            "is_expired": bool(obj.is_expired),
+        }
 
     def get_queryset(self):
         queryset = (
@@ -2463,7 +2346,7 @@ class RawMaterialBatchList(ListView):
             .get_queryset()
             .select_related("material", "created_by_admin")
             .filter(is_archived=False)
-            .order_by('-id')
+            .order_by('-batch_date', '-id')
         )
 
         query = self.request.GET.get("q", "").strip()
@@ -3137,35 +3020,23 @@ class WithdrawSuccessView(ListView):
         return qs
 
     def get_context_data(self, **kwargs):
-        from django.core.cache import cache
-        from collections import defaultdict
-        from django.core.paginator import Paginator
-        
         context = super().get_context_data(**kwargs)
         
         today = timezone.now()
         context['current_month_value'] = today.strftime("%Y-%m")
         
-        # Group withdrawals by order_group_id or by timestamp for non-grouped items
-        # Get all withdrawals (not paginated yet)
-        all_withdrawals = self.get_queryset()
-        
-        grouped_withdrawals = defaultdict(list)
-        for withdrawal in all_withdrawals:
-            # Use order_group_id if available, otherwise use a unique key based on timestamp
-            if withdrawal.order_group_id:
-                group_key = f"order_{withdrawal.order_group_id}"
-            else:
-                # For non-grouped withdrawals, create individual groups
-                group_key = f"single_{withdrawal.id}"
-            
-            grouped_withdrawals[group_key].append(withdrawal)
+        # Group withdrawals by order_group_id (ungrouped lines stand alone).
+        # Only the current page's groups are selected and loaded.
+        paginator = grouping.GroupPaginator(self.get_queryset(), self.paginate_by)
+        page_number = self.request.GET.get('page', 1)
+        page_obj = paginator.get_page(page_number)
         
         # Convert to list of dicts for template
         withdrawal_groups = []
-        for group_key, withdrawals_list in grouped_withdrawals.items():
+        for withdrawals_list in page_obj.object_list:
             first_withdrawal = withdrawals_list[0]
-            is_single = group_key.startswith('single_')
+            is_single = not first_withdrawal.order_group_id
+            group_key = f"single_{first_withdrawal.id}" if is_single else f"order_{first_withdrawal.order_group_id}"
             actual_group_id = first_withdrawal.order_group_id if not is_single else None
             
             withdrawal_groups.append({
@@ -3186,20 +3057,18 @@ class WithdrawSuccessView(ListView):
                 'item_count': len(withdrawals_list),
                 'withdrawals': withdrawals_list,
             })
-        
-        # Sort by date (most recent first)
-        withdrawal_groups.sort(key=lambda x: x['date'], reverse=True)
-        
-        # Manual pagination for grouped withdrawals
-        paginator = Paginator(withdrawal_groups, self.paginate_by)
-        page_number = self.request.GET.get('page', 1)
-        page_obj = paginator.get_page(page_number)
+        page_obj.object_list = withdrawal_groups
         
         # Replace the context with grouped data
         context['withdrawal_groups'] = page_obj
         context['is_paginated'] = paginator.num_pages > 1
         context['paginator'] = paginator
         context['page_obj'] = page_obj
+
+        # Resolve item names for the shown groups only
+        resolver.for_request(self.request).attach(
+            w for group in page_obj.object_list for w in group['withdrawals']
+        )
         
         return context
     
@@ -3253,181 +3122,48 @@ class WithdrawItemView(View):
         # Generate order_group_id for ORDER, CONSIGNMENT, RESELLER
         order_group_id = None
         if reason == "SOLD" and sales_channel in ['ORDER', 'CONSIGNMENT', 'RESELLER']:
-            # Get the max order_group_id and increment
-            max_id = Withdrawals.objects.filter(order_group_id__isnull=False).aggregate(
-                max_id=models.Max('order_group_id')
-            )['max_id']
-            order_group_id = (max_id or 0) + 1
-
-        count = 0
-
-        if item_type == "PRODUCT":
-            for key, value in request.POST.items():
-                if key.startswith("product_") and value:
-                    try:
-                        product_id = key.split("_")[1]
-                        quantity = Decimal(value)  # Use Decimal instead of float
-                        if quantity <= 0:
-                            continue
-                        product = Products.objects.get(id=product_id)
-                        inv = product.productinventory
-
-                        if quantity > inv.total_stock:
-                            messages.error(request, f"⚠️ Insufficient stock for {product}. Available: {inv.total_stock}")
-                            continue
-
-                        discount_val = request.POST.get(f"discount_{product_id}")
-                        discount_obj = None
-                        custom_value = None
-                        if discount_val:
-                            try:
-                                discount_obj = Discounts.objects.get(value=discount_val)
-                            except Discounts.DoesNotExist:
-                                custom_value = discount_val
-
-                        actual_discount_percent = None
-                        actual_discount_amount = None
-                        final_price_per_unit = None
-                        total_amount = None
-                        
-                        if reason == "SOLD" and price_type:
-                            # Get base price at time of sale
-                            base_price = Decimal(0)
-                            if price_type == 'UNIT':
-                                base_price = product.unit_price.unit_price
-                            elif price_type == 'SRP':
-                                base_price = product.srp_price.srp_price
-                            
-                            # Calculate discount
-                            discount_percent = Decimal(0)
-                            if discount_obj:
-                                discount_percent = Decimal(discount_obj.value)
-                            elif custom_value:
-                                discount_percent = Decimal(custom_value)
-                            
-                            # Calculate final prices
-                            discount_amount = base_price * (discount_percent / 100)
-                            final_price = base_price - discount_amount
-                            total = quantity * final_price
-                            
-                            # Store calculated values
-                            actual_unit_price = base_price
-                            actual_discount_percent = discount_percent
-                            actual_discount_amount = discount_amount
-                            final_price_per_unit = final_price
-                            total_amount = total
-
-                        Withdrawals.objects.create(
-                            item_id=product.id,
-                            item_type="PRODUCT",
-                            quantity=quantity,
-                            reason=reason,
-                            date=timezone.now(),
-                            created_by_admin=request.user,
-                            sales_channel=sales_channel if reason == "SOLD" else None,
-                            price_type=price_type if reason == "SOLD" and payment_status == "PAID" else None,
-                            custom_price=custom_price if custom_price else None,
-                            discount_id=discount_obj.id if discount_obj else None,
-                            custom_discount_value=custom_value,
-                            customer_name=customer_name if sales_channel in ['ORDER', 'CONSIGNMENT', 'RESELLER'] else None,
-                            payment_status=payment_status if sales_channel in ['ORDER', 'CONSIGNMENT', 'RESELLER'] else 'PAID',
-                            paid_amount=paid_amount if payment_status == 'PARTIAL' else None,
-                            order_group_id=order_group_id,
- 
-                            actual_unit_price=actual_unit_price,
-                            actual_discount_percent=actual_discount_percent,
-                            actual_discount_amount=actual_discount_amount,
-                            final_price_per_unit=final_price_per_unit,
-                            total_amount=total_amount,
-                        )
-
-                        inv.total_stock -= quantity
-                        inv.save()
-                        count += 1
-                    except Exception as e:
-                        import traceback
-                        error_details = traceback.format_exc()
-                    
-                        messages.error(request, f"❌ Error withdrawing product: {str(e)}")
-
-        elif item_type == "RAW_MATERIAL":
-            for key, value in request.POST.items():
-                if key.startswith("material_") and value:
-                    try:
-                        material_id = key.split("_")[1]
-                        quantity = Decimal(value)  # Use Decimal instead of float
-                        if quantity <= 0:
-                            continue
-                        material = RawMaterials.objects.get(id=material_id)
-                        inv = material.rawmaterialinventory
-
-                        if quantity > inv.total_stock:
-                            messages.error(request, f"⚠️ Insufficient stock for {material}. Available: {inv.total_stock}")
-                            continue
-
-                        Withdrawals.objects.create(
-                            item_id=material.id,
-                            item_type="RAW_MATERIAL",
-                            quantity=quantity,
-                            reason=reason,
-                            date=timezone.now(),
-                            created_by_admin=request.user,
-                        )
+            order_group_id = order_numbers.next_order_number()
 
-                        inv.total_stock -= quantity
-                        inv.save()
-                        count += 1
-                    except Exception as e:
-                        messages.error(request, f"❌ Error withdrawing raw material: {e}")
+        # All lines are locked, checked and written in one transaction;
+        # the order header is synced once at the end.
+        result = checkout.CheckoutResult()
+        if item_type in checkout.ITEM_TYPES:
+            lines = checkout.parse_lines(request.POST, item_type, result)
+            try:
+                with orders.batch():
+                    checkout.checkout(
+                        item_type,
+                        lines,
+                        user=request.user,
+                        reason=reason,
+                        sales_channel=sales_channel,
+                        price_type=price_type,
+                        custom_price=custom_price,
+                        customer_name=customer_name,
+                        payment_status=payment_status,
+                        paid_amount=paid_amount,
+                        order_group_id=order_group_id,
+                        result=result,
+                    )
+            except Exception as e:
+                messages.error(request, f"❌ Error withdrawing items: {str(e)}")
+        for error in result.errors:
+            messages.error(request, error)
+        count = result.count
 
         if count > 0:
             
             if reason == "SOLD" and sales_channel in ['ORDER', 'CONSIGNMENT', 'RESELLER'] and order_group_id:
                 if payment_status in ['PAID', 'PARTIAL']:
-                    # Calculate total amount for the order
-                    withdrawals = Withdrawals.objects.filter(order_group_id=order_group_id)
+                    order = orders.get_order(order_group_id)
                     total_sales_amount = Decimal(0)
                     
                     if payment_status == 'PARTIAL':
                         # For partial, use the paid_amount
                         total_sales_amount = paid_amount if paid_amount else Decimal(0)
-                    else:
-                        # For PAID, calculate from withdrawals
-                        has_custom_price = any(w.custom_price for w in withdrawals)
-                        
-                        if has_custom_price:
-                            # Custom price is the TOTAL for the entire order, not per item
-                            # Just use the custom_price from the first withdrawal
-                            total_sales_amount = Decimal(withdrawals.first().custom_price)
-                        else:
-                            # PRICE FIX: Use stored total_amount if available, otherwise calculate
-                            for w in withdrawals:
-                                if w.total_amount is not None:
-                                    # Use stored price (after fix implementation)
-                                    total_sales_amount += w.total_amount
-                                elif w.price_type:
-                                    product = Products.objects.get(id=w.item_id)
-                                    base_price = Decimal(0)
-                                    
-                                    if w.price_type == 'UNIT':
-                                        base_price = product.unit_price.unit_price
-                                    elif w.price_type == 'SRP':
-                                        base_price = product.srp_price.srp_price
-                                    
-                                    # Apply discount if exists
-                                    discount_percent = Decimal(0)
-                                    if w.discount_id:
-                                        discount = Discounts.objects.get(id=w.discount_id)
-                                        discount_percent = Decimal(discount.value)
-                                    elif w.custom_discount_value:
-                                        discount_percent = Decimal(w.custom_discount_value)
-                                    
-                                    # Calculate discounted price
-                                    discounted_price = base_price * (1 - (discount_percent / 100))
-                                    item_total = Decimal(w.quantity) * discounted_price
-                                    total_sales_amount += item_total
-                                    
-                                    # print(f"  Item: {product}, Qty: {w.quantity}, Base: P{base_price}, Discount: {discount_percent}%, Final: P{item_total} (calculated)")
+                    elif order is not None and order.total_amount is not None:
+                        # Custom price (whole order) or sum of the priced lines
+                        total_sales_amount = order.total_amount
                     
                     # Create ONE sales entry for the entire order
                     # print(f"Total sales amount calculated: P{total_sales_amount}")
@@ -3441,8 +3177,11 @@ class WithdrawItemView(View):
                             amount=total_sales_amount,
                             date=timezone.now().date(),
                             description=f"Order #{order_group_id}, Status: {payment_status}",
-                            created_by_admin=auth_user
+                            created_by_admin=auth_user,
+                            source="ORDER",
+                            order_group_id=order_group_id
                         )
+                        orders.link_sales(order_group_id, sales_entry)
             
             messages.success(request, f"✅ Success! {count} item(s) withdrawn. Inventory updated!")
         else:
@@ -3493,6 +3232,11 @@ class ArchivedWithdrawalsListView(ListView):
     def get_queryset(self):
         return Withdrawals.objects.filter(is_archived=True).order_by('-date')
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        resolver.attach_page(self.request, context)
+        return context
+
 
 class WithdrawalsUnarchiveView(View):
     def post(self, request, pk):
@@ -3507,7 +3251,13 @@ class WithdrawalsArchiveOldView(View):
     def post(self, request):
         from datetime import timedelta
         one_year_ago = timezone.now() - timedelta(days=365)
-        archived_count = Withdrawals.objects.filter(is_archived=False, date__lt=one_year_ago).update(is_archived=True)
+        old_withdrawals = Withdrawals.objects.filter(is_archived=False, date__lt=one_year_ago)
+        days = ledger.affected_days(ledger.WITHDRAWALS, old_withdrawals)
+        order_ids = orders.affected_orders(old_withdrawals)
+        archived_count = old_withdrawals.update(is_archived=True)
+        ledger.mark_changed(ledger.WITHDRAWALS, days)
+        facets.invalidate_model(Withdrawals)
+        orders.sync_orders(order_ids)
         messages.success(request, f"📦 {archived_count} withdrawal(s) older than 1 year have been archived.")
         return redirect('withdrawals')
 
@@ -3520,7 +3270,8 @@ def withdrawals_bulk_delete(request):
         if not ids:
             return JsonResponse({'success': False, 'message': 'No withdrawals selected'})
         
-        deleted_count = Withdrawals.objects.filter(id__in=ids).delete()[0]
+        with orders.batch():
+            deleted_count = Withdrawals.objects.filter(id__in=ids).delete()[0]
         return JsonResponse({
             'success': True,
             'message': f'Successfully deleted {deleted_count} withdrawal(s)'
@@ -3537,7 +3288,13 @@ def withdrawals_bulk_archive(request):
         if not ids:
             return JsonResponse({'success': False, 'message': 'No withdrawals selected'})
         
-        archived_count = Withdrawals.objects.filter(id__in=ids).update(is_archived=True)
+        selected = Withdrawals.objects.filter(id__in=ids)
+        days = ledger.affected_days(ledger.WITHDRAWALS, selected)
+        order_ids = orders.affected_orders(selected)
+        archived_count = selected.update(is_archived=True)
+        ledger.mark_changed(ledger.WITHDRAWALS, days)
+        facets.invalidate_model(Withdrawals)
+        orders.sync_orders(order_ids)
         return JsonResponse({
             'success': True,
             'message': f'Successfully archived {archived_count} withdrawal(s)'
@@ -3663,9 +3420,9 @@ class WithdrawUpdateView(UpdateView):
                 
                 # Update the sales entry
                 sales_entry = Sales.objects.filter(
-                    Q(description__icontains=f"Order #{withdrawal.order_group_id}") &
-                    Q(description__icontains="Status: PAID"),
-                    is_archived=False
+                    order_group_id=withdrawal.order_group_id,
+                    is_archived=False,
+                    description__contains="Status: PAID"
                 ).first()
                 
                 if sales_entry:
@@ -3712,7 +3469,11 @@ class WithdrawDeleteView(DeleteView):
         sales_channel = withdrawal.sales_channel
         payment_status = withdrawal.payment_status
         
-        # Call parent delete
+        # Linked sales entry, looked up before the line (and maybe the order) goes away
+        order = orders.get_order(order_group_id)
+        sales_entry = order.sales if order else None
+        
+        # Call parent delete (the order header re-syncs from the remaining lines)
         response = super().post(request, *args, **kwargs)
         
         # Create history log after deletion
@@ -3730,44 +3491,13 @@ class WithdrawDeleteView(DeleteView):
             payment_status in ['PAID', 'PARTIAL'] and
             order_group_id):
             
-            # Check if there are remaining withdrawals in this order
-            remaining_withdrawals = Withdrawals.objects.filter(order_group_id=order_group_id)
+            order = orders.get_order(order_group_id)
             
-            if remaining_withdrawals.exists():
-                # Recalculate total for remaining items
-                new_total = Decimal(0)
-                
-                for w in remaining_withdrawals:
-                    if w.custom_price:
-                        new_total = Decimal(w.custom_price)
-                        break
-                    elif w.price_type:
-                        product = Products.objects.get(id=w.item_id)
-                        base_price = Decimal(0)
-                        
-                        if w.price_type == 'UNIT':
-                            base_price = product.unit_price.unit_price
-                        elif w.price_type == 'SRP':
-                            base_price = product.srp_price.srp_price
-                        
-                        discount_percent = Decimal(0)
-                        if w.discount_id:
-                            discount = Discounts.objects.get(id=w.discount_id)
-                            discount_percent = Decimal(discount.value)
-                        elif w.custom_discount_value:
-                            discount_percent = Decimal(w.custom_discount_value)
-                        
-                        discounted_price = base_price * (1 - (discount_percent / 100))
-                        item_total = Decimal(w.quantity) * discounted_price
-                        new_total += item_total
-                
-                # Update sales entry
-                sales_entry = Sales.objects.filter(
-                    Q(description__icontains=f"Order #{order_group_id}"),
-                    is_archived=False
-                ).first()
+            if order is not None:
+                # Remaining items keep the order; update its sales total
+                new_total = order.total_amount
                 
-                if sales_entry:
+                if sales_entry and new_total is not None:
                     sales_entry.amount = new_total
                     sales_entry.save()
                     messages.success(request, f"🗑️ Withdrawal deleted. Sales updated to ₱{new_total:,.2f}")
@@ -3775,11 +3505,6 @@ class WithdrawDeleteView(DeleteView):
                     messages.success(request, "🗑️ Withdrawal deleted successfully.")
             else:
                 # No more withdrawals, delete the sales entry
-                sales_entry = Sales.objects.filter(
-                    Q(description__icontains=f"Order #{order_group_id}"),
-                    is_archived=False
-                ).first()
-                
                 if sales_entry:
                     sales_entry.delete()
                     messages.success(request, "🗑️ Withdrawal and sales entry deleted successfully.")
@@ -3800,7 +3525,11 @@ class WithdrawalGroupArchiveView(View):
         count = withdrawals.count()
         
         if count > 0:
+            days = ledger.affected_days(ledger.WITHDRAWALS, withdrawals)
             withdrawals.update(is_archived=True)
+            ledger.mark_changed(ledger.WITHDRAWALS, days)
+            facets.invalidate_model(Withdrawals)
+            orders.sync_order(order_group_id)
             messages.success(request, f"✅ Archived {count} withdrawal(s) from Order #{order_group_id}")
         else:
             messages.warning(request, "No withdrawals found to archive.")
@@ -3842,16 +3571,15 @@ class WithdrawalGroupDeleteView(View):
                     before=before
                 )
             
+            order = orders.get_order(order_group_id)
+            sales_entry = order.sales if order else None
+            
             # Delete all withdrawals in the group
-            withdrawals.delete()
+            with orders.batch():
+                withdrawals.delete()
             
             # Delete corresponding sales entry if applicable
             if should_delete_sales:
-                sales_entry = Sales.objects.filter(
-                    Q(description__icontains=f"Order #{order_group_id}"),
-                    is_archived=False
-                ).first()
-                
                 if sales_entry:
                     sales_entry.delete()
                     messages.success(request, f"🗑️ Deleted {count} withdrawal(s) and sales entry from Order #{order_group_id}")
@@ -3911,6 +3639,10 @@ class WithdrawalGroupEditView(View):
             messages.error(request, "Withdrawal group not found.")
             return redirect('withdrawals')
         
+        # Linked sales entry, looked up before any line is removed
+        order = orders.get_order(order_group_id)
+        sales_entry = order.sales if order else None
+        
         try:
             # Get common fields
             reason = request.POST.get("reason")
@@ -3931,124 +3663,136 @@ class WithdrawalGroupEditView(View):
                 except:
                     pass  # Invalid input, ignore
             
-            # Track if any changes were made
-            updated_count = 0
+            # Lines and header change together; the header syncs once at the end
+            with transaction.atomic(), orders.batch():
+                # Track if any changes were made
+                updated_count = 0
             
-            # Track items to delete
-            items_to_delete = []
+                # Track items to delete
+                items_to_delete = []
             
-            # Update each withdrawal in the group
-            for withdrawal in withdrawals:
-                # Check if item should be removed
-                remove_key = f"remove_{withdrawal.id}"
-                if request.POST.get(remove_key) == '1':
-                    items_to_delete.append(withdrawal)
-                    continue
+                # Load the products and discounts referenced by the form once
+                item_ids = {
+                    int(request.POST[f"item_id_{w.id}"]) for w in withdrawals
+                    if request.POST.get(f"item_id_{w.id}", "").isdigit()
+                }
+                products_by_id = Products.objects.select_related("unit_price", "srp_price").in_bulk(item_ids)
+                discounts_by_id = Discounts.objects.in_bulk()
+                discounts_by_value = {}
+                for discount in discounts_by_id.values():
+                    discounts_by_value.setdefault(discount.value, discount)
+            
+                # Update each withdrawal in the group
+                for withdrawal in withdrawals:
+                    # Check if item should be removed
+                    remove_key = f"remove_{withdrawal.id}"
+                    if request.POST.get(remove_key) == '1':
+                        items_to_delete.append(withdrawal)
+                        continue
                 
-                # Get the new values for this specific withdrawal
-                item_id_key = f"item_id_{withdrawal.id}"
-                quantity_key = f"quantity_{withdrawal.id}"
-                discount_key = f"discount_{withdrawal.id}"
+                    # Get the new values for this specific withdrawal
+                    item_id_key = f"item_id_{withdrawal.id}"
+                    quantity_key = f"quantity_{withdrawal.id}"
+                    discount_key = f"discount_{withdrawal.id}"
                 
-                new_item_id = request.POST.get(item_id_key)
-                new_quantity = request.POST.get(quantity_key)
-                discount_val = request.POST.get(discount_key)
+                    new_item_id = request.POST.get(item_id_key)
+                    new_quantity = request.POST.get(quantity_key)
+                    discount_val = request.POST.get(discount_key)
                 
-                if new_quantity and new_item_id:
-                    new_quantity = Decimal(new_quantity)
+                    if new_quantity and new_item_id:
+                        new_quantity = Decimal(new_quantity)
                     
-                    # Handle pricing based on payment status
-                    if payment_status == 'PAID':
-                        if custom_total_price:
-                            # Custom total price for entire order
+                        # Handle pricing based on payment status
+                        if payment_status == 'PAID':
+                            if custom_total_price:
+                                # Custom total price for entire order
+                                withdrawal.price_type = None
+                                withdrawal.custom_price = Decimal(custom_total_price)
+                            elif price_type in ['UNIT', 'SRP']:
+                                # Unit/SRP price type (same for all items)
+                                withdrawal.price_type = price_type
+                                withdrawal.custom_price = None
+                            else:
+                                withdrawal.price_type = None
+                                withdrawal.custom_price = None
+                        elif payment_status == 'PARTIAL':
+                            # Partial payment - store paid amount
                             withdrawal.price_type = None
-                            withdrawal.custom_price = Decimal(custom_total_price)
-                        elif price_type in ['UNIT', 'SRP']:
-                            # Unit/SRP price type (same for all items)
-                            withdrawal.price_type = price_type
                             withdrawal.custom_price = None
+                            if paid_amount:
+                                withdrawal.paid_amount = Decimal(paid_amount)
                         else:
+                            # UNPAID - clear pricing
                             withdrawal.price_type = None
                             withdrawal.custom_price = None
-                    elif payment_status == 'PARTIAL':
-                        # Partial payment - store paid amount
-                        withdrawal.price_type = None
-                        withdrawal.custom_price = None
-                        if paid_amount:
-                            withdrawal.paid_amount = Decimal(paid_amount)
-                    else:
-                        # UNPAID - clear pricing
-                        withdrawal.price_type = None
-                        withdrawal.custom_price = None
-                        withdrawal.paid_amount = None
+                            withdrawal.paid_amount = None
                     
-                    # Handle discount (only for Unit/SRP, not for custom price)
-                    discount_obj = None
-                    custom_discount = None
-                    if discount_val and withdrawal.price_type:  # Only apply discount if price_type is set
-                        try:
-                            discount_obj = Discounts.objects.get(value=discount_val)
-                        except Discounts.DoesNotExist:
-                            custom_discount = discount_val
-                    else:
-                        # Clear discount if custom price
-                        withdrawal.discount_id = None
-                        withdrawal.custom_discount_value = None
+                        # Handle discount (only for Unit/SRP, not for custom price)
+                        discount_obj = None
+                        custom_discount = None
+                        if discount_val and withdrawal.price_type:  # Only apply discount if price_type is set
+                            try:
+                                discount_obj = discounts_by_value.get(Decimal(discount_val))
+                            except InvalidOperation:
+                                discount_obj = None
+                            if discount_obj is None:
+                                custom_discount = discount_val
+                        else:
+                            # Clear discount if custom price
+                            withdrawal.discount_id = None
+                            withdrawal.custom_discount_value = None
                     
-                    # Update withdrawal
-                    withdrawal.item_id = int(new_item_id)  # Update item_id
-                    withdrawal.quantity = new_quantity
-                    withdrawal.reason = reason
-                    withdrawal.sales_channel = sales_channel if reason == "SOLD" else None
-                    withdrawal.customer_name = customer_name if sales_channel in ['ORDER', 'CONSIGNMENT', 'RESELLER'] else None
-                    withdrawal.payment_status = payment_status if sales_channel in ['ORDER', 'CONSIGNMENT', 'RESELLER'] else 'PAID'
+                        # Update withdrawal
+                        withdrawal.item_id = int(new_item_id)  # Update item_id
+                        withdrawal.quantity = new_quantity
+                        withdrawal.reason = reason
+                        withdrawal.sales_channel = sales_channel if reason == "SOLD" else None
+                        withdrawal.customer_name = customer_name if sales_channel in ['ORDER', 'CONSIGNMENT', 'RESELLER'] else None
+                        withdrawal.payment_status = payment_status if sales_channel in ['ORDER', 'CONSIGNMENT', 'RESELLER'] else 'PAID'
                     
-                    if discount_obj or custom_discount:
-                        withdrawal.discount_id = discount_obj.id if discount_obj else None
-                        withdrawal.custom_discount_value = custom_discount
+                        if discount_obj or custom_discount:
+                            withdrawal.discount_id = discount_obj.id if discount_obj else None
+                            withdrawal.custom_discount_value = custom_discount
                     
-                    if withdrawal.price_type:
-                        product = Products.objects.get(id=withdrawal.item_id)
-                        base_price = Decimal(0)
+                        if withdrawal.price_type:
+                            product = products_by_id.get(withdrawal.item_id) or Products.objects.get(id=withdrawal.item_id)
+                            base_price = Decimal(0)
                         
-                        if withdrawal.price_type == 'UNIT':
-                            base_price = product.unit_price.unit_price
-                        elif withdrawal.price_type == 'SRP':
-                            base_price = product.srp_price.srp_price
+                            if withdrawal.price_type == 'UNIT':
+                                base_price = product.unit_price.unit_price
+                            elif withdrawal.price_type == 'SRP':
+                                base_price = product.srp_price.srp_price
                         
-                        # Calculate discount
-                        discount_percent = Decimal(0)
-                        if withdrawal.discount_id:
-                            discount = Discounts.objects.get(id=withdrawal.discount_id)
-                            discount_percent = Decimal(discount.value)
-                        elif withdrawal.custom_discount_value:
-                            discount_percent = Decimal(withdrawal.custom_discount_value)
+                            # Calculate discount
+                            discount_percent = Decimal(0)
+                            if withdrawal.discount_id:
+                                discount = discounts_by_id.get(withdrawal.discount_id) or Discounts.objects.get(id=withdrawal.discount_id)
+                                discount_percent = Decimal(discount.value)
+                            elif withdrawal.custom_discount_value:
+                                discount_percent = Decimal(withdrawal.custom_discount_value)
                         
-                        # Calculate and store actual prices
-                        discount_amount = base_price * (discount_percent / 100)
-                        final_price = base_price - discount_amount
-                        total = withdrawal.quantity * final_price
+                            # Calculate and store actual prices
+                            discount_amount = base_price * (discount_percent / 100)
+                            final_price = base_price - discount_amount
+                            total = withdrawal.quantity * final_price
                         
-                        withdrawal.actual_unit_price = base_price
-                        withdrawal.actual_discount_percent = discount_percent
-                        withdrawal.actual_discount_amount = discount_amount
-                        withdrawal.final_price_per_unit = final_price
-                        withdrawal.total_amount = total
+                            withdrawal.actual_unit_price = base_price
+                            withdrawal.actual_discount_percent = discount_percent
+                            withdrawal.actual_discount_amount = discount_amount
+                            withdrawal.final_price_per_unit = final_price
+                            withdrawal.total_amount = total
                     
-                    withdrawal.save()
-                    updated_count += 1
+                        withdrawal.save()
+                        updated_count += 1
             
-            # Delete marked items
-            deleted_count = 0
-            for withdrawal in items_to_delete:
-                withdrawal.delete()
-                deleted_count += 1
+                # Delete marked items
+                deleted_count = 0
+                for withdrawal in items_to_delete:
+                    withdrawal.delete()
+                    deleted_count += 1
             
             # Handle sales entry based on payment status
-            sales_entry = Sales.objects.filter(
-                Q(description__icontains=f"Order #{order_group_id}"),
-                is_archived=False
-            ).first()
+            order = orders.get_order(order_group_id)
             
             if (reason == 'SOLD' and 
                 sales_channel in ['ORDER', 'CONSIGNMENT', 'RESELLER']):
@@ -4076,34 +3820,9 @@ class WithdrawalGroupEditView(View):
                         # Use paid amount for partial payments
                         if paid_amount:
                             new_total = Decimal(paid_amount)
-                    elif payment_status == 'PAID':
-                        # Calculate from withdrawals
-                        for w in withdrawals:
-                            if w.custom_price:
-                                # Custom price is the TOTAL for the entire order
-                                new_total = Decimal(w.custom_price)
-                                break  # Stop after first custom price (should only be one)
-                            elif w.price_type:
-                                # Unit/SRP price with discount
-                                product = Products.objects.get(id=w.item_id)
-                                base_price = Decimal(0)
-                                
-                                if w.price_type == 'UNIT':
-                                    base_price = product.unit_price.unit_price
-                                elif w.price_type == 'SRP':
-                                    base_price = product.srp_price.srp_price
-                                
-                                # Apply discount
-                                discount_percent = Decimal(0)
-                                if w.discount_id:
-                                    discount = Discounts.objects.get(id=w.discount_id)
-                                    discount_percent = Decimal(discount.value)
-                                elif w.custom_discount_value:
-                                    discount_percent = Decimal(w.custom_discount_value)
-                                
-                                discounted_price = base_price * (1 - (discount_percent / 100))
-                                item_total = Decimal(w.quantity) * discounted_price
-                                new_total += item_total
+                    elif payment_status == 'PAID' and order is not None:
+                        # Custom price (whole order) or sum of the priced lines
+                        new_total = order.total_amount or Decimal(0)
                     
                     # Update or create sales entry
                     if sales_entry:
@@ -4116,12 +3835,15 @@ class WithdrawalGroupEditView(View):
                         messages.success(request, msg)
                     else:
                         # Create new sales entry if it doesn't exist
-                        Sales.objects.create(
+                        sales_entry = Sales.objects.create(
                             amount=new_total,
                             description=f"Order #{order_group_id} - {customer_name or 'N/A'} - Status: {payment_status}",
                             date=timezone.now().date(),
-                            created_by_admin=request.user
+                            created_by_admin=AuthUser.objects.get(id=request.user.id),
+                            source="ORDER",
+                            order_group_id=order_group_id
                         )
+                        orders.link_sales(order_group_id, sales_entry)
                         msg = f"✅ Updated {updated_count} withdrawal(s)"
                         if deleted_count > 0:
                             msg += f", deleted {deleted_count} item(s)"
@@ -4152,6 +3874,17 @@ def get_stock(request):
     item_type = request.GET.get("type")
     item_id = request.GET.get("id")
 
+    # Bulk variant: ?type=PRODUCT&ids=1,2,3 -> {"stock": {"1": ..., ...}}
+    ids = request.GET.get("ids")
+    if ids is not None:
+        if item_type not in stock_feed.INVENTORIES:
+            return JsonResponse({"stock": {}})
+        try:
+            item_ids = [int(value) for value in ids.split(",") if value.strip()]
+        except ValueError:
+            return JsonResponse({"error": "ids must be comma-separated integers"}, status=400)
+        return JsonResponse({"stock": stock_feed.levels(item_type, item_ids)})
+
     if item_type == "PRODUCT":
         inventory = ProductInventory.objects.filter(product_id=item_id).first()
     elif item_type == "RAW_MATERIAL":
@@ -4161,11 +3894,26 @@ def get_stock(request):
 
     return JsonResponse({"stock": inventory.total_stock if inventory else 0})
 
-class NotificationsList(ListView):
+class NotificationsList(keyset.KeysetListMixin, ListView):
     model = Notifications
     context_object_name = 'notifications'
     template_name = "notification.html"
     paginate_by = 10
+    keyset_ordering = ("-notification_timestamp", "-id")
+
+    def keyset_prepare(self, objects):
+        return resolver.for_request(self.request).attach(objects)
+
+    def keyset_row(self, obj):
+        return {
+            "id": obj.id,
+            "notification_type": obj.notification_type,
+            "item_type": obj.item_type,
+            "item_id": obj.item_id,
+            "message": obj.formatted_message,
+            "notification_timestamp": obj.notification_timestamp,
+            "is_read": obj.is_read,
+        }
 
     def get_queryset(self):
         qs = Notifications.objects.filter(is_archived=False).order_by('-notification_timestamp')
@@ -4206,6 +3954,7 @@ class NotificationsList(ListView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        resolver.attach_page(self.request, context)
         # Add current month value for default display
         today = timezone.now()
         context['current_month_value'] = today.strftime("%Y-%m")
@@ -4214,6 +3963,7 @@ class NotificationsList(ListView):
     def get(self, request, *args, **kwargs):
         # Mark all as read
         Notifications.objects.filter(is_read=False).update(is_read=True)
+        notification_header.invalidate()
         
         # Handle pagination - if page doesn't exist, redirect to page 1 with same filters
         try:
@@ -4261,51 +4011,42 @@ class BulkProductBatchCreateView(View):
         deduct_raw_material = form.cleaned_data['deduct_raw_material']
         auth_user = get_or_create_auth_user(request.user)
 
-        try:
-            with transaction.atomic():
-                added_any = False
-
-                for product_info in form.products:
-                    product = product_info['product']
-                    qty = form.cleaned_data.get(f'product_{product.id}_qty')
-
-                    if not qty or float(qty) <= 0:
-                        continue
-
-                    ProductBatches.objects.create(
-                        product=product,
-                        quantity=qty,
-                        batch_date=batch_date,
-                        manufactured_date=manufactured_date,
-                        created_by_admin=auth_user,
-                        deduct_raw_material=deduct_raw_material,
-                    )
-                    added_any = True
-
-                if not added_any:
-                    raise ValueError("⚠️ No product quantities were entered.")
-
-        except Exception as e:
-            error_message = str(e)
-
-            if "Not enough stock" in error_message:
-                error_message = error_message.split("CONTEXT:")[0].strip()
-            elif "insufficient" in error_message.lower():
-                error_message = "❌ Insufficient raw materials to create this batch."
-            elif "No product quantities" in error_message:
-                error_message = "⚠️ No product quantities were entered."
-            else:
-                error_message = f"❌ {error_message}"
-
-            messages.error(request, error_message)
+        quantities = {}
+        for product_info in form.products:
+            product = product_info['product']
+            qty = form.cleaned_data.get(f'product_{product.id}_qty')
+            if qty and qty > 0:
+                quantities[product] = qty
 
+        if not quantities:
+            messages.error(request, "⚠️ No product quantities were entered.")
             return render(request, self.template_name, {
                 'form': form,
                 'products': form.products
             })
 
-        messages.success(request, "✅ Product Batch added successfully.")
-        return redirect("product-batch")
+        try:
+            # Raw material needs are checked for the whole run up front
+            production.produce(
+                quantities,
+                user=auth_user,
+                manufactured_date=manufactured_date,
+                batch_date=batch_date,
+                deduct_raw_material=deduct_raw_material,
+            )
+        except production.InsufficientStock as e:
+            for shortfall in e.shortfalls:
+                messages.error(request, str(shortfall))
+        except Exception as e:
+            messages.error(request, f"❌ {e}")
+        else:
+            messages.success(request, "✅ Product Batch added successfully.")
+            return redirect("product-batch")
+
+        return render(request, self.template_name, {
+            'form': form,
+            'products': form.products
+        })
 
 
 class BulkRawMaterialBatchCreateView(LoginRequiredMixin, View):
@@ -4390,11 +4131,26 @@ def mark_notification_read(request, pk):
     return redirect('notifications')
 
 
-class StockChangesList(ListView):
+class StockChangesList(keyset.KeysetListMixin, ListView):
     model = StockChanges
     context_object_name = 'stock_changes'
     template_name = "stock_changes.html"
     paginate_by = 10
+    keyset_ordering = ("-date", "-id")
+
+    def keyset_prepare(self, objects):
+        return resolver.for_request(self.request).attach(objects)
+
+    def keyset_row(self, obj):
+        return {
+            "id": obj.id,
+            "item_type": obj.item_type,
+            "item_id": obj.item_id,
+            "item": str(obj.get_item() or ""),
+            "quantity_change": obj.quantity_change,
+            "category": obj.category,
+            "date": obj.date,
+        }
 
     def get_queryset(self):
         qs = StockChanges.objects.filter(is_archived=False).order_by('-date')
@@ -4423,6 +4179,7 @@ class StockChangesList(ListView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        resolver.attach_page(self.request, context)
         today = timezone.now()
         context['current_month_value'] = today.strftime("%Y-%m")
         return context
@@ -4449,6 +4206,11 @@ class ArchivedStockChangesListView(ListView):
     def get_queryset(self):
         return StockChanges.objects.filter(is_archived=True).order_by('-date')
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        resolver.attach_page(self.request, context)
+        return context
+
 
 class StockChangesUnarchiveView(View):
     def post(self, request, pk):
@@ -5199,47 +4961,13 @@ def export_sales(request):
     end_date = request.GET.get('end')
 
     qs = Sales.objects.filter(is_archived=False)
+    qs = exports.filter_period(qs, filter_type, start_date, end_date)
 
-    if filter_type == "date" and start_date:
-        # Parse the date string and filter by exact date
-        try:
-            year, month, day = start_date.split('-')
-            qs = qs.filter(date__year=int(year), date__month=int(month), date__day=int(day))
-        except (ValueError, AttributeError):
-            pass
-
-    elif filter_type == "month" and start_date:
-        start = datetime.strptime(start_date, "%Y-%m")
-        qs = qs.filter(date__year=start.year, date__month=start.month)
-
-    elif filter_type == "year" and start_date:
-        year = int(start_date)
-        qs = qs.filter(date__year=year)
-
-    elif filter_type == "range" and start_date and end_date:
-        start = datetime.strptime(start_date, "%Y-%m")
-        end = datetime.strptime(end_date, "%Y-%m")
-        
-        from calendar import monthrange
-        start = start.replace(day=1)
-        last_day = monthrange(end.year, end.month)[1]
-        end = end.replace(day=last_day)
-        qs = qs.filter(date__range=(start.date(), end.date()))
-
-    total_sales = sum(s.amount for s in qs)
-
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="sales_{filter_type}.csv"'
-
-    writer = csv.writer(response)
-    writer.writerow(['Category', 'Amount', 'Date', 'Description', 'Created By'])
-
-    for s in qs:
-        writer.writerow([s.category, s.amount, s.date.strftime("%Y-%m-%d"), s.description, s.created_by_admin.username])
-
-    writer.writerow([])
-    writer.writerow(['', 'TOTAL SALES', total_sales])
-    return response
+    return exports.csv_response(
+        request,
+        exports.record_rows(qs, 'TOTAL SALES'),
+        f"sales_{filter_type}.csv",
+    )
 
 def export_expenses(request):
     filter_type = request.GET.get('filter', 'date')
@@ -5247,47 +4975,13 @@ def export_expenses(request):
     end_date = request.GET.get('end')
 
     qs = Expenses.objects.filter(is_archived=False)
+    qs = exports.filter_period(qs, filter_type, start_date, end_date)
 
-    if filter_type == "date" and start_date:
-        # Parse the date string and filter by exact date
-        try:
-            year, month, day = start_date.split('-')
-            qs = qs.filter(date__year=int(year), date__month=int(month), date__day=int(day))
-        except (ValueError, AttributeError):
-            pass
-
-    elif filter_type == "month" and start_date:
-        start = datetime.strptime(start_date, "%Y-%m")
-        qs = qs.filter(date__year=start.year, date__month=start.month)
-
-    elif filter_type == "year" and start_date:
-        year = int(start_date)
-        qs = qs.filter(date__year=year)
-
-    elif filter_type == "range" and start_date and end_date:
-        start = datetime.strptime(start_date, "%Y-%m")
-        end = datetime.strptime(end_date, "%Y-%m")
-
-        from calendar import monthrange
-        start = start.replace(day=1)
-        last_day = monthrange(end.year, end.month)[1]
-        end = end.replace(day=last_day)
-        qs = qs.filter(date__range=(start.date(), end.date()))
-
-    total_expenses = sum(e.amount for e in qs)
-
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="expenses_{filter_type}.csv"'
-
-    writer = csv.writer(response)
-    writer.writerow(['Category', 'Amount', 'Date', 'Description', 'Created By'])
-
-    for e in qs:
-        writer.writerow([e.category, e.amount, e.date.strftime("%Y-%m-%d"), e.description, e.created_by_admin.username])
-
-    writer.writerow([])
-    writer.writerow(['', 'TOTAL EXPENSES', total_expenses])
-    return response
+    return exports.csv_response(
+        request,
+        exports.record_rows(qs, 'TOTAL EXPENSES'),
+        f"expenses_{filter_type}.csv",
+    )
 
 class UserActivityList(ListView):
     model = User
@@ -5302,6 +4996,15 @@ class UserActivityList(ListView):
             users = users.filter(username__icontains=query)
         return users
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Show heartbeats newer than the stored user_activity value
+        for user in context['users']:
+            user_activity = getattr(user, 'useractivity', None)
+            if user_activity is not None:
+                user_activity.last_activity = activity.merged_last_activity(user_activity)
+        return context
+
 
 @receiver(user_logged_in)
 def set_user_active(sender, user, request, **kwargs):
@@ -5495,54 +5198,26 @@ class BestSellerProductsView(LoginRequiredMixin, TemplateView):
 @login_required
 def database_backup(request):
     """
-    Generate and download a Django JSON fixture backup
+    Stream a compressed Django JSON fixture backup
     Only administrator can access this feature
     """
-    from django.http import HttpResponse, HttpResponseForbidden
-    from django.core import serializers
-    from django.apps import apps
+    from django.http import HttpResponseForbidden, StreamingHttpResponse
     from datetime import datetime
-    import json
 
     if not request.user.is_superuser:
         return HttpResponseForbidden("Access denied. Only administrators can backup the database.")
     
     if request.method == 'POST':
         try:
+            compression = request.POST.get('compression', 'gzip')
+            if compression not in backup.COMPRESSIONS:
+                compression = 'gzip'
+            backup.check_compression(compression)
+
             # Create filename with timestamp
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f'reals_backup_{timestamp}.json'
-            
-            # Get all models from realsproj app (including managed=False)
-            app_models = apps.get_app_config('realsproj').get_models()
-            
-            # Serialize all data
-            all_data = []
-            for model in app_models:
-                try:
-                    # Get all objects from this model
-                    queryset = model.objects.all()
-                    if queryset.exists():
-                        model_data = serializers.serialize('json', queryset)
-                        all_data.extend(json.loads(model_data))
-                except Exception as e:
-                    # Skip models that can't be serialized
-                    print(f"Skipping {model.__name__}: {e}")
-                    continue
+            filename = f'reals_backup_{timestamp}{backup.EXTENSIONS[compression]}'
             
-            # Convert to JSON string with pretty formatting
-            json_content = json.dumps(all_data, indent=2, ensure_ascii=False)
-            
-            # Create JSON response
-            response = HttpResponse(
-                json_content,
-                content_type='application/json'
-            )
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            
-            response.write(u'\ufeff'.encode('utf8'))
-            
-            # Log the backup action
             auth_user = AuthUser.objects.get(id=request.user.id)
             
             # Get or create HistoryLogTypes for backup
@@ -5551,19 +5226,41 @@ def database_backup(request):
                 defaults={'created_by_admin': auth_user}
             )
             
-            HistoryLog.objects.create(
-                admin_id=auth_user.id,
-                log_type_id=log_type.id,
-                log_date=timezone.now(),
-                entity_type='system',
-                entity_id=0
+            manifest = backup.new_manifest(compression)
+
+            def stream():
+                # Every realsproj table (including managed=False), read in
+                # pk-ordered chunks and compressed in blocks as it is sent.
+                yield from backup.compress(backup.iter_backup(manifest), compression)
+
+                # Log the backup once it has been fully streamed
+                HistoryLog.objects.create(
+                    admin_id=auth_user.id,
+                    log_type_id=log_type.id,
+                    log_date=timezone.now(),
+                    entity_type='system',
+                    entity_id=0,
+                    details={'after': {
+                        'file': filename,
+                        'rows': manifest['total'],
+                        'models': len(manifest['models']),
+                        'skipped': [entry['model'] for entry in manifest['skipped']],
+                    }},
+                )
+
+            response = StreamingHttpResponse(
+                exports.streaming_body(request, stream(), batch_size=1),
+                content_type=backup.CONTENT_TYPES[compression],
             )
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
             
             messages.success(request, '✅ Database backup created successfully!')
             return response
             
         except Exception as e:
             messages.error(request, f'❌ Backup error: {e}')
+
+    return redirect('home')
 @login_required
 def financial_loss(request):
 
@@ -5579,11 +5276,7 @@ def financial_loss(request):
     show_all = request.GET.get('show_all', '').strip()
     today = timezone.now()
 
-    product_withdrawals = Withdrawals.objects.filter(
-        item_type='PRODUCT',
-        reason__in=['EXPIRED', 'DAMAGED'],
-        is_archived=False
-    ).select_related('created_by_admin').order_by('-date')
+    product_withdrawals = losses.loss_withdrawals('PRODUCT')
 
     if date_filter:
         try:
@@ -5596,11 +5289,7 @@ def financial_loss(request):
     elif not show_all:
         product_withdrawals = product_withdrawals.filter(date__year=today.year, date__month=today.month)
 
-    raw_material_withdrawals = Withdrawals.objects.filter(
-        item_type='RAW_MATERIAL',
-        reason__in=['EXPIRED', 'DAMAGED'],
-        is_archived=False
-    ).select_related('created_by_admin').order_by('-date')
+    raw_material_withdrawals = losses.loss_withdrawals('RAW_MATERIAL')
 
     if date_filter:
         try:
@@ -5613,62 +5302,24 @@ def financial_loss(request):
     elif not show_all:
         raw_material_withdrawals = raw_material_withdrawals.filter(date__year=today.year, date__month=today.month)
 
-    product_loss_data = []
-    total_product_loss = Decimal('0.00')
-    
-    for withdrawal in product_withdrawals:
-        try:
-            product = Products.objects.select_related(
-                'product_type', 'variant', 'size', 'size_unit', 'unit_price'
-            ).get(id=withdrawal.item_id)
-            
-            loss_amount = Decimal(withdrawal.quantity) * product.unit_price.unit_price
-            total_product_loss += loss_amount
-            
-            product_loss_data.append({
-                'date': withdrawal.date,
-                'product_name': str(product),
-                'quantity': withdrawal.quantity,
-                'unit_price': product.unit_price.unit_price,
-                'reason': withdrawal.reason,
-                'get_reason_display': withdrawal.get_reason_display(),
-                'loss_amount': loss_amount
-            })
-        except Products.DoesNotExist:
-            continue
+    # Prices are joined in SQL: totals are one aggregate per item type and
+    # only the visible page of rows is loaded.
+    product_withdrawals = losses.with_loss(product_withdrawals, 'PRODUCT')
+    raw_material_withdrawals = losses.with_loss(raw_material_withdrawals, 'RAW_MATERIAL')
 
-    raw_material_loss_data = []
-    total_raw_material_loss = Decimal('0.00')
-    
-    for withdrawal in raw_material_withdrawals:
-        try:
-            material = RawMaterials.objects.select_related('unit').get(id=withdrawal.item_id)
-            
-            loss_amount = Decimal(withdrawal.quantity) * material.price_per_unit
-            total_raw_material_loss += loss_amount
-            
-            raw_material_loss_data.append({
-                'date': withdrawal.date,
-                'material_name': material.name,
-                'quantity': withdrawal.quantity,
-                'unit_name': material.unit.unit_name,
-                'price_per_unit': material.price_per_unit,
-                'reason': withdrawal.reason,
-                'get_reason_display': withdrawal.get_reason_display(),
-                'loss_amount': loss_amount
-            })
-        except RawMaterials.DoesNotExist:
-            continue
-    
+    total_product_loss = losses.total_loss(product_withdrawals)
+    total_raw_material_loss = losses.total_loss(raw_material_withdrawals)
     total_loss = total_product_loss + total_raw_material_loss
     
     product_page = request.GET.get('product_page', 1)
-    product_paginator = Paginator(product_loss_data, 10)
+    product_paginator = Paginator(product_withdrawals, 10)
     product_page_obj = product_paginator.get_page(product_page)
+    product_page_obj.object_list = losses.loss_rows(product_page_obj.object_list, 'PRODUCT')
     
     raw_material_page = request.GET.get('raw_material_page', 1)
-    raw_material_paginator = Paginator(raw_material_loss_data, 10)
+    raw_material_paginator = Paginator(raw_material_withdrawals, 10)
     raw_material_page_obj = raw_material_paginator.get_page(raw_material_page)
+    raw_material_page_obj.object_list = losses.loss_rows(raw_material_page_obj.object_list, 'RAW_MATERIAL')
     
     context = {
         'product_withdrawals': product_page_obj,
@@ -5695,111 +5346,53 @@ def financial_loss_export(request):
     start_date = request.GET.get('start')
     end_date = request.GET.get('end')
 
-    product_qs = Withdrawals.objects.filter(
-        item_type='PRODUCT',
-        reason__in=['EXPIRED', 'DAMAGED'],
-        is_archived=False
-    )
-
-    raw_material_qs = Withdrawals.objects.filter(
-        item_type='RAW_MATERIAL',
-        reason__in=['EXPIRED', 'DAMAGED'],
-        is_archived=False
-    )
-
-    if filter_type == "date" and start_date:
-        try:
-            year, month, day = start_date.split('-')
-            product_qs = product_qs.filter(date__year=int(year), date__month=int(month), date__day=int(day))
-            raw_material_qs = raw_material_qs.filter(date__year=int(year), date__month=int(month), date__day=int(day))
-        except (ValueError, AttributeError):
-            pass
-    
-    elif filter_type == "month" and start_date:
-        start = datetime.strptime(start_date, "%Y-%m")
-        product_qs = product_qs.filter(date__year=start.year, date__month=start.month)
-        raw_material_qs = raw_material_qs.filter(date__year=start.year, date__month=start.month)
-    
-    elif filter_type == "year" and start_date:
-        year = int(start_date)
-        product_qs = product_qs.filter(date__year=year)
-        raw_material_qs = raw_material_qs.filter(date__year=year)
-    
-    elif filter_type == "range" and start_date and end_date:
-        start = datetime.strptime(start_date, "%Y-%m")
-        end = datetime.strptime(end_date, "%Y-%m")
-        
-        from calendar import monthrange
-        start = start.replace(day=1)
-        last_day = monthrange(end.year, end.month)[1]
-        end = end.replace(day=last_day)
-        product_qs = product_qs.filter(date__range=(start.date(), end.date()))
-        raw_material_qs = raw_material_qs.filter(date__range=(start.date(), end.date()))
-
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="financial_loss_{filter_type}.csv"'
-    response.write(u'\ufeff'.encode('utf8'))
-    
-    writer = csv.writer(response)
-
-    writer.writerow(['PRODUCTS - EXPIRED & DAMAGED'])
-    writer.writerow(['Date', 'Product', 'Quantity', 'Unit Price', 'Reason', 'Financial Loss'])
-    
-    total_product_loss = Decimal('0.00')
-    for withdrawal in product_qs:
-        try:
-            product = Products.objects.select_related(
-                'product_type', 'variant', 'size', 'size_unit', 'unit_price'
-            ).get(id=withdrawal.item_id)
-            
-            loss_amount = Decimal(withdrawal.quantity) * product.unit_price.unit_price
-            total_product_loss += loss_amount
-            
-            writer.writerow([
-                withdrawal.date.strftime("%Y-%m-%d %H:%M"),
-                str(product),
-                withdrawal.quantity,
-                product.unit_price.unit_price,
-                withdrawal.get_reason_display(),
-                f"{loss_amount:.2f}"
-            ])
-        except Products.DoesNotExist:
-            continue
-    
-    writer.writerow([])
-    writer.writerow(['', '', '', '', 'TOTAL PRODUCT LOSS', f"₱{total_product_loss:.2f}"])
-    writer.writerow([])
-
-    writer.writerow(['RAW MATERIALS - EXPIRED & DAMAGED'])
-    writer.writerow(['Date', 'Raw Material', 'Quantity', 'Price per Unit', 'Reason', 'Financial Loss'])
-    
-    total_raw_material_loss = Decimal('0.00')
-    for withdrawal in raw_material_qs:
-        try:
-            material = RawMaterials.objects.select_related('unit').get(id=withdrawal.item_id)
-            
-            loss_amount = Decimal(withdrawal.quantity) * material.price_per_unit
-            total_raw_material_loss += loss_amount
-            
-            writer.writerow([
-                withdrawal.date.strftime("%Y-%m-%d %H:%M"),
-                f"{material.name} ({material.unit.unit_name})",
-                withdrawal.quantity,
-                material.price_per_unit,
-                withdrawal.get_reason_display(),
-                f"{loss_amount:.2f}"
-            ])
-        except RawMaterials.DoesNotExist:
-            continue
-    
-    writer.writerow([])
-    writer.writerow(['', '', '', '', 'TOTAL RAW MATERIAL LOSS', f"₱{total_raw_material_loss:.2f}"])
-    writer.writerow([])
-
-    total_loss = total_product_loss + total_raw_material_loss
-    writer.writerow(['', '', '', '', 'TOTAL FINANCIAL LOSS', f"₱{total_loss:.2f}"])
-    
-    return response
+    product_qs = exports.filter_period(losses.loss_withdrawals('PRODUCT'), filter_type, start_date, end_date)
+    raw_material_qs = exports.filter_period(losses.loss_withdrawals('RAW_MATERIAL'), filter_type, start_date, end_date)
+
+    product_qs = losses.with_loss(product_qs, 'PRODUCT')
+    raw_material_qs = losses.with_loss(raw_material_qs, 'RAW_MATERIAL')
+
+    def rows():
+        yield ['PRODUCTS - EXPIRED & DAMAGED']
+        yield ['Date', 'Product', 'Quantity', 'Unit Price', 'Reason', 'Financial Loss']
+
+        for row in losses.iter_loss_rows(product_qs, 'PRODUCT'):
+            yield [
+                row['date'].strftime("%Y-%m-%d %H:%M"),
+                row['product_name'],
+                row['quantity'],
+                row['unit_price'],
+                row['get_reason_display'],
+                f"{row['loss_amount']:.2f}"
+            ]
+
+        total_product_loss = losses.total_loss(product_qs)
+        yield []
+        yield ['', '', '', '', 'TOTAL PRODUCT LOSS', f"₱{total_product_loss:.2f}"]
+        yield []
+
+        yield ['RAW MATERIALS - EXPIRED & DAMAGED']
+        yield ['Date', 'Raw Material', 'Quantity', 'Price per Unit', 'Reason', 'Financial Loss']
+
+        for row in losses.iter_loss_rows(raw_material_qs, 'RAW_MATERIAL'):
+            yield [
+                row['date'].strftime("%Y-%m-%d %H:%M"),
+                f"{row['material_name']} ({row['unit_name']})",
+                row['quantity'],
+                row['price_per_unit'],
+                row['get_reason_display'],
+                f"{row['loss_amount']:.2f}"
+            ]
+
+        total_raw_material_loss = losses.total_loss(raw_material_qs)
+        yield []
+        yield ['', '', '', '', 'TOTAL RAW MATERIAL LOSS', f"₱{total_raw_material_loss:.2f}"]
+        yield []
+
+        total_loss = total_product_loss + total_raw_material_loss
+        yield ['', '', '', '', 'TOTAL FINANCIAL LOSS', f"₱{total_loss:.2f}"]
+
+    return exports.csv_response(request, rows(), f"financial_loss_{filter_type}.csv", bom=True)
 
 @login_required
 def setup_2fa(request):
@@ -6033,10 +5626,7 @@ class PriceHistoryList(ListView):
         
         search = self.request.GET.get('search')
         if search:
-            qs = qs.filter(
-                Q(product__product_type__name__icontains=search) |
-                Q(product__variant__name__icontains=search)
-            )
+            qs = product_search.filter_queryset(qs, search, "product_id")
         
         return qs.order_by('-changed_at')
     
@@ -6045,3 +5635,59 @@ class PriceHistoryList(ListView):
         context['products'] = Products.objects.all().order_by('product_type__name', 'variant__name')
         context['price_types'] = PriceHistory.PRICE_TYPE_CHOICES
         return context
+
+
+def _capacity_request(params):
+    """``{product_id: units}`` from ``qty_<product_id>`` query parameters."""
+    requested = {}
+    for key, value in params.items():
+        if key.startswith("qty_") and value:
+            try:
+                product_id, units = int(key[4:]), int(Decimal(value))
+            except (ValueError, InvalidOperation):
+                continue
+            if units > 0:
+                requested[product_id] = units
+    return requested
+
+
+@login_required
+@require_GET
+def capacity_api(request):
+    """
+    Max producible units per product from current raw material stock.
+
+    Pass ``qty_<product_id>=<units>`` parameters to get a what-if
+    allocation for those products as well.
+    """
+    result = capacity.capacity()
+    data = {"products": result["products"]}
+    requested = _capacity_request(request.GET)
+    if requested:
+        data["plan"] = capacity.allocate(requested, result)
+    return JsonResponse(data)
+
+
+@require_GET
+def product_search_api(request):
+    """Typeahead: the best matching products for ``?q=``, best first."""
+    try:
+        limit = min(max(int(request.GET.get("limit", product_search.SUGGEST_LIMIT)), 1), 50)
+    except ValueError:
+        limit = product_search.SUGGEST_LIMIT
+    return JsonResponse({"results": product_search.suggest(request.GET.get("q", ""), limit)})
+
+
+class ProductionCapacityView(LoginRequiredMixin, TemplateView):
+    template_name = "production_capacity.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        result = capacity.capacity()
+        requested = _capacity_request(self.request.GET)
+        context['capacity_rows'] = [
+            dict(row, requested=requested.get(row['product_id'], '')) for row in result['products']
+        ]
+        if requested:
+            context['plan'] = capacity.allocate(requested, result)
+        return context